@@ -22,6 +22,8 @@ import vtk
 import sys
 import argparse
 
+import volcache
+
 from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QSlider, QGridLayout, QLabel
 import PyQt5.QtCore as QtCore
 from PyQt5.QtCore import Qt
@@ -31,13 +33,9 @@ GRAD_MAX = 109404           # maximum of gradient magnitude dataset
 
 
 def make(ct_name, gm_name, contourVal, gradmin, gradmax):
-    ct = vtk.vtkXMLImageDataReader()
-    ct.SetFileName(ct_name)
-    ct.Update()
+    ct = volcache.read(ct_name)
 
-    gm = vtk.vtkXMLImageDataReader()
-    gm.SetFileName(gm_name)
-    gm.Update()
+    gm = volcache.read(gm_name)
 
     ctContour = vtk.vtkContourFilter()
     ctContour.SetValue(0, contourVal)
@@ -19,6 +19,8 @@ import vtk
 import sys
 import argparse
 
+import volcache
+
 from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QSlider, QGridLayout, QLabel
 import PyQt5.QtCore as QtCore
 from PyQt5.QtCore import Qt
@@ -37,13 +39,9 @@ def makeBasic(ct_name, gm_name):
     :param ct_name: file name of CT dataset
     :param gm_name: file name of gradient magnitude dataset
     """
-    ct = vtk.vtkXMLImageDataReader()
-    ct.SetFileName(ct_name)
-    ct.Update()
+    ct = volcache.read(ct_name)
 
-    gm = vtk.vtkXMLImageDataReader()
-    gm.SetFileName(gm_name)
-    gm.Update()
+    gm = volcache.read(gm_name)
 
     planeX = vtk.vtkPlane()
     planeX.SetOrigin(0, 0, 0)
@@ -30,6 +30,8 @@ import vtk
 import sys
 import argparse
 
+import volcache
+
 from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QSlider, QGridLayout, QLabel, QPushButton
 import PyQt5.QtCore as QtCore
 from PyQt5.QtCore import Qt
@@ -42,14 +44,10 @@ DEFAULT_PLANE_POS = [0, 0, 0]
 
 def make(ct_name, gm_name, isoValues, colormap_data):
     # read the CT file
-    ct = vtk.vtkXMLImageDataReader()
-    ct.SetFileName(ct_name)
-    ct.Update()
+    ct = volcache.read(ct_name)
 
     # read the gradient magnitude file
-    gm = vtk.vtkXMLImageDataReader()
-    gm.SetFileName(gm_name)
-    gm.Update()
+    gm = volcache.read(gm_name)
     # print(gm.GetOutput().GetPointData().GetArray(0).GetRange())  # Get data range
 
     # extract isosurfaces given contour isovalues
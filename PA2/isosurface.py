@@ -28,6 +28,8 @@ import vtk
 import sys
 import argparse
 
+import volcache
+
 from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QSlider, QGridLayout, QLabel, QPushButton
 import PyQt5.QtCore as QtCore
 from PyQt5.QtCore import Qt
@@ -40,9 +42,7 @@ DEFAULT_PLANE_POS = [0, 0, 0]
 
 def make(ct_name, contourVal, clipX, clipY, clipZ):
     # read the CT image
-    ct = vtk.vtkXMLImageDataReader()
-    ct.SetFileName(ct_name)
-    ct.Update()
+    ct = volcache.read(ct_name)
 
     # the contour filter
     contour = vtk.vtkContourFilter()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+# CS 530
+# Project 2
+
+""" Description:
+Shared loading of the .vti volumes used by the Project 2 tools.
+
+vtkXMLImageDataReader decompresses and parses the whole CT (and gradient
+magnitude) volume every time a tool starts. The first time a volume is read
+here its geometry and point arrays are written as raw NumPy arrays to a
+cache directory keyed by the SHA-256 of the file content, so isosurface.py,
+isogm.py, iso2dtf.py and isocomplete.py, and any copy of the same file,
+share one entry. Later launches memory-map the arrays and wrap them as VTK
+arrays of a vtkImageData without copying.
+
+Content hashes are remembered by path, size and modification time, so an
+unchanged volume is not read again to find its entry.
+
+The cache lives in ~/.cache/cs530/volumes unless VOLUME_CACHE is set.
+
+Command line interface: python volcache.py <data> [<data> ...] [--force]
+    <data>:     .vti volume(s) to convert
+    --force:    rebuild the cache entries even if they exist (optional)
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from cs530.files import content_hash, save_array, save_json
+
+CACHE_VERSION = 1
+
+default_dir = os.environ.get("VOLUME_CACHE",
+                             os.path.join(os.path.expanduser("~"), ".cache", "cs530", "volumes"))
+
+
+class VolumeSource(vtk.vtkTrivialProducer):
+    """
+    Pipeline source of an in-memory volume that, like a reader, has GetOutput()
+    """
+
+    def GetOutput(self):
+        return self.GetOutputDataObject(0)
+
+
+def read_header(path):
+    """
+    Header of a cache entry, or None if the entry is missing or incomplete
+    """
+    try:
+        with open(os.path.join(path, "header.json")) as fd:
+            header = json.load(fd)
+    except (OSError, ValueError):
+        return None
+    return header if header.get("version") == CACHE_VERSION else None
+
+
+def parse(filename):
+    """
+    Parse a .vti file with the XML reader
+    """
+    reader = vtk.vtkXMLImageDataReader()
+    reader.SetFileName(filename)
+    reader.Update()
+    return reader.GetOutput()
+
+
+def convert(path, image):
+    """
+    Write the geometry and all point arrays of a parsed volume to a cache
+    entry
+    """
+    os.makedirs(path, exist_ok=True)
+    arrays = list()
+    pd = image.GetPointData()
+    for i in range(pd.GetNumberOfArrays()):
+        arr = pd.GetArray(i)
+        save_array(os.path.join(path, "array%d.npy" % i), numpy_support.vtk_to_numpy(arr))
+        arrays.append({"name": arr.GetName(),
+                       "file": "array%d.npy" % i,
+                       "type": arr.GetDataType(),
+                       "components": arr.GetNumberOfComponents(),
+                       "attribute": pd.IsArrayAnAttribute(i)})
+
+    matrix = image.GetDirectionMatrix()
+    # the header is written last so an interrupted conversion is never used
+    header = {"version": CACHE_VERSION,
+              "extent": list(image.GetExtent()),
+              "origin": list(image.GetOrigin()),
+              "spacing": list(image.GetSpacing()),
+              "direction": [matrix.GetElement(i, j) for i in range(3) for j in range(3)],
+              "arrays": arrays}
+    save_json(os.path.join(path, "header.json"), header)
+    return header
+
+
+def load(path, header):
+    """
+    Build a volume on top of the memory-mapped arrays of a cache entry
+    """
+    image = vtk.vtkImageData()
+    image.SetExtent(header["extent"])
+    image.SetOrigin(header["origin"])
+    image.SetSpacing(header["spacing"])
+    image.SetDirectionMatrix(header["direction"])
+
+    pd = image.GetPointData()
+    for entry in header["arrays"]:
+        # copy-on-write so VTK can never write through to the cache file
+        data = np.load(os.path.join(path, entry["file"]), mmap_mode='c')
+        arr = numpy_support.numpy_to_vtk(data, array_type=entry["type"])
+        arr.SetName(entry["name"])
+        pd.AddArray(arr)
+        # restore the active scalars the contour and probe filters work on
+        if entry["attribute"] >= 0:
+            pd.SetActiveAttribute(entry["name"], entry["attribute"])
+    return image
+
+
+def read(filename, directory=default_dir, force=False):
+    """
+    Read a .vti volume, going through the shared cache when possible
+    :param directory: cache directory, entries are named by content hash
+    :param force: parse the file and rebuild its entry even if it exists
+    :return: a pipeline source whose output is the vtkImageData
+    """
+    try:
+        path = os.path.join(directory, content_hash(filename, directory))
+    except OSError:
+        path = None
+    header = read_header(path) if path is not None and not force else None
+    if header is not None:
+        image = load(path, header)
+    else:
+        image = parse(filename)
+        if path is not None:
+            try:
+                image = load(path, convert(path, image))
+            except OSError as e:
+                # cache directory not writable, keep using the parsed volume
+                print("-Cannot write cache for " + filename + ": " + str(e))
+
+    source = VolumeSource()
+    source.SetOutput(image)
+    return source
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data', nargs='+')
+    parser.add_argument('--force', action='store_true', help='rebuild existing cache entries')
+    args = parser.parse_args()
+
+    for name in args.data:
+        start = time.perf_counter()
+        image = read(name, force=args.force).GetOutput()
+        print("-%s: %s in %.2f s" % (name, "x".join(str(d) for d in image.GetDimensions()),
+                                     time.perf_counter() - start))
+        print("  * entry: " + os.path.join(default_dir, content_hash(name, default_dir)))
@@ -6,6 +6,8 @@ from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QGridLayout
 from PyQt5.QtCore import Qt
 from vtk.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
 
+from cs530 import streamcache
+
 
 cfd_FileName = "tdelta-low.vtk"     # the CFD file containing the vector field info
 wing_FileName = "tdelta-wing.vtk"   # the geometry of delta wing
@@ -59,6 +61,7 @@ def make():
         rake.SetPoint1(0, 0, 0)
         rake.SetPoint2(0, rakePoints[i], 0)
         rake.SetResolution(20)
+        rake.Update()
         rakeMapper = vtk.vtkPolyDataMapper()
         rakeMapper.SetInputConnection(rake.GetOutputPort())
         rakeActor = vtk.vtkActor()
@@ -73,9 +76,12 @@ def make():
         streamer.SetIntegrationDirectionToForward()
         streamer.SetIntegrator(integ)
         streamer.SetComputeVorticity(True)
+        rakeOutput = rake.GetOutput()
+        seeds = [rakeOutput.GetPoint(j) for j in range(rakeOutput.GetNumberOfPoints())]
+        lines = streamcache.trace(streamer, cfd_FileName, seeds)
 
         scalarSurface = vtk.vtkRuledSurfaceFilter()
-        scalarSurface.SetInputConnection(streamer.GetOutputPort())
+        scalarSurface.SetInputData(lines)
         scalarSurface.SetOffset(0)
         scalarSurface.SetOnRatio(0)
         # scalarSurface.PassLinesOn()
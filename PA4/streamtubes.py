@@ -7,12 +7,17 @@ from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QGridLayout
 from PyQt5.QtCore import Qt
 from vtk.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
 
+from cs530 import streamcache
+
 
 cfd_FileName = "tdelta-low.vtk"     # the CFD file containing the vector field info
 wing_FileName = "tdelta-wing.vtk"   # the geometry of delta wing
 
 origins = [20, 100, 190]
 
+# fixed so the seeds, and with them the cached streamlines, are the same on every launch
+random_seed = 530
+
 def make():
     cfdReader = vtk.vtkStructuredPointsReader()
     cfdReader.SetFileName(cfd_FileName)
@@ -48,10 +53,11 @@ def make():
 
 
     streamerActors = list()
+    rng = random.Random(random_seed)
 
     for _ in range(0, 100):   # 200
-        x = random.uniform(0, 100)
-        y = random.uniform(-50, 50)
+        x = rng.uniform(0, 100)
+        y = rng.uniform(-50, 50)
         z = 10
 
         integ = vtk.vtkRungeKutta4()
@@ -62,9 +68,10 @@ def make():
         streamer.SetIntegrationDirectionToForward()
         streamer.SetIntegrator(integ)
         streamer.SetComputeVorticity(True)
+        lines = streamcache.trace(streamer, cfd_FileName, [(x, y, z)])
 
         streamTube = vtk.vtkTubeFilter()
-        streamTube.SetInputConnection(streamer.GetOutputPort())
+        streamTube.SetInputData(lines)
         streamTube.SetRadius(2)
         streamTube.SetNumberOfSides(10)
         streamTube.SetVaryRadiusToVaryRadiusByVector()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Headless batch sampling of probe lines in the train dataset.
+
+The grid is loaded and the probe locator built once, then the lines are
+probed in parallel by worker processes and streamed in input order to a
+line export file (see lineexport.py). Neither PyQt5 nor a render window is
+involved.
+
+Command line interface: python batch_sample.py <data> <lines> -o <output> [--workers <n>]
+                                               [--samples <n>] [--interpolate] [--float32]
+    <data>:     the train dataset (.vtu)
+    <lines>:    text file with one line per row: x0 y0 z0 x1 y1 z1 [samples],
+                '#' starts a comment
+    <output>:   export file the sampled lines are appended to
+    --workers:  number of worker processes (optional, all cores by default)
+    --samples:  resolution of rows that do not give one (optional, 100 by default)
+"""
+
+import time
+import argparse
+import multiprocessing
+
+import trainio
+import derived
+from probe import ProbeEngine
+from lineexport import LineWriter
+
+
+def read_lines(filename, samples):
+    """
+    Parse the probe line file
+    :return: list of (p0, p1, samples)
+    """
+    lines = list()
+    with open(filename) as fd:
+        for (lineno, row) in enumerate(fd, 1):
+            fields = row.split('#')[0].split()
+            if not fields:
+                continue
+            if len(fields) not in (6, 7):
+                raise ValueError("%s:%d: expected x0 y0 z0 x1 y1 z1 [samples]" % (filename, lineno))
+            values = [float(v) for v in fields[:6]]
+            n = int(fields[6]) if len(fields) == 7 else samples
+            lines.append((tuple(values[:3]), tuple(values[3:]), n))
+    return lines
+
+
+# probe engine of the process, workers inherit it from the parent when forked
+_engine = None
+
+
+def _init_worker(filename, float32, interpolate):
+    global _engine
+    if _engine is None:
+        _engine = make_engine(filename, float32, interpolate)
+
+
+def _sample(args):
+    (p0, p1, n, interpolate) = args
+    return _engine.sample_line(p0, p1, n, interpolate)
+
+
+def make_engine(filename, float32, interpolate):
+    reader = trainio.read(filename, trainio.session_arrays, float32)
+    derived.attach(reader.GetOutput(), ['velocity_magnitude'], filename, float32)
+    engine = ProbeEngine(reader.GetOutput(), 'pressure', 'velocity', 'velocity_magnitude')
+    if interpolate:
+        engine.build_cells()
+    else:
+        engine.build()
+    return engine
+
+
+def run(args):
+    global _engine
+    lines = read_lines(args.lines, args.samples)
+
+    start = time.perf_counter()
+    # forked workers share the grid and the locator built here; elsewhere
+    # every spawned worker loads its own copy in _init_worker
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    if context.get_start_method() == "fork":
+        _engine = make_engine(args.train_file, args.float32, args.interpolate)
+    print("-Setup in %.2f s" % (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    last = start
+    samples = 0
+    tasks = [(p0, p1, n, args.interpolate) for (p0, p1, n) in lines]
+    with LineWriter(args.output) as writer:
+        with context.Pool(args.workers, _init_worker,
+                          (args.train_file, args.float32, args.interpolate)) as pool:
+            for ((p0, p1, n), data) in zip(lines, pool.imap(_sample, tasks, chunksize=4)):
+                writer.write(data, p0=list(p0), p1=list(p1), interpolate=args.interpolate)
+                samples += n
+                now = time.perf_counter()
+                if now - last >= 5:
+                    last = now
+                    elapsed = now - start
+                    print("-%d/%d lines  %.1f lines/s  %.0f samples/s"
+                          % (writer.count, len(lines), writer.count / elapsed, samples / elapsed))
+
+    elapsed = time.perf_counter() - start
+    print("-Sampled %d lines (%d samples) in %.2f s: %.1f lines/s, %.0f samples/s"
+          % (len(lines), samples, elapsed, len(lines) / elapsed, samples / elapsed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    parser.add_argument('lines')
+    parser.add_argument('-o', '--output', required=True)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--samples', type=int, default=100)
+    parser.add_argument('--interpolate', action='store_true')
+    parser.add_argument('--float32', action='store_true')
+    args = parser.parse_args()
+
+    run(args)
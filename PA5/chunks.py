@@ -0,0 +1,721 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Out-of-core access to train datasets too large for memory.
+
+The grid is split into spatial chunks: a regular grid of boxes over the
+dataset bounds, every cell going to the box holding its centroid. Each chunk
+is stored with its own points, cells and point arrays in a directory next
+to the dataset (<data>.chunks/), together with the bounds of its cells. The
+layout is built from the raw cache of trainio.py by memory-mapping it: the
+conversion holds a few chunks in memory, and 12 bytes per cell for the
+chunk of every cell and the cells sorted by chunk. If there is no
+raw cache, the arrays are staged one piece of the .vtu at a time in
+<data>.pieces/ instead (see trainio.convert_pieces()), and removed once
+the chunks are written; a piece must fit in the memory budget.
+
+A ChunkStore pages chunks in on demand, only those whose bounds intersect
+the probe line, the cut plane or the path of a streamline, and keeps them
+in a LRU bounded by a memory budget. Lines and planes go through their
+chunks one at a time, each released before the next is paged in, and the
+partial results are merged, so their cost in memory does not grow with
+their extent. Streamlines are traced in grids made of the few chunks
+around their seeds, copies that count against the budget too. The chunks
+and grids handed out are pinned until they are released: they are never
+evicted, and a request that cannot fit next to them raises MemoryError.
+Hits, misses and evictions are counted per chunk.
+
+The outer surface of the grid is assembled from the surfaces of the chunks
+during the conversion: faces shared by two chunks are internal and dropped.
+
+Command line interface: python chunks.py <data> [--cells <n>] [--memory-mb <n>] [--force]
+    <data>:     the train dataset (.vtu)
+    <n>:        target number of cells per chunk (optional, 200000 by default),
+                memory budget of the store for the test queries (optional)
+    --force:    rebuild the layout even if it is up to date (optional)
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from cs530.streamcache import to_arrays, from_arrays
+
+import trainio
+import tracing
+from probe import ProbeEngine, line_positions
+
+CHUNKS_VERSION = 1
+
+# target number of cells per chunk
+default_cells = 200000
+
+# memory budget of a ChunkStore
+default_bytes = 1 << 30
+
+# cells per block while assigning cells to chunks
+block_size = 1 << 20
+
+
+def chunks_dir(filename):
+    return filename + ".chunks"
+
+
+def read_index(filename):
+    """
+    Index of the chunk layout of a dataset, or None if there is none or it
+    is out of date with respect to the dataset
+    """
+    try:
+        with open(os.path.join(chunks_dir(filename), "index.json")) as fd:
+            index = json.load(fd)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != CHUNKS_VERSION or index.get("source") != trainio.source_stamp(filename):
+        return None
+    return index
+
+
+def cell_gather(offsets, ids):
+    """
+    Offsets of the given cells and the positions of their connectivity
+    entries in the full connectivity array
+    """
+    starts = offsets[ids]
+    sizes = offsets[ids + 1] - starts
+    local = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=local[1:])
+    return local, np.repeat(starts - local[:-1], sizes) + np.arange(local[-1])
+
+
+def outer_faces(grid, ids):
+    """
+    Boundary triangles of a chunk, with global point ids
+    """
+    surface = vtk.vtkDataSetSurfaceFilter()
+    surface.SetInputData(grid)
+    surface.PassThroughPointIdsOn()
+    triangles = vtk.vtkTriangleFilter()
+    triangles.SetInputConnection(surface.GetOutputPort())
+    triangles.PassLinesOff()
+    triangles.PassVertsOff()
+    triangles.Update()
+    out = triangles.GetOutput()
+    if out.GetNumberOfPolys() == 0:
+        return np.zeros((0, 3), dtype=np.int64)
+    local = numpy_support.vtk_to_numpy(out.GetPointData().GetArray("vtkOriginalPointIds"))
+    conn = numpy_support.vtk_to_numpy(out.GetPolys().GetConnectivityArray()).reshape(-1, 3)
+    return ids[local[conn]]
+
+
+def convert(filename, cells=default_cells, max_bytes=default_bytes):
+    """
+    Write the chunk layout of a dataset from its raw cache
+    :param cells: target number of cells per chunk
+    :param max_bytes: memory budget, bounds the pieces of the .vtu parsed
+                      when there is no raw cache yet
+    :return: the index of the layout
+    """
+    header = trainio.read_header(filename)
+    raw = trainio.cache_dir(filename)
+    if header is None:
+        header = trainio.convert_pieces(filename, max_bytes)
+        raw = trainio.pieces_dir(filename)
+
+    def mmap(name):
+        return np.load(os.path.join(raw, name), mmap_mode='r')
+
+    points = mmap("points.npy")
+    offsets = mmap("offsets.npy")
+    connectivity = mmap("connectivity.npy")
+    types = mmap("types.npy")
+    arrays = [mmap(a["file"]) for a in header["arrays"]]
+    nCells = len(types)
+
+    # regular grid of boxes with about `cells` cells each, shaped like the bounds
+    lo = points.min(axis=0).astype(np.float64)
+    hi = points.max(axis=0).astype(np.float64)
+    extent = np.maximum(hi - lo, 1e-9)
+    count = max(1, int(np.ceil(nCells / float(cells))))
+    dims = np.maximum(1, np.round(extent * (count / np.prod(extent)) ** (1.0 / 3))).astype(np.int64)
+
+    # chunk of every cell, by its centroid
+    owner = np.empty(nCells, dtype=np.int32)
+    cellSize = 0.0
+    for start in range(0, nCells, block_size):
+        ids = np.arange(start, min(start + block_size, nCells))
+        local, index = cell_gather(offsets, ids)
+        corners = points[connectivity[index]].astype(np.float64)
+        sums = np.add.reduceat(corners, local[:-1], axis=0)
+        centroids = sums / np.diff(local)[:, None]
+        sizes = np.maximum.reduceat(corners, local[:-1], axis=0) - np.minimum.reduceat(corners, local[:-1], axis=0)
+        cellSize = max(cellSize, float(np.linalg.norm(sizes, axis=1).max()))
+        box = np.clip(((centroids - lo) / extent * dims).astype(np.int64), 0, dims - 1)
+        owner[start:start + len(ids)] = (box[:, 0] * dims[1] + box[:, 1]) * dims[2] + box[:, 2]
+    order = np.argsort(owner, kind='stable')
+    bounds = np.cumsum(np.concatenate([[0], np.bincount(owner, minlength=int(np.prod(dims)))]))
+    del owner
+
+    path = chunks_dir(filename)
+    os.makedirs(path, exist_ok=True)
+    chunks = list()
+    faces = list()
+    for c in range(int(np.prod(dims))):
+        ids = order[bounds[c]:bounds[c + 1]]
+        if not len(ids):
+            continue
+        local, index = cell_gather(offsets, ids)
+        conn = np.asarray(connectivity[index])
+        pointIds = np.unique(conn)
+
+        name = "chunk%05d" % len(chunks)
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+        data = {"points": np.asarray(points[pointIds]),
+                "offsets": local,
+                "connectivity": np.searchsorted(pointIds, conn).astype(np.int64),
+                "types": np.asarray(types[ids]),
+                "ids": pointIds}
+        for (i, values) in enumerate(arrays):
+            data["array%d" % i] = np.asarray(values[pointIds])
+        for (key, values) in data.items():
+            np.save(os.path.join(path, name, key + ".npy"), values)
+
+        chunk = {"name": name,
+                 "bounds": [data["points"].min(axis=0).tolist(), data["points"].max(axis=0).tolist()],
+                 "points": len(pointIds),
+                 "cells": len(ids),
+                 "bytes": sum(v.nbytes for v in data.values())}
+        chunks.append(chunk)
+        faces.append(outer_faces(make_grid([data], header["arrays"][:0]), pointIds))
+
+    # faces of the chunk surfaces found twice are shared by two chunks. Points
+    # on the seams of the pieces of the .vtu are stored once per piece, so
+    # faces and the surface points go by the positions of the points rather than by ids
+    faces = np.concatenate(faces)
+    (ids, inverse) = np.unique(faces, return_inverse=True)
+    (_, single, position) = np.unique(np.asarray(points[ids]), axis=0, return_index=True, return_inverse=True)
+    faces = position.ravel()[inverse].reshape(faces.shape)
+    key = np.sort(faces, axis=1)
+    (_, first, counts) = np.unique(key, axis=0, return_index=True, return_counts=True)
+    outer = faces[np.sort(first[counts == 1])]
+    surfaceIds = np.unique(outer)
+    # one point id per position
+    pointIds = ids[single[surfaceIds]]
+    np.save(os.path.join(path, "surface_points.npy"), np.asarray(points[pointIds]))
+    np.save(os.path.join(path, "surface_triangles.npy"), np.searchsorted(surfaceIds, outer).astype(np.int64))
+    for (i, values) in enumerate(arrays):
+        np.save(os.path.join(path, "surface_array%d.npy" % i), np.asarray(values[pointIds]))
+
+    # the index is written last so an interrupted conversion is never used
+    index = {"version": CHUNKS_VERSION,
+             "source": trainio.source_stamp(filename),
+             "dims": dims.tolist(),
+             "cell_size": cellSize,
+             "arrays": header["arrays"],
+             "chunks": chunks}
+    with open(os.path.join(path, "index.json"), 'w') as fd:
+        json.dump(index, fd, indent=1)
+    del points, offsets, connectivity, types, arrays
+    if raw == trainio.pieces_dir(filename):
+        shutil.rmtree(raw, ignore_errors=True)
+    return index
+
+
+def make_grid(parts, arrays, names=None):
+    """
+    Unstructured grid of one or more loaded chunks
+    :param arrays: array entries of the index
+    :param names: names of the point arrays to attach, all if None
+    """
+    if len(parts) == 1:
+        part = parts[0]
+    else:
+        shift = np.cumsum([0] + [len(p["points"]) for p in parts[:-1]])
+        cshift = np.cumsum([0] + [len(p["connectivity"]) for p in parts[:-1]])
+        part = {"points": np.concatenate([p["points"] for p in parts]),
+                "offsets": np.concatenate([np.zeros(1, dtype=np.int64)] +
+                                          [p["offsets"][1:] + s for (p, s) in zip(parts, cshift)]),
+                "connectivity": np.concatenate([p["connectivity"] + s for (p, s) in zip(parts, shift)]),
+                "types": np.concatenate([p["types"] for p in parts])}
+        for i in range(len(arrays)):
+            part["array%d" % i] = np.concatenate([p["array%d" % i] for p in parts])
+
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(part["points"]))
+    cells = vtk.vtkCellArray()
+    cells.SetData(numpy_support.numpy_to_vtkIdTypeArray(part["offsets"]),
+                  numpy_support.numpy_to_vtkIdTypeArray(part["connectivity"]))
+    grid = vtk.vtkUnstructuredGrid()
+    grid.SetPoints(points)
+    grid.SetCells(numpy_support.numpy_to_vtk(part["types"], array_type=vtk.VTK_UNSIGNED_CHAR), cells)
+    for (i, entry) in enumerate(arrays):
+        if names is not None and entry["name"] not in names:
+            continue
+        arr = numpy_support.numpy_to_vtk(part["array%d" % i])
+        arr.SetName(entry["name"])
+        grid.GetPointData().AddArray(arr)
+        if entry["attribute"] >= 0:
+            grid.GetPointData().SetActiveAttribute(entry["name"], entry["attribute"])
+    return grid
+
+
+class ChunkStore(object):
+    """
+    Chunks of a dataset paged in on demand, and the grids made of them, in a
+    LRU bounded to max_bytes. Every grid returned by grid() is pinned until
+    release() is called with the same chunks.
+    Safe to use from the sampling thread and the main thread at once.
+    """
+
+    def __init__(self, filename, max_bytes, arrays=None):
+        """
+        :param arrays: names of the point arrays to page in, all if None
+        """
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.index = read_index(filename)
+        if self.index is None:
+            raise ValueError("no chunk layout for " + filename + ", convert it with chunks.py")
+        entries = self.index["arrays"]
+        self.arrays = [(i, a) for (i, a) in enumerate(entries) if arrays is None or a["name"] in arrays]
+        self.bounds = np.array([c["bounds"] for c in self.index["chunks"]], dtype=np.float64)
+        # chunk index, or ("grid", chunk indices...) -> [chunk or grid, bytes, pins, {name: object}]
+        self.resident = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.index["chunks"])
+
+    def load(self, c):
+        path = os.path.join(chunks_dir(self.filename), self.index["chunks"][c]["name"])
+
+        def read(name):
+            return np.load(os.path.join(path, name + ".npy"))
+
+        part = dict((key, read(key)) for key in ("points", "offsets", "connectivity", "types"))
+        for (j, (i, _)) in enumerate(self.arrays):
+            part["array%d" % j] = read("array%d" % i)
+        return part
+
+    def fit(self, nbytes):
+        """
+        Evict the least recently used entries that are not pinned until
+        nbytes more fit in the budget. Called with the lock held.
+        """
+        for key in list(self.resident):
+            if self.nbytes + nbytes <= self.max_bytes:
+                break
+            entry = self.resident[key]
+            if entry[2] == 0:
+                del self.resident[key]
+                self.nbytes -= entry[1]
+                self.evictions += 1
+        if self.nbytes + nbytes > self.max_bytes:
+            raise MemoryError("%.1f MB do not fit in the %.1f MB budget of the chunk store next to the %.1f MB "
+                              "in use, raise --memory-mb" % (nbytes / float(1 << 20), self.max_bytes / float(1 << 20),
+                                                             self.nbytes / float(1 << 20)))
+
+    def acquire(self, key, nbytes, make):
+        """
+        Pin an entry, made and added if it is not resident. Called with the
+        lock held.
+        :param nbytes: size of the entry, an upper bound is enough
+        :param make: function returning the entry and its exact size
+        """
+        entry = self.resident.get(key)
+        if entry is None:
+            self.fit(nbytes)
+            (value, size) = make()
+            entry = self.resident[key] = [value, size, 0, dict()]
+            self.nbytes += size
+        self.resident.move_to_end(key)
+        entry[2] += 1
+        return entry[0]
+
+    def chunk(self, c):
+        """
+        Pin a chunk, paged in if it is not resident. Called with the lock held.
+        """
+        if c in self.resident:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        def make():
+            part = self.load(c)
+            return part, sum(v.nbytes for v in part.values())
+
+        # the size in the index counts all point arrays of the chunk
+        return self.acquire(c, self.index["chunks"][c]["bytes"], make)
+
+    def key(self, ids):
+        return ids[0] if len(ids) == 1 else ("grid",) + ids
+
+    def grid(self, ids):
+        """
+        Unstructured grid made of the given chunks, None if there are none.
+        A single chunk is wrapped without a copy, several are copied into one
+        grid. The grid stays pinned until release(ids).
+        """
+        ids = tuple(int(c) for c in ids)
+        if not ids:
+            return None
+        arrays = [a for (_, a) in self.arrays]
+        with self.lock:
+            if len(ids) == 1:
+                return make_grid([self.chunk(ids[0])], arrays)
+            key = self.key(ids)
+            if key in self.resident:
+                self.hits += len(ids)
+                return self.acquire(key, 0, None)
+            # the chunks stay pinned while they are copied
+            parts = list()
+            try:
+                for c in ids:
+                    parts.append(self.chunk(c))
+                nbytes = sum(v.nbytes for part in parts for v in part.values())
+                return self.acquire(key, nbytes, lambda: (make_grid(parts, arrays), nbytes))
+            finally:
+                for c in ids[:len(parts)]:
+                    self.resident[c][2] -= 1
+
+    def extra(self, c, name, make):
+        """
+        Pin a chunk and return an object built from its grid, e.g. a probe
+        engine with its locators. The object is kept with the chunk, without
+        counting against the budget, and goes when the chunk is evicted.
+        Release it with release((c,)).
+        :param make: function of the grid of the chunk returning the object
+        """
+        arrays = [a for (_, a) in self.arrays]
+        with self.lock:
+            part = self.chunk(c)
+            extras = self.resident[c][3]
+            try:
+                if name not in extras:
+                    extras[name] = make(make_grid([part], arrays))
+            except BaseException:
+                self.resident[c][2] -= 1
+                raise
+            return extras[name]
+
+    def release(self, ids):
+        """
+        Unpin a grid returned by grid(), it stays cached until evicted
+        """
+        ids = tuple(int(c) for c in ids)
+        if ids:
+            with self.lock:
+                self.resident[self.key(ids)][2] -= 1
+
+    def touch(self, ids):
+        """
+        Count a use of a pinned grid without paging anything in
+        """
+        ids = tuple(int(c) for c in ids)
+        with self.lock:
+            self.hits += len(ids)
+            self.resident.move_to_end(self.key(ids))
+
+    def containing(self, points, margin=0.0):
+        """
+        Chunks whose bounds contain any of the points
+        """
+        points = np.atleast_2d(points)
+        lo = self.bounds[:, 0] - margin
+        hi = self.bounds[:, 1] + margin
+        inside = ((points[:, None, :] >= lo) & (points[:, None, :] <= hi)).all(axis=2)
+        return np.flatnonzero(inside.any(axis=0))
+
+    def along_segment(self, p0, p1):
+        """
+        Chunks whose bounds intersect the segment p0 p1 (slab test)
+        """
+        p0 = np.asarray(p0, dtype=np.float64)
+        d = np.asarray(p1, dtype=np.float64) - p0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t0 = (self.bounds[:, 0] - p0) / d
+            t1 = (self.bounds[:, 1] - p0) / d
+        near = np.where(np.isnan(t0), -np.inf, np.minimum(t0, t1))
+        far = np.where(np.isnan(t1), np.inf, np.maximum(t0, t1))
+        # axes the segment is parallel to: inside the slab or not at all
+        parallel = (d == 0)
+        outside = (parallel & ((p0 < self.bounds[:, 0]) | (p0 > self.bounds[:, 1]))).any(axis=1)
+        near[:, parallel] = -np.inf
+        far[:, parallel] = np.inf
+        enter = np.maximum(near.max(axis=1), 0.0)
+        leave = np.minimum(far.min(axis=1), 1.0)
+        return np.flatnonzero((enter <= leave) & ~outside)
+
+    def crossing_plane(self, x):
+        """
+        Chunks whose bounds straddle the plane normal to x at x
+        """
+        return np.flatnonzero((self.bounds[:, 0, 0] <= x) & (self.bounds[:, 1, 0] >= x))
+
+    def surface(self):
+        """
+        Outer surface of the whole grid, assembled during the conversion
+        """
+        path = chunks_dir(self.filename)
+        points = vtk.vtkPoints()
+        points.SetData(numpy_support.numpy_to_vtk(np.load(os.path.join(path, "surface_points.npy"))))
+        triangles = np.load(os.path.join(path, "surface_triangles.npy"))
+        polys = vtk.vtkCellArray()
+        polys.SetData(numpy_support.numpy_to_vtkIdTypeArray(np.arange(0, 3 * len(triangles) + 1, 3, dtype=np.int64)),
+                      numpy_support.numpy_to_vtkIdTypeArray(triangles.ravel()))
+        surface = vtk.vtkPolyData()
+        surface.SetPoints(points)
+        surface.SetPolys(polys)
+        for (i, entry) in self.arrays:
+            arr = numpy_support.numpy_to_vtk(np.load(os.path.join(path, "surface_array%d.npy" % i)))
+            arr.SetName(entry["name"])
+            surface.GetPointData().AddArray(arr)
+        return surface
+
+    def stats(self):
+        with self.lock:
+            chunks = sum(1 for key in self.resident if not isinstance(key, tuple))
+            return ("%d hits, %d misses, %d evictions, %d/%d chunks and %d grids resident (%.1f of %.1f MB)"
+                    % (self.hits, self.misses, self.evictions, chunks, len(self), len(self.resident) - chunks,
+                       self.nbytes / float(1 << 20), self.max_bytes / float(1 << 20)))
+
+
+class ChunkedProbe(object):
+    """
+    Line sampling through a ChunkStore, with the interface of ProbeEngine.
+    Only the chunks along the line are paged in, one at a time. Interpolated
+    samples come from the chunk holding their cell, snapped samples from the
+    chunk with the closest vertex.
+    """
+
+    def __init__(self, store, pressure_id, velocity_id):
+        self.store = store
+        self.ids = (pressure_id, velocity_id)
+
+    def engine(self, grid):
+        return ProbeEngine(grid, *self.ids)
+
+    def sample_line(self, p0, p1, step, interpolate=False, progress=None, chunk=4096):
+        locations = line_positions(p0, p1, step)
+        # a line missing the dataset has no samples
+        pressures = np.full(step, np.nan)
+        velocities = np.full(step, np.nan)
+        # distance to the vertex every sample snapped to, and the samples found in a cell
+        distances = np.full(step, np.inf)
+        inside = np.zeros(step, dtype=bool)
+        ids = self.store.along_segment(p0, p1)
+        for (k, c) in enumerate(ids):
+            # the engine and its locators are kept with the chunk in the store
+            engine = self.store.extra(c, ("probe",) + self.ids, self.engine)
+            try:
+                todo = np.flatnonzero(~inside)
+                if interpolate and len(todo):
+                    (pointIds, weights, found) = engine.locate(locations[todo])
+                    hit = todo[found]
+                    pressures[hit], velocities[hit] = engine.values(pointIds[found], weights[found])
+                    inside[hit] = True
+                    todo = todo[~found]
+                if len(todo):
+                    vertices = engine.closest(locations[todo])
+                    d = np.linalg.norm(engine.points[vertices] - locations[todo], axis=1)
+                    closer = d < distances[todo]
+                    todo = todo[closer]
+                    distances[todo] = d[closer]
+                    pressures[todo], velocities[todo] = engine.values(vertices[closer])
+            finally:
+                self.store.release((c,))
+            if progress is not None:
+                progress((k + 1) / float(len(ids)))
+        return [locations, pressures, velocities]
+
+
+class ChunkedSlicer(object):
+    """
+    Plane cuts through a ChunkStore, with the interface of slicing.SliceEngine.
+    Only the chunks straddling the plane are paged in, and cut one at a time.
+    """
+
+    def __init__(self, store, y=-30, z=6713):
+        self.store = store
+        self.plane = vtk.vtkPlane()
+        self.plane.SetNormal(1.0, 0, 0)
+        self.plane.SetOrigin(0, y, z)
+        self.cutter = vtk.vtkCutter()
+        self.cutter.SetCutFunction(self.plane)
+        # the cuts of the chunks, merged
+        self.append = vtk.vtkAppendPolyData()
+        self.visited = 0
+        self.elapsed = 0.0
+
+    def cut(self, x):
+        start = time.perf_counter()
+        self.plane.SetOrigin(x, self.plane.GetOrigin()[1], self.plane.GetOrigin()[2])
+        # the output keeps the last cut until all chunks are cut, also if one does not fit
+        pieces = list()
+        visited = 0
+        for c in self.store.crossing_plane(x):
+            grid = self.store.grid((c,))
+            try:
+                self.cutter.SetInputData(grid)
+                self.cutter.Update()
+                # the cut does not refer to the chunk, which may go once cut
+                piece = vtk.vtkPolyData()
+                piece.ShallowCopy(self.cutter.GetOutput())
+            finally:
+                self.cutter.SetInputData(vtk.vtkUnstructuredGrid())
+                self.store.release((c,))
+            visited += grid.GetNumberOfCells()
+            pieces.append(piece)
+        self.append.RemoveAllInputs()
+        for piece in pieces or [vtk.vtkPolyData()]:
+            self.append.AddInputData(piece)
+        self.append.Update()
+        self.visited = visited
+        self.elapsed = time.perf_counter() - start
+        return self.append.GetOutput()
+
+    def GetOutputPort(self):
+        return self.append.GetOutputPort()
+
+    def GetNumberOfCells(self):
+        return sum(c["cells"] for c in self.store.index["chunks"])
+
+
+def arc_lengths(part):
+    """
+    Length of every polyline of flattened lines
+    """
+    seg = np.linalg.norm(np.diff(part["points"][part["connectivity"]], axis=0), axis=1)
+    # drop the jumps between consecutive polylines
+    starts = part["offsets"][1:-1]
+    seg[starts[starts > 0] - 1] = 0
+    total = np.concatenate([[0.0], np.cumsum(seg)])
+    return total[part["offsets"][1:] - 1] - total[part["offsets"][:-1]]
+
+
+def clip(part, limits):
+    """
+    Cut every polyline of flattened lines to a maximum arc length, the
+    points past it are dropped
+    :param limits: maximum length of every polyline
+    :return: the clipped lines, and a mask of the polylines that were cut
+    """
+    offsets = part["offsets"]
+    conn = part["connectivity"]
+    seg = np.linalg.norm(np.diff(part["points"][conn], axis=0), axis=1)
+    starts = offsets[1:-1]
+    seg[starts[starts > 0] - 1] = 0
+    total = np.concatenate([[0.0], np.cumsum(seg)])
+    # arc length of every point from the start of its polyline
+    line = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    keep = total - total[offsets[:-1]][line] <= np.asarray(limits)[line]
+    cut = np.bincount(line[~keep], minlength=len(offsets) - 1) > 0
+    if not cut.any():
+        return part, cut
+
+    pointIds = np.unique(conn[keep])
+    clipped = dict(part)
+    clipped["points"] = part["points"][pointIds]
+    clipped["connectivity"] = np.searchsorted(pointIds, conn[keep]).astype(np.int64)
+    clipped["offsets"] = np.concatenate([[0], np.cumsum(np.bincount(line[keep], minlength=len(offsets) - 1))])
+    clipped["point_data"] = [(name, values[pointIds]) for (name, values) in part["point_data"]]
+    return clipped, cut
+
+
+def trace(store, positions, max_rounds=100):
+    """
+    Trace streamlines through a ChunkStore. Seeds are traced in the chunks
+    around them; a line leaving the loaded chunks is continued from its end
+    point in the chunks around it, until it ends inside the data, leaves the
+    dataset (no new chunks around its end) or has used up the maximum
+    propagation. The tracer stops within a step, at most a cell, of the
+    boundary of the loaded chunks, so chunks are looked up a cell around
+    every seed. Seeds traced together run to the longest propagation left
+    among them, every line is then cut to its own.
+    :return: polydata holding the pieces of all streamlines
+    """
+    margin = store.index["cell_size"]
+    pending = [(np.asarray(p, dtype=np.float64), float(tracing.max_propagation), ()) for p in positions]
+    pieces = list()
+    for _ in range(max_rounds):
+        # seeds needing the same chunks are traced together
+        groups = dict()
+        for (p, remaining, previous) in pending:
+            ids = tuple(store.containing(p, margin))
+            if not set(ids) <= set(previous):
+                groups.setdefault(ids, []).append((p, remaining))
+        if not groups:
+            break
+        pending = list()
+        for (ids, seeds) in groups.items():
+            source = trainio.GridSource()
+            source.SetOutput(store.grid(ids))
+            try:
+                streamer = tracing.makeStreamer(source)
+                streamer.SetMaximumPropagation(max(r for (_, r) in seeds))
+                streamer.SetSourceData(tracing.makeSeeds([p for (p, _) in seeds]))
+                streamer.Update()
+                lines = streamer.GetOutput()
+            finally:
+                # the lines do not refer to the grid, it may go once traced
+                source.SetOutput(vtk.vtkUnstructuredGrid())
+                store.release(ids)
+            if lines.GetNumberOfLines() == 0:
+                continue
+            reasons = numpy_support.vtk_to_numpy(lines.GetCellData().GetArray("ReasonForTermination"))
+            seedIds = numpy_support.vtk_to_numpy(lines.GetCellData().GetArray("SeedIds"))
+            (part, cut) = clip(to_arrays(lines), np.array([r for (_, r) in seeds])[seedIds])
+            pieces.append(part)
+
+            # continue the lines that left the loaded chunks
+            lengths = arc_lengths(part)
+            for (i, reason) in enumerate(reasons):
+                remaining = seeds[seedIds[i]][1] - lengths[i]
+                if reason != vtk.vtkStreamTracer.OUT_OF_DOMAIN or cut[i] or remaining <= 0:
+                    continue
+                b = part["offsets"][i + 1]
+                pending.append((part["points"][part["connectivity"][b - 1]].astype(np.float64), remaining, ids))
+    return from_arrays(pieces)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    parser.add_argument('--cells', type=int, default=default_cells)
+    parser.add_argument('--memory-mb', type=int, default=default_bytes >> 20)
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+
+    if args.force or read_index(args.train_file) is None:
+        start = time.perf_counter()
+        index = convert(args.train_file, args.cells, args.memory_mb << 20)
+        print("-Chunk layout written to %s in %.2f s: %d chunks"
+              % (chunks_dir(args.train_file), time.perf_counter() - start, len(index["chunks"])))
+
+    store = ChunkStore(args.train_file, args.memory_mb << 20)
+    (lo, hi) = (store.bounds[:, 0].min(axis=0), store.bounds[:, 1].max(axis=0))
+    start = time.perf_counter()
+    ChunkedProbe(store, 'pressure', 'velocity').sample_line(lo, hi, 1000)
+    print("line:    %8.3f s  %s" % (time.perf_counter() - start, store.stats()))
+    start = time.perf_counter()
+    ChunkedSlicer(store).cut((lo[0] + hi[0]) / 2)
+    print("plane:   %8.3f s  %s" % (time.perf_counter() - start, store.stats()))
+    start = time.perf_counter()
+    lines = trace(store, tracing.seed_positions())
+    print("stream:  %8.3f s  %d pieces  %s" % (time.perf_counter() - start, lines.GetNumberOfLines(), store.stats()))
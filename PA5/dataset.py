@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+NumPy views of the train grid.
+
+A TrainData wraps an unstructured grid and exposes its points, cells and
+point arrays (pressure, velocity, Jacobian, derived fields) as NumPy arrays
+sharing memory with the VTK arrays, so sampling, statistics and export work
+on whole arrays without a copy and without crossing into VTK per value.
+The wrapper holds on to every VTK array it made a view of: a view stays
+valid even if the grid later replaces the array (e.g. a derived field
+attached again).
+
+Command line interface: python dataset.py <data>
+    <data>:     the train dataset (.vtu), lists its views and checks they
+                share memory with the VTK arrays
+"""
+
+import argparse
+
+import numpy as np
+from vtk.util import numpy_support
+
+import trainio
+
+
+class TrainData(object):
+    """
+    Zero-copy NumPy views of the geometry and point data of a grid
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+        # name -> (VTK array, view), the VTK array keeps the view's memory alive
+        self.views = dict()
+
+    def view(self, key, arr):
+        if arr is None:
+            return None
+        entry = self.views.get(key)
+        if entry is None or entry[0] is not arr:
+            entry = self.views[key] = (arr, numpy_support.vtk_to_numpy(arr))
+        return entry[1]
+
+    def array(self, name):
+        """
+        A point array by name, None if the grid does not have it
+        """
+        return self.view(name, self.grid.GetPointData().GetArray(name))
+
+    def require(self, name):
+        values = self.array(name)
+        if values is None:
+            raise ValueError("no point array named '" + name + "'")
+        return values
+
+    @property
+    def points(self):
+        return self.view(" points", self.grid.GetPoints().GetData())
+
+    @property
+    def offsets(self):
+        return self.view(" offsets", self.grid.GetCells().GetOffsetsArray())
+
+    @property
+    def connectivity(self):
+        return self.view(" connectivity", self.grid.GetCells().GetConnectivityArray())
+
+    @property
+    def types(self):
+        return self.view(" types", self.grid.GetCellTypesArray())
+
+    @property
+    def pressure(self):
+        return self.require("pressure")
+
+    @property
+    def velocity(self):
+        return self.require("velocity")
+
+    @property
+    def jacobian(self):
+        """
+        The Jacobian as (n, 3, 3) matrices, J[i, j] = d u_i / d x_j, or None
+        if the session did not load it
+        """
+        values = self.array("Jacobian")
+        return values.reshape(-1, 3, 3) if values is not None else None
+
+    @property
+    def velocity_magnitude(self):
+        """
+        The precomputed velocity magnitude (see derived.py), or None
+        """
+        return self.array("velocity_magnitude")
+
+    def speed(self, ids=None):
+        """
+        Velocity magnitude of all points or of some point ids, looked up if
+        it is precomputed and computed from the velocity otherwise
+        """
+        magnitude = self.velocity_magnitude
+        if magnitude is not None:
+            return magnitude if ids is None else magnitude[ids]
+        v = self.velocity if ids is None else self.velocity[ids]
+        return np.sqrt(np.einsum('ij,ij->i', v, v))
+
+    def names(self):
+        pd = self.grid.GetPointData()
+        return [pd.GetArrayName(i) for i in range(pd.GetNumberOfArrays())]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    args = parser.parse_args()
+
+    data = TrainData(trainio.read(args.train_file, None).GetOutput())
+    geometry = ["points", "offsets", "connectivity", "types"]
+    for name in geometry + data.names():
+        if name in geometry:
+            (values, key) = (getattr(data, name), " " + name)
+        else:
+            (values, key) = (data.array(name), name)
+        arr = data.views[key][0]
+        # a view starts at the address of the VTK buffer, e.g. '_00005588a1b2c3d0_p_void'
+        shared = int(arr.GetVoidPointer(0)[1:17], 16) == values.__array_interface__['data'][0]
+        print("%-20s %-16s %-8s %s" % (name, values.shape, values.dtype, "view" if shared else "copy"))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Derived point arrays of the train dataset.
+
+Fields computed from the stored arrays (e.g. the velocity magnitude) are
+computed once for all points with vectorized NumPy code, written to the
+cache directory of the dataset (<data>.cache/derived/) and memory-mapped on
+later launches. They are attached to the grid as ordinary point arrays, so
+probing, tracing and coloring look them up like any stored array.
+
+A field is declared in `fields` by its name, the names of the point arrays
+it is computed from and a function mapping those arrays, in blocks of
+points, to the field values.
+
+Command line interface: python derived.py <data> [--fields <name> ...] [--force]
+    <data>:     the train dataset (.vtu)
+    <name>:     derived fields to compute (optional, all by default)
+    --force:    recompute the fields even if they are cached (optional)
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+from vtk.util import numpy_support
+
+import trainio
+from dataset import TrainData
+
+DERIVED_VERSION = 2
+
+# points per block, bounds the temporaries of the field functions
+block_size = 1 << 20
+
+
+def velocity_magnitude(velocity):
+    return np.sqrt(np.einsum('ij,ij->i', velocity, velocity))
+
+
+def vorticity(jacobian):
+    # rows of the 3x3 Jacobian are the velocity components, columns the
+    # derivatives: J[i, j] = d u_i / d x_j, as written by vtkGradientFilter
+    J = jacobian.reshape(-1, 3, 3)
+    return np.stack([J[:, 2, 1] - J[:, 1, 2],
+                     J[:, 0, 2] - J[:, 2, 0],
+                     J[:, 1, 0] - J[:, 0, 1]], axis=1)
+
+
+# derived fields: name -> (names of the input point arrays, function)
+fields = {"velocity_magnitude": (["velocity"], velocity_magnitude),
+          "vorticity": (["Jacobian"], vorticity)}
+
+
+def derived_dir(filename):
+    return os.path.join(trainio.cache_dir(filename), "derived")
+
+
+def read_index(filename):
+    """
+    Index of the cached fields of a dataset, empty if there are none or they
+    are out of date with respect to the dataset
+    """
+    try:
+        with open(os.path.join(derived_dir(filename), "index.json")) as fd:
+            index = json.load(fd)
+    except (OSError, ValueError):
+        return dict()
+    if index.get("version") != DERIVED_VERSION or index.get("source") != trainio.source_stamp(filename):
+        return dict()
+    return index["fields"]
+
+
+def write_index(filename, entries):
+    index = {"version": DERIVED_VERSION,
+             "source": trainio.source_stamp(filename),
+             "fields": entries}
+    trainio.save_json(os.path.join(derived_dir(filename), "index.json"), index)
+
+
+def inputs(filename, grid, names):
+    """
+    Input arrays of a field: point arrays of the grid, or arrays of the raw
+    dataset cache that the session did not load (e.g. the Jacobian)
+    """
+    header = trainio.read_header(filename) if filename is not None else None
+    entries = dict((a["name"], a) for a in header["arrays"]) if header is not None else dict()
+    data = TrainData(grid)
+    arrays = list()
+    for name in names:
+        if data.array(name) is not None:
+            arrays.append(data.array(name))
+        elif name in entries:
+            arrays.append(np.load(os.path.join(trainio.cache_dir(filename), entries[name]["file"]),
+                                  mmap_mode='r'))
+        else:
+            raise ValueError("no point array named '" + name + "' to derive from")
+    return arrays
+
+
+def compute(name, arrays, out=None):
+    """
+    Evaluate a field block by block
+    :param arrays: input arrays of the field
+    :param out: array receiving the values, allocated if None
+    """
+    function = fields[name][1]
+    n = len(arrays[0])
+    for start in range(0, n, block_size):
+        values = function(*[a[start:start + block_size] for a in arrays])
+        if out is None:
+            out = np.empty((n,) + values.shape[1:], dtype=values.dtype)
+        out[start:start + len(values)] = values
+    return out
+
+
+def attach(grid, names, filename=None, float32=False, force=False):
+    """
+    Add derived fields to the point data of a grid
+    :param names: names of the fields, see fields
+    :param filename: dataset file of the grid, enables the on-disk cache
+    :param float32: attach single precision values
+    :param force: recompute cached fields
+    :return: list of (name, whether it came from the cache)
+    """
+    cached = read_index(filename) if filename is not None and not force else dict()
+    entries = dict(cached)
+    path = derived_dir(filename) if filename is not None else None
+    report = list()
+    for name in names:
+        if name not in fields:
+            raise ValueError("unknown derived field '" + name + "'")
+        arrays = inputs(filename, grid, fields[name][0])
+        # values computed from float32 and float64 inputs are cached apart
+        key = name + "." + "-".join(str(a.dtype) for a in arrays)
+        hit = key in cached and cached[key]["inputs"] == fields[name][0]
+        if hit:
+            values = np.load(os.path.join(path, cached[key]["file"]), mmap_mode='c')
+        else:
+            values = compute(name, arrays)
+            if filename is not None:
+                try:
+                    os.makedirs(path, exist_ok=True)
+                    trainio.save_array(os.path.join(path, key + ".npy"), values)
+                    entries[key] = {"inputs": fields[name][0], "file": key + ".npy"}
+                    write_index(filename, entries)
+                except OSError as e:
+                    print("-Cannot write derived field cache for " + filename + ": " + str(e))
+        if float32 and values.dtype == np.float64:
+            values = values.astype(np.float32)
+        arr = numpy_support.numpy_to_vtk(values)
+        arr.SetName(name)
+        grid.GetPointData().AddArray(arr)
+        report.append((name, hit))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    parser.add_argument('--fields', nargs='+', choices=sorted(fields), default=sorted(fields))
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+
+    grid = trainio.read(args.train_file).GetOutput()
+    for name in args.fields:
+        start = time.perf_counter()
+        [(_, hit)] = attach(grid, [name], args.train_file, force=args.force)
+        arr = grid.GetPointData().GetArray(name)
+        print("%-20s %8.3f s  %d comp  %s" % (name, time.perf_counter() - start, arr.GetNumberOfComponents(),
+                                             "cached" if hit else "computed"))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Binary export of sampled lines.
+
+A file holds any number of sampled lines and can be appended to. It starts
+with an 8 byte magic, followed by one record per line:
+
+    uint32 (little endian)  length of the JSON record header
+    JSON record header      {"samples": n, "columns": [[name, dtype, components], ...], ...}
+    raw column data         one little endian array per column, in header order
+
+Lines are written as soon as they are sampled, so batches of thousands of
+lines never have to be held in memory, and reading maps the column data
+without parsing it.
+
+Command line interface: python lineexport.py <file>
+    <file>:     exported file to summarize
+"""
+
+import os
+import json
+import struct
+import argparse
+
+import numpy as np
+
+MAGIC = b"TRAINLN1"
+
+# columns of a sampled line: location (x, y, z), pressure, velocity magnitude
+columns = [("location", 3), ("pressure", 1), ("velocity", 1)]
+
+
+class LineWriter(object):
+    """
+    Streaming writer appending sampled lines to an export file
+    """
+
+    def __init__(self, filename, dtype=np.float64):
+        self.filename = filename
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        new = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        if not new:
+            # never append records to a file that is not an export file
+            with open(filename, 'rb') as fd:
+                if fd.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(filename + " is not a line export file")
+        self.fd = open(filename, 'ab')
+        if new:
+            self.fd.write(MAGIC)
+        self.count = 0
+
+    def write(self, data, **meta):
+        """
+        Append one sampled line
+        :param data: [locations, pressures, velocities] as returned by the probe
+        :param meta: extra JSON values stored with the line (e.g. p0, p1)
+        """
+        arrays = [np.ascontiguousarray(a, dtype=self.dtype) for a in data]
+        n = len(arrays[1])
+        # checked before anything is written, a bad line must not leave a partial record
+        for (a, (name, comps)) in zip(arrays, columns):
+            if a.size != n * comps:
+                raise ValueError("size of column '" + name + "' does not match the number of samples")
+        header = dict(meta)
+        header["samples"] = n
+        header["columns"] = [[name, self.dtype.str, comps] for (name, comps) in columns]
+        raw = json.dumps(header).encode()
+
+        self.fd.write(struct.pack('<I', len(raw)))
+        self.fd.write(raw)
+        for a in arrays:
+            # the array buffer is written as is, without a bytes copy
+            self.fd.write(memoryview(a).cast('B'))
+        self.count += 1
+
+    def flush(self):
+        self.fd.flush()
+
+    def close(self):
+        self.fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_lines(filename):
+    """
+    Iterate over the lines of an export file. The column arrays are
+    memory-mapped views into the file.
+    :return: generator of (header, {column name: array})
+    """
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError(filename + " is not a line export file")
+    pos = len(MAGIC)
+    while pos < len(data):
+        (size,) = struct.unpack('<I', bytes(data[pos:pos + 4]))
+        header = json.loads(bytes(data[pos + 4:pos + 4 + size]).decode())
+        pos += 4 + size
+        n = header["samples"]
+        arrays = dict()
+        for (name, dtype, comps) in header["columns"]:
+            dtype = np.dtype(dtype)
+            nbytes = n * comps * dtype.itemsize
+            arr = data[pos:pos + nbytes].view(dtype)
+            arrays[name] = arr.reshape(n, comps) if comps > 1 else arr
+            pos += nbytes
+        yield header, arrays
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file')
+    args = parser.parse_args()
+
+    total = 0
+    for (i, (header, arrays)) in enumerate(read_lines(args.file)):
+        total += header["samples"]
+        print("%6d  %8d samples  p0=%s p1=%s" % (i, header["samples"], header.get("p0"), header.get("p1")))
+    print("total: %d samples" % total)
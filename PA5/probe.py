@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Batch probing of the train dataset.
+
+The probe engine builds its spatial indices once per loaded dataset and
+answers a whole line of sample positions in one call, returning NumPy
+arrays instead of per-sample Python lists. Samples either snap to the
+nearest mesh vertex or are interpolated within the containing cell.
+
+Command line interface: python probe.py <data> [--samples <n> ...]
+    <data>:     the train dataset (.vtu)
+    <n>:        line resolutions to benchmark (optional)
+"""
+
+import argparse
+import time
+
+import numpy as np
+import vtk
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+from dataset import TrainData
+
+
+def line_positions(p0, p1, step):
+    """
+    Sample positions along a line, matching the spacing used by the viewer
+    :param p0: starting point
+    :param p1: ending point
+    :param step: number of samples, p1 itself is not included
+    :return: (step, 3) array of positions
+    """
+    p0 = np.asarray(p0, dtype=np.float64)
+    p1 = np.asarray(p1, dtype=np.float64)
+    t = np.arange(step, dtype=np.float64) / step
+    return p0 + np.outer(t, p1 - p0)
+
+
+class ProbeEngine(object):
+    """
+    Probe over the point data of a dataset.
+    The KD-tree and cell locator are built lazily on the first query that
+    needs them and then reused.
+    """
+
+    def __init__(self, dataset, pressure_id, velocity_id, magnitude_id=None):
+        # zero-copy views of the point data, see dataset.py
+        self.data = data = TrainData(dataset)
+        self.dataset = dataset
+        self.points = data.points
+        self.pressure = data.require(pressure_id)
+        self.velocity = data.require(velocity_id)
+        # precomputed velocity magnitude (see derived.py), if the dataset has it
+        self.magnitude = data.array(magnitude_id) if magnitude_id is not None else None
+        self._tree = None
+        self._locator = None
+        self._cellLocator = None
+        self._cell = vtk.vtkGenericCell()
+
+    def build(self):
+        if cKDTree is not None:
+            if self._tree is None:
+                self._tree = cKDTree(self.points)
+        elif self._locator is None:
+            # no scipy: fall back to VTK's static locator, queried point by point
+            self._locator = vtk.vtkStaticPointLocator()
+            self._locator.SetDataSet(self.dataset)
+            self._locator.BuildLocator()
+
+    def closest(self, positions):
+        """
+        Ids of the mesh vertices closest to each position
+        """
+        self.build()
+        if self._tree is not None:
+            _, ids = self._tree.query(positions)
+            return ids
+        find = self._locator.FindClosestPoint
+        return np.fromiter((find(x, y, z) for (x, y, z) in positions),
+                           dtype=np.int64, count=len(positions))
+
+    def build_cells(self):
+        if self._cellLocator is None:
+            self._cellLocator = vtk.vtkStaticCellLocator()
+            self._cellLocator.SetDataSet(self.dataset)
+            self._cellLocator.BuildLocator()
+
+    def locate(self, positions):
+        """
+        Find the containing cell of each position. Consecutive samples along
+        a line mostly stay in the same cell, so the last cell found is tested
+        first and the locator is only searched when it misses.
+        :param positions: (n, 3) array of sample positions
+        :return: (n, m) point ids and interpolation weights of the containing
+                 cells, and a mask of the positions that lie inside the grid
+        """
+        self.build_cells()
+        n = len(positions)
+        m = self.dataset.GetMaxCellSize()
+        ids = np.zeros((n, m), dtype=np.int64)
+        weights = np.zeros((n, m))
+        inside = np.zeros(n, dtype=bool)
+
+        cell = self._cell
+        closest = [0.0, 0.0, 0.0]
+        pcoords = [0.0, 0.0, 0.0]
+        w = [0.0] * m
+        subId = vtk.reference(0)
+        dist2 = vtk.reference(0.0)
+        last = -1
+        for i in range(n):
+            x = tuple(positions[i])
+            if last >= 0:
+                self.dataset.GetCell(last, cell)
+                if cell.EvaluatePosition(x, closest, subId, pcoords, dist2, w) != 1:
+                    last = -1
+            if last < 0:
+                last = self._cellLocator.FindCell(x, 0.0, cell, pcoords, w)
+                if last < 0:
+                    continue
+            ptIds = cell.GetPointIds()
+            for j in range(cell.GetNumberOfPoints()):
+                ids[i, j] = ptIds.GetId(j)
+                weights[i, j] = w[j]
+            inside[i] = True
+        return ids, weights, inside
+
+    def values(self, ids, weights=None):
+        """
+        Pressure and velocity magnitude at mesh vertices
+        :param ids: (n,) vertex ids, or (n, m) point ids of containing cells
+        :param weights: (n, m) interpolation weights of the cell points, see
+                        locate(), None to look the vertices up
+        """
+        if weights is None:
+            if self.magnitude is not None:
+                return self.pressure[ids], self.magnitude[ids]
+            return self.pressure[ids], self.data.speed(ids)
+        pressures = np.einsum('ij,ij->i', weights, self.pressure[ids])
+        v = np.einsum('ij,ijk->ik', weights, self.velocity[ids])
+        return pressures, np.sqrt(np.einsum('ij,ij->i', v, v))
+
+    def probe(self, positions, interpolate=False):
+        """
+        Sample pressure and velocity magnitude at a batch of positions
+        :param positions: (n, 3) array of sample positions
+        :param interpolate: interpolate within the containing cell instead of
+                            snapping to the nearest vertex. Positions outside
+                            the grid (e.g. inside the train body) still snap.
+        :return: pressure and velocity magnitude arrays of length n
+        """
+        if not interpolate:
+            return self.values(self.closest(positions))
+
+        ids, weights, inside = self.locate(positions)
+        pressures, velocities = self.values(ids, weights)
+        if not inside.all():
+            outside = ~inside
+            pressures[outside], velocities[outside] = self.probe(positions[outside])
+        return pressures, velocities
+
+    def sample_line(self, p0, p1, step, interpolate=False, progress=None, chunk=4096):
+        """
+        Sample pressure and velocity magnitude along a line
+        :param progress: called with the fraction of samples done after every
+                         chunk of samples (optional)
+        :return: three arrays storing location, pressure and velocity
+                 magnitude data
+        """
+        locations = line_positions(p0, p1, step)
+        if progress is None:
+            pressures, velocities = self.probe(locations, interpolate)
+            return [locations, pressures, velocities]
+
+        pressures = np.empty(step)
+        velocities = np.empty(step)
+        for start in range(0, step, chunk):
+            end = min(start + chunk, step)
+            pressures[start:end], velocities[start:end] = self.probe(locations[start:end], interpolate)
+            progress(end / float(step))
+        return [locations, pressures, velocities]
+
+
+def benchmark(engine, p0, p1, resolutions):
+    """
+    Compare the cost per sample of nearest-vertex and interpolated probing.
+    Locators are built before timing so only the queries are measured.
+    """
+    engine.build()
+    engine.build_cells()
+    for step in resolutions:
+        for interpolate in (False, True):
+            start = time.perf_counter()
+            engine.sample_line(p0, p1, step, interpolate)
+            elapsed = time.perf_counter() - start
+            print("%-12s %8d samples  %10.3f ms  %8.3f us/sample"
+                  % ("interpolated" if interpolate else "nearest", step,
+                     elapsed * 1e3, elapsed * 1e6 / step))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    parser.add_argument('--samples', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    args = parser.parse_args()
+
+    reader = vtk.vtkXMLUnstructuredGridReader()
+    reader.SetFileName(args.train_file)
+    reader.Update()
+    dataset = reader.GetOutput()
+
+    (xmin, xmax, ymin, ymax, zmin, zmax) = dataset.GetBounds()
+    benchmark(ProbeEngine(dataset, 0, 1), (xmin, ymin, zmin), (xmax, ymax, zmax), args.samples)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Named probe lines of the train viewer.
+
+Every line keeps the samples of its last probe together with the settings
+(endpoints, resolution, interpolation) they were taken with, so only lines
+whose settings changed since are probed again. All lines are drawn by a
+single actor: one polydata holding a line cell per probe line, colored per
+cell with the line's chart color.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+# chart and line colors, cycled through by the lines in creation order
+palette = [(166, 101, 174),
+           (230, 54, 56),
+           (55, 126, 184),
+           (77, 175, 74),
+           (255, 127, 0),
+           (166, 86, 40),
+           (247, 129, 191),
+           (51, 51, 51)]
+
+
+class ProbeLine(object):
+    """
+    A named probe line and its latest samples
+    """
+
+    def __init__(self, name, p0, p1, resolution, color):
+        self.name = name
+        self.p0 = tuple(p0)
+        self.p1 = tuple(p1)
+        self.resolution = resolution
+        self.color = color
+        self.samples = None
+        # settings the samples were taken with
+        self.sampled = None
+
+    def settings(self, interpolate):
+        return (self.p0, self.p1, self.resolution, interpolate)
+
+    def stale(self, interpolate):
+        return self.samples is None or self.sampled != self.settings(interpolate)
+
+
+class ProbeLines(object):
+    """
+    Named probe lines, in creation order, drawn by one actor
+    """
+
+    def __init__(self):
+        self.lines = OrderedDict()
+        self.created = 0
+
+        self.polydata = vtk.vtkPolyData()
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(self.polydata)
+        mapper.SetScalarModeToUseCellData()
+        self.actor = vtk.vtkActor()
+        self.actor.SetMapper(mapper)
+        self.actor.GetProperty().SetLineWidth(4)
+
+    def set(self, name, p0, p1, resolution):
+        """
+        Create a line or move an existing one. Its samples are kept until
+        they are found stale.
+        :return: the line
+        """
+        line = self.lines.get(name)
+        if line is None:
+            line = ProbeLine(name, p0, p1, resolution, palette[self.created % len(palette)])
+            self.lines[name] = line
+            self.created += 1
+        else:
+            (line.p0, line.p1, line.resolution) = (tuple(p0), tuple(p1), resolution)
+        self.update()
+        return line
+
+    def remove(self, name):
+        del self.lines[name]
+        self.update()
+
+    def stale(self, interpolate):
+        """
+        Lines without samples for their current settings
+        """
+        return [line for line in self.lines.values() if line.stale(interpolate)]
+
+    def update(self):
+        """
+        Rebuild the polydata drawing the lines
+        """
+        n = len(self.lines)
+        self.buffers = {"points": np.array([p for line in self.lines.values() for p in (line.p0, line.p1)],
+                                           dtype=np.float64).reshape(2 * n, 3),
+                        "offsets": np.arange(0, 2 * n + 1, 2, dtype=np.int64),
+                        "connectivity": np.arange(2 * n, dtype=np.int64),
+                        "colors": np.array([line.color for line in self.lines.values()],
+                                           dtype=np.uint8).reshape(n, 3)}
+
+        points = vtk.vtkPoints()
+        points.SetData(numpy_support.numpy_to_vtk(self.buffers["points"]))
+        cells = vtk.vtkCellArray()
+        cells.SetData(numpy_support.numpy_to_vtkIdTypeArray(self.buffers["offsets"]),
+                      numpy_support.numpy_to_vtkIdTypeArray(self.buffers["connectivity"]))
+        colors = numpy_support.numpy_to_vtk(self.buffers["colors"])
+        colors.SetName("colors")
+
+        self.polydata.SetPoints(points)
+        self.polydata.SetLines(cells)
+        self.polydata.GetCellData().SetScalars(colors)
+        self.polydata.Modified()
+
+    def __getitem__(self, name):
+        return self.lines[name]
+
+    def __contains__(self, name):
+        return name in self.lines
+
+    def __iter__(self):
+        return iter(self.lines.values())
+
+    def __len__(self):
+        return len(self.lines)
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Streaming statistics of pressure and velocity magnitude.
+
+Values are reduced in a single pass, block by block, so the whole grid is
+summarized straight from the memory-mapped raw cache without temporaries
+the size of the grid:
+- count, min, max, mean and variance are merged block by block with the
+  pairwise form of Welford's update (Chan et al.);
+- percentiles and histograms come from a fine histogram whose range grows
+  by doubling its bin width whenever a block falls outside of it, so it
+  needs no first pass to find the range. Percentiles are exact to one fine
+  bin, 1/2048 of the value range at worst with the default 4096 bins.
+
+Partial summaries merge, so blocks of points can be reduced by worker
+processes. Summaries of the whole grid are cached next to the dataset
+(<data>.cache/statistics.json), those of lines and plane cuts for the
+session.
+
+Command line interface: python regionstats.py <data> [--workers <n>] [--force]
+    <data>:     the train dataset (.vtu)
+    <n>:        number of worker processes (optional, 1 by default)
+    --force:    recompute the statistics even if they are cached (optional)
+"""
+
+import os
+import json
+import time
+import argparse
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import trainio
+from dataset import TrainData
+
+STATISTICS_VERSION = 1
+
+# values per block of the reductions
+block_size = 1 << 20
+
+# bins of the fine histogram behind percentiles and histograms, even
+histogram_bins = 4096
+
+# percentiles reported
+percentiles = [1, 5, 25, 50, 75, 95, 99]
+
+# summarized fields, velocity as its magnitude
+fields = ["pressure", "velocity"]
+
+
+class Histogram(object):
+    """
+    Fixed number of bins over a range that doubles as values fall outside it
+    """
+
+    def __init__(self, bins=histogram_bins):
+        self.bins = bins
+        self.lo = None
+        self.width = None
+        self.counts = None
+
+    def cover(self, lo, hi):
+        if self.counts is None:
+            self.lo = lo
+            self.width = (hi - lo) / (self.bins - 1) if hi > lo else max(abs(lo), 1.0) * 1e-6
+            self.counts = np.zeros(self.bins, dtype=np.int64)
+            return
+        while lo < self.lo or hi >= self.lo + self.bins * self.width:
+            # pairs of bins merge into one, the old range becomes half of the new one
+            pairs = self.counts.reshape(-1, 2).sum(axis=1)
+            self.counts = np.zeros(self.bins, dtype=np.int64)
+            if lo < self.lo:
+                self.counts[self.bins // 2:] = pairs
+                self.lo -= self.bins * self.width
+            else:
+                self.counts[:self.bins // 2] = pairs
+            self.width *= 2
+
+    def add(self, values, weights=None):
+        if not len(values):
+            return
+        self.cover(float(values.min()), float(values.max()))
+        ids = np.clip(((values - self.lo) / self.width).astype(np.int64), 0, self.bins - 1)
+        counts = np.bincount(ids, weights, minlength=self.bins)
+        self.counts += np.rint(counts).astype(np.int64) if weights is not None else counts
+
+    def merge(self, other):
+        if other.counts is None:
+            return
+        # the other histogram's bins are added at their centers
+        used = np.flatnonzero(other.counts)
+        self.add(other.lo + (used + 0.5) * other.width, other.counts[used])
+
+    def edges(self):
+        return self.lo + np.arange(self.bins + 1) * self.width
+
+
+class Summary(object):
+    """
+    One-pass statistics of a stream of values
+    """
+
+    def __init__(self, bins=histogram_bins):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.histogram = Histogram(bins)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        n = len(values)
+        if not n:
+            return
+        mean = values.mean()
+        block = Summary.__new__(Summary)
+        (block.count, block.mean, block.m2) = (n, mean, float(np.square(values - mean).sum()))
+        self.merge_moments(block)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.histogram.add(values)
+
+    def merge_moments(self, other):
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / n
+        self.m2 += other.m2 + delta * delta * self.count * other.count / n
+        self.count = n
+
+    def merge(self, other):
+        if not other.count:
+            return
+        self.merge_moments(other)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.histogram.merge(other.histogram)
+
+    def std(self):
+        return np.sqrt(self.m2 / self.count) if self.count else np.nan
+
+    def percentile(self, q):
+        if not self.count:
+            return np.nan
+        counts = self.histogram.counts
+        cdf = np.cumsum(counts)
+        rank = q / 100.0 * cdf[-1]
+        i = min(int(np.searchsorted(cdf, rank)), len(counts) - 1)
+        before = cdf[i - 1] if i > 0 else 0
+        fraction = (rank - before) / counts[i] if counts[i] else 0.0
+        value = self.histogram.lo + (i + fraction) * self.histogram.width
+        return float(np.clip(value, self.min, self.max))
+
+    def report(self, bins=10):
+        """
+        Plain values of the statistics, with a histogram of `bins` bins
+        between min and max
+        """
+        report = {"count": self.count, "min": self.min, "max": self.max,
+                  "mean": self.mean, "std": float(self.std()),
+                  "percentiles": [[q, self.percentile(q)] for q in percentiles]}
+        if self.count:
+            h = self.histogram
+            centers = h.edges()[:-1] + 0.5 * h.width
+            edges = np.linspace(self.min, self.max, bins + 1) if self.max > self.min else \
+                np.array([self.min, self.min + h.width])
+            (counts, _) = np.histogram(np.clip(centers, edges[0], edges[-1]), edges, weights=h.counts)
+            report["histogram"] = [edges.tolist(), np.rint(counts).astype(np.int64).tolist()]
+        return report
+
+
+def summarize(arrays, start=0, end=None):
+    """
+    Summaries of some arrays, reduced block by block
+    :param arrays: dict of field name -> array, (n, 3) vectors are reduced
+                   as their magnitude
+    :param start, end: range of values to reduce, all by default
+    :return: dict of field name -> Summary
+    """
+    summaries = dict()
+    for (name, values) in arrays.items():
+        summary = Summary()
+        stop = len(values) if end is None else end
+        for s in range(start, stop, block_size):
+            block = np.asarray(values[s:min(s + block_size, stop)])
+            if block.ndim > 1:
+                block = np.sqrt(np.einsum('ij,ij->i', block, block))
+            summary.update(block)
+        summaries[name] = summary
+    return summaries
+
+
+def grid_arrays(filename=None, grid=None):
+    """
+    The summarized point arrays of the whole grid, memory-mapped from the
+    raw cache of the dataset when there is one
+    """
+    header = trainio.read_header(filename) if filename is not None else None
+    if header is not None:
+        entries = dict((a["name"], a) for a in header["arrays"])
+        return dict((name, np.load(os.path.join(trainio.cache_dir(filename), entries[name]["file"]),
+                                   mmap_mode='r'))
+                    for name in fields if name in entries)
+    if grid is None:
+        raise ValueError("the grid is not loaded and has no raw cache, write it with trainio.py")
+    data = TrainData(grid)
+    return dict((name, data.require(name)) for name in fields)
+
+
+# arrays of a worker process, mapped once by _init_worker
+_arrays = None
+
+
+def _init_worker(filename):
+    global _arrays
+    _arrays = grid_arrays(filename)
+
+
+def _summarize_range(bounds):
+    return summarize(_arrays, *bounds)
+
+
+def summarize_parallel(filename, workers, grid=None):
+    """
+    Summaries of the whole grid, reduced in blocks of points by a pool of
+    worker processes mapping the raw cache
+    :param grid: the loaded grid, summarized in this process if there is no
+                 raw cache for the workers to map
+    """
+    if trainio.read_header(filename) is None:
+        return summarize(grid_arrays(None, grid))
+    n = len(next(iter(grid_arrays(filename).values())))
+    step = max(block_size, -(-n // workers))
+    ranges = [(s, min(s + step, n)) for s in range(0, n, step)]
+    # spawn rather than fork: the parent may already hold a GUI and a GL context
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(ranges), mp_context=context,
+                             initializer=_init_worker, initargs=(filename,)) as pool:
+        parts = list(pool.map(_summarize_range, ranges))
+    summaries = parts[0]
+    for part in parts[1:]:
+        for (name, summary) in part.items():
+            summaries[name].merge(summary)
+    return summaries
+
+
+class StatisticsCache(object):
+    """
+    Reports per region: the whole grid on disk next to the dataset, lines
+    and plane cuts in memory for the session
+    """
+
+    def __init__(self, filename=None, max_entries=64):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def path(self):
+        return os.path.join(trainio.cache_dir(self.filename), "statistics.json")
+
+    def get(self, key):
+        report = self.entries.get(key)
+        if report is not None:
+            self.entries.move_to_end(key)
+        elif key == ("grid",) and self.filename is not None:
+            try:
+                with open(self.path()) as fd:
+                    stored = json.load(fd)
+            except (OSError, ValueError):
+                return None
+            if stored.get("version") == STATISTICS_VERSION and \
+                    stored.get("source") == trainio.source_stamp(self.filename):
+                report = self.entries[key] = stored["grid"]
+        return report
+
+    def put(self, key, report):
+        self.entries[key] = report
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        if key == ("grid",) and self.filename is not None:
+            stored = {"version": STATISTICS_VERSION,
+                      "source": trainio.source_stamp(self.filename),
+                      "grid": report}
+            try:
+                trainio.save_json(self.path(), stored)
+            except OSError as e:
+                print("-Cannot write statistics cache for " + self.filename + ": " + str(e))
+
+
+def format_report(report, width=30):
+    """
+    Log lines of the reports of a region
+    :param report: dict of field name -> Summary.report()
+    :return: list of report lines
+    """
+    lines = list()
+    for (name, r) in report.items():
+        if not r["count"]:
+            lines.append("  * %s: no values" % name)
+            continue
+        lines.append("  * %s: %d values, min %.6g, max %.6g, mean %.6g, std %.6g"
+                     % (name, r["count"], r["min"], r["max"], r["mean"], r["std"]))
+        lines.append("    " + ", ".join("p%d %.6g" % (q, v) for (q, v) in r["percentiles"]))
+        (edges, counts) = r["histogram"]
+        top = max(max(counts), 1)
+        for (lo, hi, count) in zip(edges[:-1], edges[1:], counts):
+            lines.append("    [%10.4g, %10.4g) %9d %s" % (lo, hi, count, "#" * int(round(width * count / top))))
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+
+    cache = StatisticsCache(args.train_file)
+    start = time.perf_counter()
+    report = None if args.force else cache.get(("grid",))
+    if report is None:
+        grid = trainio.read(args.train_file).GetOutput()
+        if args.workers > 1:
+            summaries = summarize_parallel(args.train_file, args.workers, grid)
+        else:
+            summaries = summarize(grid_arrays(args.train_file, grid))
+        report = dict((name, s.report()) for (name, s) in summaries.items())
+        cache.put(("grid",), report)
+    print("-Statistics of the grid in %.1f ms" % ((time.perf_counter() - start) * 1000))
+    for line in format_report(report):
+        print(line)
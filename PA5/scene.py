@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Scene of the train viewer: color maps, data constants and the builders of
+the train surface, plane cut and streamline actors.
+
+The module does not import Qt, so the scene can also be built offscreen,
+without a GUI stack (see session.py). train.py adds the window and the
+widgets around it.
+"""
+
+import vtk
+
+import tracing
+import surface
+
+
+# color map for pressure
+pressure_colormap = [[0.908456, 0.231373, 0.298039, 0.752941],
+                      [0.989821, 0.865003, 0.865003, 0.865003],
+                      [1.07119, 0.705882, 0.015686, 0.14902]]
+
+# color map for velocity
+velocity_colormap = [[0.0, 0, 1, 1],
+                     [0.218395, 0, 0, 1],
+                     [0.241661, 0, 0, 0.502],
+                     [0.266927, 1, 0, 0],
+                     [0.485321, 1, 1, 0]]
+
+# range of the input data set
+datarange = [(-23274., -11937., 0.), (46753., 11875., 13427.)]
+
+# default and maximum sampling resolution
+init_resolution = 100
+max_resolution = 100000
+
+# name of the probe line present at start
+init_line_name = "line 1"
+
+init_plane_position = 11740
+# positions of the plane slider
+plane_positions = [val * 1000 + datarange[0][0] for val in range(71)]
+
+# default camera position
+init_cam_pos = [(11739.94921875, -30.8115234375, 151939.9891022906),
+                (11739.94921875, -30.8115234375, 6713.68798828125),
+                (0.0, 1.0, 0.0),
+                (130413.79900618957, 164222.48404136402)]
+
+DATA_PRESSURE = 'pressure'
+DATA_VELOCITY = 'velocity'
+DATA_VELOCITY_MAGNITUDE = 'velocity_magnitude'
+
+
+def makePlane(slicer):
+    """
+    Render the cut of the plane normal to x
+    :param slicer: SliceEngine of the grid, or ChunkedSlicer of a chunked dataset
+    """
+    lut = vtk.vtkColorTransferFunction()
+    lut.SetColorSpaceToRGB()
+    for [val, R, G, B] in pressure_colormap:
+        lut.AddRGBPoint(val, R, G, B)
+
+    slicer.cut(init_plane_position)
+
+    mapper = vtk.vtkDataSetMapper()
+    mapper.SetInputConnection(slicer.GetOutputPort())
+    mapper.SetScalarModeToUsePointFieldData()
+    mapper.SelectColorArray(DATA_PRESSURE)
+    mapper.SetLookupTable(lut)
+
+    actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+    actor.SetVisibility(False)
+
+    return actor
+
+
+def makeTrain(outer, lod=None):
+    """
+    Render the outer surface of the train dataset, colored using pressure value
+    :param outer: outer surface of the grid, see surface.py
+    :param lod: target triangle counts of coarser levels of detail, see
+                surface.py. Only the full surface is drawn if None.
+    :return: the actor and the mappers of all levels, finest first
+    """
+    lut = vtk.vtkColorTransferFunction()
+    lut.SetColorSpaceToRGB()
+    for [val, R, G, B] in pressure_colormap:
+        lut.AddRGBPoint(val, R, G, B)
+
+    plane = vtk.vtkPlane()
+    plane.SetOrigin(11740, -30, 6713)
+    plane.SetNormal(1.0, 0, 0)
+
+    mappers = list()
+    for level in surface.levels_of_detail(outer, lod or []):
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(level)
+        mapper.SetScalarModeToUsePointFieldData()
+        mapper.SelectColorArray(DATA_PRESSURE)
+        mapper.SetLookupTable(lut)
+        mappers.append(mapper)
+
+    actor = vtk.vtkActor()
+    actor.SetMapper(mappers[0])
+    actor.GetProperty().SetOpacity(0.7)
+
+    return actor, mappers
+
+
+def makeStream(reader, merged=True, tracer=None, filename=None, lines=None):
+    """
+    Create streamlines for the data set, colored by velocity magnitude
+    :param merged: trace all seeds with a single tracer and draw them with a
+                   single actor, instead of one tracer and actor per seed
+    :param tracer: function tracing a list of seed positions into a single
+                   polydata, replaces the single tracer in merged mode
+    :param filename: dataset file of the reader, enables the streamline cache
+                     in merged mode
+    :param lines: streamlines traced beforehand (e.g. by seeding.py), drawn
+                  instead of tracing the seed grid
+    """
+    arrow = vtk.vtkArrowSource()
+    arrow.SetTipLength(0.1)
+    arrow.SetShaftRadius(0.0001)
+
+    lut = vtk.vtkColorTransferFunction()
+    lut.SetColorSpaceToRGB()
+    for [val, R, G, B] in velocity_colormap:
+        lut.AddRGBPoint(val, R, G, B)
+
+    colorBar = vtk.vtkScalarBarActor()
+    colorBar.SetOrientationToHorizontal()
+    colorBar.SetTitle("Velocity Magnitude")
+    colorBar.SetNumberOfLabels(4)
+    colorBar.SetMaximumHeightInPixels(300)
+    colorBar.SetMaximumWidthInPixels(140)
+    colorBar.SetLookupTable(lut)
+    colorBarWidget = vtk.vtkScalarBarWidget()
+    colorBarWidget.SetScalarBarActor(colorBar)
+
+    def makeActor(lines):
+        streamerMapper = vtk.vtkPolyDataMapper()
+        streamerMapper.SetInputData(lines)
+        streamerMapper.SetLookupTable(lut)
+        streamerMapper.SetScalarModeToUsePointFieldData()
+        # a precomputed magnitude saves the mapper from computing it per vertex
+        if lines.GetPointData().HasArray(DATA_VELOCITY_MAGNITUDE):
+            streamerMapper.SelectColorArray(DATA_VELOCITY_MAGNITUDE)
+        else:
+            streamerMapper.SelectColorArray(DATA_VELOCITY)
+
+        streamerActor = vtk.vtkActor()
+        streamerActor.SetMapper(streamerMapper)
+        return streamerActor
+
+    streamerActors = list()
+
+    if lines is not None:
+        streamerActors.append(makeActor(lines))
+    elif merged:
+        # all seeds in one polydata, one mapper, one actor
+        seeds = tracing.seed_positions()
+        if filename is not None:
+            lines = tracing.trace_cached(reader, filename, seeds, tracer)
+        elif tracer is None:
+            lines = tracing.trace(reader, seeds)
+        else:
+            lines = tracer(seeds)
+        streamerActors.append(makeActor(lines))
+    else:
+        for (x, y, z) in tracing.seed_positions():
+            streamer = tracing.makeStreamer(reader)
+            streamer.SetStartPosition(x, y, z)
+            streamer.Update()
+            streamerActors.append(makeActor(streamer.GetOutput()))
+
+    return streamerActors, colorBarWidget
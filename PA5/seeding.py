@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Adaptive streamline seeding around the train body.
+
+The fixed seed grid of tracing.py puts many seeds in dead flow far from the
+train. Here seeds are drawn among the grid points within a few cell layers
+of the train body, with a probability proportional to an importance field
+(velocity magnitude or vorticity magnitude), until a budget of lines is
+traced. A coarse occupancy grid over the dataset bounds records the voxels
+crossed by the accepted lines: seeds in an occupied voxel are skipped
+without tracing, and traced lines running mostly through occupied voxels
+are dropped as duplicates of earlier lines.
+
+Command line interface: python seeding.py <data> [--budget <n>] [--field <name>] [--layers <n>]
+    <data>:     the train dataset (.vtu)
+    <n>:        number of streamlines (optional, 60 by default),
+                cell layers around the body to seed in (optional, 3 by default)
+    <name>:     importance field, velocity_magnitude or vorticity (optional)
+"""
+
+import time
+import argparse
+
+import numpy as np
+import vtk
+
+from cs530 import streamcache
+from cs530.streamcache import to_arrays, from_arrays
+
+import trainio
+import tracing
+import derived
+from dataset import TrainData
+
+# number of streamlines traced by default
+default_budget = 60
+
+# cell layers around the train body seeds are drawn from
+default_layers = 3
+
+# voxels of the occupancy grid along the longest side of the bounds
+occupancy_resolution = 64
+
+# importance fields and the point arrays they are read from
+importance_fields = ["velocity_magnitude", "vorticity"]
+
+
+def body_points(grid):
+    """
+    Ids of the grid points on the train body: points of the outer surface
+    of the grid that are not on its bounding box
+    """
+    surface = vtk.vtkDataSetSurfaceFilter()
+    surface.SetInputData(grid)
+    surface.PassThroughPointIdsOn()
+    surface.Update()
+    out = TrainData(surface.GetOutput())
+    ids = out.require("vtkOriginalPointIds")
+    points = out.points
+    bounds = np.array(grid.GetBounds()).reshape(3, 2)
+    tolerance = 1e-6 * (bounds[:, 1] - bounds[:, 0]).max()
+    box = ((np.abs(points - bounds[:, 0]) <= tolerance) | (np.abs(points - bounds[:, 1]) <= tolerance)).any(axis=1)
+    return ids[~box].astype(np.int64)
+
+
+def near_body(grid, layers=default_layers):
+    """
+    Mask of the grid points within some cell layers of the train body
+    """
+    data = TrainData(grid)
+    offsets = data.offsets.astype(np.int64)
+    connectivity = data.connectivity
+    sizes = np.diff(offsets)
+    mask = np.zeros(grid.GetNumberOfPoints(), dtype=bool)
+    mask[body_points(grid)] = True
+    for _ in range(layers):
+        # every point of a cell touching the mask joins it
+        touching = np.logical_or.reduceat(mask[connectivity], offsets[:-1]) & (sizes > 0)
+        mask[connectivity[np.repeat(touching, sizes)]] = True
+    return mask
+
+
+def importance(grid, field):
+    """
+    Non-negative importance of every grid point
+    :param field: velocity_magnitude or vorticity, read from the point data
+                  (see derived.py), the velocity magnitude is computed if the
+                  grid does not have it
+    """
+    data = TrainData(grid)
+    values = data.array(field)
+    if values is None and field == "velocity_magnitude":
+        values = data.speed()
+    elif values is None:
+        raise ValueError("no point array named '" + field + "', attach it with derived.py")
+    if values.ndim > 1:
+        values = np.sqrt(np.einsum('ij,ij->i', values, values))
+    return np.nan_to_num(values.astype(np.float64))
+
+
+class Occupancy(object):
+    """
+    Coarse voxel grid over the bounds of a dataset marking the voxels crossed
+    by accepted streamlines
+    """
+
+    def __init__(self, bounds, resolution=occupancy_resolution):
+        bounds = np.array(bounds, dtype=np.float64).reshape(3, 2)
+        self.origin = bounds[:, 0]
+        self.size = (bounds[:, 1] - bounds[:, 0]).max() / resolution
+        self.dims = np.maximum(1, np.ceil((bounds[:, 1] - bounds[:, 0]) / self.size).astype(np.int64))
+        self.grid = np.zeros(int(np.prod(self.dims)), dtype=bool)
+
+    def voxels(self, points):
+        ijk = np.clip(((np.atleast_2d(points) - self.origin) / self.size).astype(np.int64), 0, self.dims - 1)
+        return (ijk[:, 0] * self.dims[1] + ijk[:, 1]) * self.dims[2] + ijk[:, 2]
+
+    def occupied(self, points):
+        return self.grid[self.voxels(points)]
+
+    def overlap(self, points):
+        """
+        Fraction of the voxels crossed by a line that are already occupied
+        """
+        voxels = np.unique(self.voxels(points))
+        return self.grid[voxels].mean() if len(voxels) else 1.0
+
+    def mark(self, points):
+        self.grid[self.voxels(points)] = True
+
+
+def select(part, keep):
+    """
+    Some of the polylines of flattened lines, see streamcache.to_arrays()
+    :param keep: indices of the lines to keep
+    """
+    offsets = part["offsets"]
+    sizes = np.diff(offsets)[keep]
+    index = np.concatenate([part["connectivity"][offsets[i]:offsets[i + 1]] for i in keep]) \
+        if len(keep) else np.zeros(0, dtype=np.int64)
+    out = dict(part)
+    out["points"] = part["points"][index]
+    out["offsets"] = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    out["connectivity"] = np.arange(len(index), dtype=np.int64)
+    out["point_data"] = [(name, values[index]) for (name, values) in part["point_data"]]
+    out["cell_data"] = [(name, values[keep]) for (name, values) in part["cell_data"]]
+    return out
+
+
+def trace_adaptive(reader, budget=default_budget, field="velocity_magnitude", layers=default_layers,
+                   overlap=0.5, batch=16, seed=0):
+    """
+    Trace up to `budget` streamlines seeded by importance near the train body
+    :param overlap: lines with a larger fraction of occupied voxels are dropped
+    :param batch: seeds traced together by one tracer call
+    :param seed: seed of the random generator, the same seed gives the same lines
+    :return: polydata holding the lines, and a dict of seeding statistics
+    """
+    grid = reader.GetOutput()
+    candidates = np.flatnonzero(near_body(grid, layers))
+    weights = importance(grid, field)[candidates]
+    stats = {"candidates": len(candidates), "traced": 0, "skipped": 0, "duplicates": 0}
+    if not len(candidates) or weights.sum() <= 0:
+        return vtk.vtkPolyData(), stats
+
+    # candidates in the order they are drawn, by importance without replacement. Points
+    # of zero importance, e.g. on the no-slip train body, cannot be drawn and come last
+    rng = np.random.default_rng(seed)
+    positive = weights > 0
+    drawable = candidates[positive]
+    order = np.concatenate([drawable[rng.choice(len(drawable), len(drawable), replace=False,
+                                                p=weights[positive] / weights[positive].sum())],
+                            rng.permutation(candidates[~positive])])
+    points = TrainData(grid).points
+
+    occupancy = Occupancy(grid.GetBounds())
+    streamer = tracing.makeStreamer(reader)
+    parts = list()
+    accepted = 0
+    drawn = 0
+    while accepted < budget and drawn < len(order):
+        # seeds in voxels free of lines so far
+        seeds = list()
+        while len(seeds) < min(batch, budget - accepted) and drawn < len(order):
+            p = points[order[drawn]]
+            drawn += 1
+            if occupancy.occupied(p)[0]:
+                stats["skipped"] += 1
+            else:
+                seeds.append(tuple(p))
+        if not seeds:
+            break
+        streamer.SetSourceData(tracing.makeSeeds(seeds))
+        streamer.Update()
+        part = to_arrays(streamer.GetOutput())
+        stats["traced"] += len(part["offsets"]) - 1
+
+        keep = list()
+        for i in range(len(part["offsets"]) - 1):
+            line = part["points"][part["connectivity"][part["offsets"][i]:part["offsets"][i + 1]]]
+            if accepted >= budget or occupancy.overlap(line) > overlap:
+                stats["duplicates"] += 1
+                continue
+            occupancy.mark(line)
+            keep.append(i)
+            accepted += 1
+        parts.append(select(part, keep))
+    return from_arrays(parts), stats
+
+
+def trace_cached(reader, filename, budget=default_budget, field="velocity_magnitude", layers=default_layers):
+    """
+    Adaptive streamlines through the on-disk streamline cache
+    :param filename: dataset file feeding the reader
+    :return: polydata holding the lines
+    """
+    pd = reader.GetOutput().GetPointData()
+    arrays = [(pd.GetArrayName(i), pd.GetArray(i).GetDataTypeAsString())
+              for i in range(pd.GetNumberOfArrays())]
+    extra = {"seeding": "adaptive", "budget": budget, "field": field, "layers": layers, "arrays": arrays}
+    return streamcache.cached(lambda: trace_adaptive(reader, budget, field, layers)[0], filename, [],
+                              streamcache.settings(tracing.makeStreamer(reader)), extra)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    parser.add_argument('--budget', type=int, default=default_budget)
+    parser.add_argument('--field', choices=importance_fields, default="velocity_magnitude")
+    parser.add_argument('--layers', type=int, default=default_layers)
+    args = parser.parse_args()
+
+    reader = trainio.read(args.train_file)
+    derived.attach(reader.GetOutput(), [args.field], args.train_file)
+
+    start = time.perf_counter()
+    grid = tracing.trace(reader, tracing.seed_positions())
+    print("seed grid: %8.2f s  %d lines  %d points"
+          % (time.perf_counter() - start, grid.GetNumberOfLines(), grid.GetNumberOfPoints()))
+
+    start = time.perf_counter()
+    (lines, stats) = trace_adaptive(reader, args.budget, args.field, args.layers)
+    print("adaptive:  %8.2f s  %d lines  %d points" % (time.perf_counter() - start, lines.GetNumberOfLines(),
+                                                       lines.GetNumberOfPoints()))
+    print("  %(candidates)d candidate seeds, %(traced)d traced, %(skipped)d skipped in occupied voxels, "
+          "%(duplicates)d duplicate lines dropped" % stats)
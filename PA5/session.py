@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Recording and offscreen replay of train viewer sessions.
+
+A session file is JSON lines: a header naming the dataset, then one event
+per line, stamped with its time in seconds since the recording started:
+
+    {"t": 0.0, "event": "camera", "position": [...], "focal_point": [...],
+     "view_up": [...], "view_angle": 30.0}
+    {"t": 2.5, "event": "plane", "x": 11740}
+    {"t": 3.1, "event": "line", "name": "line 1", "p0": [...], "p1": [...], "resolution": 100}
+    {"t": 4.0, "event": "remove_line", "name": "line 1"}
+    {"t": 5.2, "event": "toggle", "name": "plane_mode", "value": true}
+
+train.py --record <file> writes one while the viewer is used. Since events
+are plain JSON, camera paths can also be scripted by hand.
+
+Replay renders the session offscreen at a fixed size and frame rate,
+without a window or a Qt application. The camera follows a spline through
+the camera keyframes, and the other events apply from their time on. Each
+frame is handed to a writer thread that encodes it as PNG with zlib, which
+releases the GIL, so encoding overlaps the rendering of the next frames.
+
+Command line interface: python session.py <data> <session> -o <dir> [--size <w> <h>] [--fps <n>]
+    <data>:     the train dataset (.vtu)
+    <session>:  session file to replay
+    <dir>:      directory the frames are written to (frame00000.png, ...)
+    <w> <h>:    frame size in pixels (optional, 1280 720 by default)
+    <n>:        frames per second of session time (optional, 30 by default)
+"""
+
+import os
+import json
+import time
+import zlib
+import queue
+import struct
+import argparse
+import threading
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+# the viewer's builders, without a window or Qt
+import scene
+import trainio
+import surface
+import derived
+from slicing import SliceEngine
+from probelines import ProbeLines
+
+SESSION_VERSION = 1
+
+# minimum time between camera keyframes recorded while the camera moves
+keyframe_interval = 0.1
+
+# frames waiting for the writer thread before rendering blocks
+queue_frames = 8
+
+# toggles of the viewer that change the rendered image
+toggles = ["colorbar", "streamlines", "plane_mode"]
+
+
+def camera_state(camera):
+    return {"position": list(camera.GetPosition()),
+            "focal_point": list(camera.GetFocalPoint()),
+            "view_up": list(camera.GetViewUp()),
+            "view_angle": camera.GetViewAngle()}
+
+
+class SessionRecorder(object):
+    """
+    Appends the events of a viewer session to a session file, flushed line
+    by line so a crash keeps everything up to it
+    """
+
+    def __init__(self, filename, dataset):
+        self.filename = filename
+        self.fd = open(filename, 'w')
+        self.start = time.perf_counter()
+        self.camera = None
+        self.cameraTime = -keyframe_interval
+        header = {"session": SESSION_VERSION, "dataset": os.path.abspath(dataset),
+                  "created": time.strftime("%Y-%m-%d %H:%M:%S")}
+        self.fd.write(json.dumps(header) + "\n")
+        self.count = 0
+
+    def record(self, event, **fields):
+        fields["t"] = round(time.perf_counter() - self.start, 4)
+        fields["event"] = event
+        self.fd.write(json.dumps(fields) + "\n")
+        self.fd.flush()
+        self.count += 1
+
+    def record_camera(self, camera, moving=False):
+        """
+        Record a camera keyframe if the camera changed since the last one.
+        While the camera moves keyframes are at least keyframe_interval apart.
+        """
+        state = camera_state(camera)
+        now = time.perf_counter() - self.start
+        if state == self.camera or (moving and now - self.cameraTime < keyframe_interval):
+            return
+        self.camera = state
+        self.cameraTime = now
+        self.record("camera", **state)
+
+    def close(self):
+        self.fd.close()
+
+
+def read_session(filename):
+    """
+    :return: the header and the list of events of a session file, in time order
+    """
+    with open(filename) as fd:
+        header = json.loads(fd.readline())
+        if header.get("session") != SESSION_VERSION:
+            raise ValueError(filename + " is not a session file")
+        events = [json.loads(row) for row in fd if row.strip()]
+    # sorted is stable, events recorded at the same time keep their order
+    return header, sorted(events, key=lambda e: e["t"])
+
+
+def encode_png(image):
+    """
+    PNG file content of an RGB image
+    :param image: (h, w, 3) uint8 array, top row first
+    """
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    (h, w, _) = image.shape
+    # every row starts with its filter type, 0 (none)
+    rows = np.zeros((h, 1 + 3 * w), dtype=np.uint8)
+    rows[:, 1:] = image.reshape(h, 3 * w)
+    return (b"\x89PNG\r\n\x1a\n" +
+            chunk(b"IHDR", struct.pack('>IIBBBBB', w, h, 8, 2, 0, 0, 0)) +
+            chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)) +
+            chunk(b"IEND", b""))
+
+
+class FrameWriter(threading.Thread):
+    """
+    Encodes and writes frames on a background thread, fed through a bounded
+    queue
+    """
+
+    def __init__(self, maxsize=queue_frames):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self.elapsed = 0.0
+        self.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+            (path, image) = item
+            start = time.perf_counter()
+            try:
+                with open(path, 'wb') as fd:
+                    fd.write(encode_png(image))
+            except OSError as e:
+                self.error = e
+            self.elapsed += time.perf_counter() - start
+
+    def put(self, path, image):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((path, image))
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+class Replay(object):
+    """
+    The viewer's scene in an offscreen render window, driven by session
+    events
+    """
+
+    def __init__(self, filename, size, arrays=None):
+        reader = trainio.read(filename, arrays or [scene.DATA_PRESSURE, scene.DATA_VELOCITY])
+        derived.attach(reader.GetOutput(), [scene.DATA_VELOCITY_MAGNITUDE], filename)
+        (outer, _) = surface.cached_surface(filename, reader.GetOutput())
+        (self.trainActor, _) = scene.makeTrain(outer)
+        self.slicer = SliceEngine(reader.GetOutput(), -30, 6713)
+        self.planeActor = scene.makePlane(self.slicer)
+        (self.streamerActors, colorBarWidget) = scene.makeStream(reader, True, None, filename)
+        self.colorBar = colorBarWidget.GetScalarBarActor()
+        self.lines = ProbeLines()
+        self.lines.set(scene.init_line_name, scene.datarange[0], scene.datarange[1], scene.init_resolution)
+
+        self.ren = vtk.vtkRenderer()
+        for actor in [self.trainActor, self.planeActor, self.lines.actor] + self.streamerActors:
+            self.ren.AddActor(actor)
+        self.ren.AddViewProp(self.colorBar)
+        self.ren.SetBackground(0.75, 0.75, 0.75)
+        self.ren.ResetCamera()
+
+        self.window = vtk.vtkRenderWindow()
+        self.window.SetOffScreenRendering(True)
+        self.window.SetSize(*size)
+        self.window.AddRenderer(self.ren)
+        self.grabber = vtk.vtkWindowToImageFilter()
+        self.grabber.SetInput(self.window)
+        self.grabber.ReadFrontBufferOff()
+
+    def apply(self, event):
+        kind = event["event"]
+        if kind == "plane":
+            self.slicer.cut(event["x"])
+        elif kind == "line":
+            self.lines.set(event["name"], event["p0"], event["p1"], event["resolution"])
+        elif kind == "remove_line":
+            if event["name"] in self.lines:
+                self.lines.remove(event["name"])
+        elif kind == "toggle":
+            value = event["value"]
+            if event["name"] == "colorbar":
+                self.colorBar.SetVisibility(value)
+            elif event["name"] == "streamlines":
+                for actor in self.streamerActors:
+                    actor.SetVisibility(value)
+            elif event["name"] == "plane_mode":
+                self.planeActor.SetVisibility(value)
+                self.trainActor.GetProperty().SetOpacity(0.1 if value else 0.7)
+
+    def frame(self):
+        """
+        Render a frame and return it as a (h, w, 3) array, top row first
+        """
+        self.ren.ResetCameraClippingRange()
+        self.window.Render()
+        self.grabber.Modified()
+        self.grabber.Update()
+        image = self.grabber.GetOutput()
+        (w, h, _) = image.GetDimensions()
+        pixels = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())
+        # VTK images start at the bottom row; the copy frees the grabber's buffer
+        return pixels.reshape(h, w, -1)[::-1, :, :3].copy()
+
+
+def replay(filename, session, outdir, size=(1280, 720), fps=30):
+    """
+    Render a session to a PNG sequence
+    :return: number of frames, seconds spent rendering, seconds spent encoding
+    """
+    (_, events) = read_session(session)
+    player = Replay(filename, size)
+    cameras = [e for e in events if e["event"] == "camera"]
+    others = [e for e in events if e["event"] != "camera"]
+
+    interpolator = vtk.vtkCameraInterpolator()
+    interpolator.SetInterpolationTypeToSpline()
+    for e in cameras:
+        camera = vtk.vtkCamera()
+        camera.SetPosition(e["position"])
+        camera.SetFocalPoint(e["focal_point"])
+        camera.SetViewUp(e["view_up"])
+        camera.SetViewAngle(e["view_angle"])
+        interpolator.AddCamera(e["t"], camera)
+
+    os.makedirs(outdir, exist_ok=True)
+    writer = FrameWriter()
+    duration = events[-1]["t"] if events else 0.0
+    count = int(duration * fps) + 1
+    applied = 0
+    rendering = 0.0
+    try:
+        for i in range(count):
+            t = i / float(fps)
+            while applied < len(others) and others[applied]["t"] <= t:
+                player.apply(others[applied])
+                applied += 1
+            if cameras:
+                interpolator.InterpolateCamera(min(max(t, cameras[0]["t"]), cameras[-1]["t"]),
+                                               player.ren.GetActiveCamera())
+            start = time.perf_counter()
+            image = player.frame()
+            rendering += time.perf_counter() - start
+            writer.put(os.path.join(outdir, "frame%05d.png" % i), image)
+    finally:
+        writer.close()
+    return count, rendering, writer.elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    parser.add_argument('session')
+    parser.add_argument('-o', '--output', required=True)
+    parser.add_argument('--size', type=int, nargs=2, default=[1280, 720])
+    parser.add_argument('--fps', type=int, default=30)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    (count, rendering, encoding) = replay(args.train_file, args.session, args.output, args.size, args.fps)
+    print("-Replayed %d frames to %s in %.2f s (render %.2f s, encode %.2f s on the writer thread)"
+          % (count, args.output, time.perf_counter() - start, rendering, encoding))
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Incremental plane cuts through the train grid.
+
+Moving a vtkCutter's plane makes it evaluate every cell of the grid again.
+Since the plane is always normal to x, the x-extent [xmin, xmax] of every
+cell is computed once, and a cut at x only has to look at the cells whose
+extent straddles x.
+
+The extents are kept as sorted interval lists: the cells are grouped by
+extent length (powers of two), and each group is sorted by xmin. A cell of
+a group can only straddle x if its xmin lies in [x - longest, x], which is
+a binary search, and only those candidates are checked against xmax. The
+straddling cells are copied into a small grid sharing the points and point
+data of the full grid, and only that grid is cut.
+
+With few plane positions (the viewer's slider has 71), every slice can be
+cut once up front: cut_parallel() cuts them in worker processes, and a
+SliceStack keeps the results in a memory bounded LRU that optionally
+spills evicted slices to disk.
+
+Command line interface: python slicing.py <data> [--cuts <n>]
+    <data>:     the train dataset (.vtu)
+    <n>:        number of cuts to time against the full vtkCutter (optional)
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from dataset import TrainData
+
+
+class SliceEngine(object):
+    """
+    Plane cuts normal to x through an unstructured grid
+    """
+
+    def __init__(self, grid, y=-30, z=6713):
+        self.grid = grid
+        self.data = TrainData(grid)
+        self.offsets = self.data.offsets
+        self.connectivity = self.data.connectivity
+        self.types = self.data.types
+
+        self.plane = vtk.vtkPlane()
+        self.plane.SetNormal(1.0, 0, 0)
+        self.plane.SetOrigin(0, y, z)
+        self.cutter = vtk.vtkCutter()
+        self.cutter.SetCutFunction(self.plane)
+        self.groups = None
+        # cells looked at and time spent by the last cut
+        self.visited = 0
+        self.elapsed = 0.0
+
+    def build(self):
+        """
+        Compute the x-extents of all cells and the sorted interval lists
+        """
+        if self.groups is not None:
+            return
+        x = self.data.points[:, 0]
+        xs = x[self.connectivity]
+        starts = self.offsets[:-1]
+        self.xmin = np.minimum.reduceat(xs, starts)
+        self.xmax = np.maximum.reduceat(xs, starts)
+        del xs
+
+        length = self.xmax - self.xmin
+        classes = np.ceil(np.log2(np.maximum(length, 1e-12))).astype(np.int32)
+        self.groups = list()
+        for c in np.unique(classes):
+            ids = np.flatnonzero(classes == c)
+            ids = ids[np.argsort(self.xmin[ids], kind='stable')]
+            self.groups.append((self.xmin[ids], ids, float(length[ids].max())))
+
+    def straddling(self, x):
+        """
+        Ids of the cells whose x-extent contains x, in increasing order
+        """
+        self.build()
+        found = list()
+        visited = 0
+        for (xmin, ids, longest) in self.groups:
+            lo = np.searchsorted(xmin, x - longest, 'left')
+            hi = np.searchsorted(xmin, x, 'right')
+            candidates = ids[lo:hi]
+            visited += len(candidates)
+            found.append(candidates[self.xmax[candidates] >= x])
+        self.visited = visited
+        return np.sort(np.concatenate(found))
+
+    def subset(self, ids):
+        """
+        Grid made of the given cells only. Points and point data are shared
+        with the full grid, only the cells are copied.
+        """
+        starts = self.offsets[ids]
+        sizes = self.offsets[ids + 1] - starts
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        # index of every connectivity entry of the selected cells
+        index = np.repeat(starts - offsets[:-1], sizes) + np.arange(offsets[-1])
+
+        cells = vtk.vtkCellArray()
+        cells.SetData(numpy_support.numpy_to_vtkIdTypeArray(offsets, deep=1),
+                      numpy_support.numpy_to_vtkIdTypeArray(self.connectivity[index].astype(np.int64), deep=1))
+        types = numpy_support.numpy_to_vtk(self.types[ids], deep=1,
+                                           array_type=vtk.VTK_UNSIGNED_CHAR)
+
+        part = vtk.vtkUnstructuredGrid()
+        part.SetPoints(self.grid.GetPoints())
+        part.SetCells(types, cells)
+        part.GetPointData().ShallowCopy(self.grid.GetPointData())
+        return part
+
+    def cut(self, x):
+        """
+        Move the plane to x and cut the straddling cells
+        :return: polydata of the cut
+        """
+        start = time.perf_counter()
+        ids = self.straddling(x)
+        self.plane.SetOrigin(x, self.plane.GetOrigin()[1], self.plane.GetOrigin()[2])
+        self.cutter.SetInputData(self.subset(ids))
+        self.cutter.Update()
+        self.elapsed = time.perf_counter() - start
+        return self.cutter.GetOutput()
+
+    def GetOutputPort(self):
+        return self.cutter.GetOutputPort()
+
+    def GetNumberOfCells(self):
+        return len(self.types)
+
+
+def pack(cut):
+    """
+    Flatten the polygons and point data of a cut into plain NumPy arrays
+    """
+    def copy(arr):
+        return np.array(numpy_support.vtk_to_numpy(arr))
+
+    if cut.GetPoints() is None:
+        return {"points": np.zeros((0, 3)),
+                "offsets": np.zeros(1, dtype=np.int64),
+                "connectivity": np.zeros(0, dtype=np.int64),
+                "point_data": [], "point_attributes": []}
+    polys = cut.GetPolys()
+    pd = cut.GetPointData()
+    return {"points": copy(cut.GetPoints().GetData()),
+            "offsets": copy(polys.GetOffsetsArray()),
+            "connectivity": copy(polys.GetConnectivityArray()),
+            "point_data": [(pd.GetArrayName(i), copy(pd.GetArray(i)))
+                           for i in range(pd.GetNumberOfArrays())],
+            "point_attributes": [pd.IsArrayAnAttribute(i) for i in range(pd.GetNumberOfArrays())]}
+
+
+def unpack(part):
+    """
+    Polydata of a cut flattened by pack(). The arrays are not copied.
+    """
+    cut = vtk.vtkPolyData()
+    if not len(part["points"]):
+        return cut
+    for key in ("offsets", "connectivity"):
+        part[key] = np.ascontiguousarray(part[key], dtype=np.int64)
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(part["points"]))
+    polys = vtk.vtkCellArray()
+    polys.SetData(numpy_support.numpy_to_vtkIdTypeArray(part["offsets"]),
+                  numpy_support.numpy_to_vtkIdTypeArray(part["connectivity"]))
+    cut.SetPoints(points)
+    cut.SetPolys(polys)
+    pd = cut.GetPointData()
+    for ((name, values), attribute) in zip(part["point_data"], part["point_attributes"]):
+        arr = numpy_support.numpy_to_vtk(values)
+        arr.SetName(name)
+        pd.AddArray(arr)
+        if int(attribute) >= 0:
+            pd.SetActiveAttribute(name, int(attribute))
+    # the vtk arrays only reference the NumPy buffers, keep them alive
+    cut.buffers = part
+    return cut
+
+
+class SliceStack(object):
+    """
+    Precomputed cuts by plane position, in a LRU bounded to max_bytes.
+    Evicted cuts are written to a spill directory if one is given and read
+    back on the next lookup, otherwise they are dropped.
+    """
+
+    def __init__(self, max_bytes, spill=None):
+        self.max_bytes = max_bytes
+        self.slices = OrderedDict()
+        self.nbytes = 0
+        self.spilled = set()
+        self.spill = None
+        if spill is not None:
+            os.makedirs(spill, exist_ok=True)
+            self.spill = tempfile.mkdtemp(prefix="slices-", dir=spill)
+
+    @staticmethod
+    def size(part):
+        return sum(a.nbytes for a in (part["points"], part["offsets"], part["connectivity"])) \
+            + sum(values.nbytes for (_, values) in part["point_data"])
+
+    def path(self, x):
+        return os.path.join(self.spill, "%r.npz" % float(x))
+
+    def put(self, x, part):
+        """
+        Store the cut at position x, flattened by pack()
+        """
+        if x in self.slices:
+            self.nbytes -= self.size(self.slices.pop(x)[0])
+        self.slices[x] = (part, unpack(part))
+        self.nbytes += self.size(part)
+        while self.nbytes > self.max_bytes and len(self.slices) > 1:
+            (old, (evicted, _)) = self.slices.popitem(last=False)
+            self.nbytes -= self.size(evicted)
+            if self.spill is not None:
+                arrays = {"points": evicted["points"],
+                          "offsets": evicted["offsets"],
+                          "connectivity": evicted["connectivity"],
+                          "names": np.array([n for (n, _) in evicted["point_data"]], dtype=str),
+                          "attributes": np.array(evicted["point_attributes"], dtype=np.int32)}
+                for (i, (_, values)) in enumerate(evicted["point_data"]):
+                    arrays["pd%d" % i] = values
+                np.savez(self.path(old), **arrays)
+                self.spilled.add(old)
+
+    def get(self, x):
+        """
+        The cut at position x, or None if it is not (yet) computed
+        """
+        if x in self.slices:
+            self.slices.move_to_end(x)
+            return self.slices[x][1]
+        if x not in self.spilled:
+            return None
+        with np.load(self.path(x)) as f:
+            part = {"points": f["points"],
+                    "offsets": f["offsets"],
+                    "connectivity": f["connectivity"],
+                    "point_data": [(str(n), f["pd%d" % i]) for (i, n) in enumerate(f["names"])],
+                    "point_attributes": list(f["attributes"])}
+        self.spilled.discard(x)
+        os.remove(self.path(x))
+        self.put(x, part)
+        return self.slices[x][1]
+
+    def __contains__(self, x):
+        return x in self.slices or x in self.spilled
+
+    def __len__(self):
+        return len(self.slices) + len(self.spilled)
+
+    def close(self):
+        """
+        Remove the spill directory
+        """
+        if self.spill is not None:
+            shutil.rmtree(self.spill, ignore_errors=True)
+
+
+# slicing engine of a worker process, built once by _init_worker
+_engine = None
+
+
+def _init_worker(filename, arrays, float32, cache):
+    global _engine
+    import trainio
+    _engine = SliceEngine(trainio.read(filename, arrays, float32, cache).GetOutput())
+    _engine.build()
+
+
+def _cut(x):
+    return x, pack(_engine.cut(x))
+
+
+def cut_parallel(filename, positions, workers, arrays=None, float32=False, cache=True):
+    """
+    Cut the dataset at every position in a pool of worker processes
+    :param workers: number of worker processes
+    :param cache: use the raw cache of the dataset, otherwise every worker
+                  parses the dataset
+    :return: generator of (position, cut flattened by pack()), in order of
+             completion. Closing it early cancels the remaining cuts.
+    """
+    if cache:
+        import trainio
+        # the cache is built here, so the workers only ever map it
+        trainio.read(filename, arrays, float32)
+
+    # spawn rather than fork: the parent may already hold a GUI and a GL context
+    context = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                               initializer=_init_worker, initargs=(filename, arrays, float32, cache))
+    try:
+        for future in as_completed([pool.submit(_cut, x) for x in positions]):
+            yield future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    import trainio
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    parser.add_argument('--cuts', type=int, default=10)
+    args = parser.parse_args()
+
+    grid = trainio.read(args.train_file).GetOutput()
+    engine = SliceEngine(grid)
+    start = time.perf_counter()
+    engine.build()
+    print("index:      %8.3f s, %d interval lists" % (time.perf_counter() - start, len(engine.groups)))
+
+    plane = vtk.vtkPlane()
+    plane.SetNormal(1.0, 0, 0)
+    full = vtk.vtkCutter()
+    full.SetInputData(grid)
+    full.SetCutFunction(plane)
+
+    (x0, x1) = grid.GetBounds()[:2]
+    for x in np.linspace(x0, x1, args.cuts + 2)[1:-1]:
+        start = time.perf_counter()
+        plane.SetOrigin(x, -30, 6713)
+        full.Update()
+        reference = time.perf_counter() - start
+        out = engine.cut(x)
+        print("x=%10.1f  full %8.3f s  incremental %8.3f s  %8d/%d cells  %d/%d polygons"
+              % (x, reference, engine.elapsed, engine.visited, engine.GetNumberOfCells(),
+                 out.GetNumberOfCells(), full.GetOutput().GetNumberOfCells()))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Smoothing of sampled line data.
+
+Several channels of equal length (e.g. pressure and velocity magnitude)
+are smoothed at once with a symmetric kernel of configurable width. As
+with the original 3-tap low pass filter, the first and last width // 2
+samples are kept unchanged.
+
+Kernels:
+    box:        moving average, width 3 is the original LPF
+    gaussian:   Gaussian weights, sigma = width / 6 by default
+    savgol:     Savitzky-Golay, least squares polynomial fit (order 2 by default)
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def box_kernel(width):
+    return np.full(width, 1.0 / width)
+
+
+def gaussian_kernel(width, sigma=None):
+    if sigma is None:
+        sigma = width / 6.0
+    x = np.arange(width) - (width - 1) / 2.0
+    k = np.exp(-0.5 * (x / sigma) ** 2)
+    return k / k.sum()
+
+
+# polynomial order of the Savitzky-Golay kernel
+savgol_order = 2
+
+
+def savgol_kernel(width, order=savgol_order):
+    if order >= width:
+        raise ValueError("Savitzky-Golay order must be smaller than the kernel width")
+    x = np.arange(width) - (width - 1) / 2.0
+    # the first row of the pseudo-inverse evaluates the fitted polynomial at the center
+    return np.linalg.pinv(np.vander(x, order + 1, increasing=True))[0]
+
+
+kernels = {"box": box_kernel,
+           "gaussian": gaussian_kernel,
+           "savgol": savgol_kernel}
+
+
+def check(kernel, width):
+    """
+    Raise ValueError if a kernel cannot be built at a width
+    """
+    if width % 2 == 0 or width < 1:
+        raise ValueError("kernel width must be a positive odd number")
+    if kernel == "savgol" and width <= savgol_order:
+        raise ValueError("Savitzky-Golay kernel width must be larger than its order (%d)" % savgol_order)
+
+
+def smooth(channels, kernel="box", width=3, out=None):
+    """
+    Smooth several 1-D channels of equal length at once
+    :param channels: list of arrays, or a (channels, samples) array
+    :param kernel: name of the kernel, see kernels
+    :param width: odd kernel width in samples
+    :param out: arrays receiving the result, may be the channels themselves
+                to smooth in place. New arrays are allocated if None.
+    :return: the smoothed channels
+    """
+    check(kernel, width)
+    data = np.asarray(channels, dtype=np.float64)
+    if out is None:
+        out = [np.empty(data.shape[1]) for _ in range(len(data))]
+
+    h = width // 2
+    n = data.shape[1]
+    if n <= 2 * h:
+        for (o, d) in zip(out, data):
+            o[:] = d
+        return out
+
+    # (channels, n - 2h) products of every window with the kernel
+    filtered = sliding_window_view(data, width, axis=1) @ kernels[kernel](width)
+    for (o, d, f) in zip(out, data, filtered):
+        o[:h] = d[:h]
+        o[h:n - h] = f
+        o[n - h:] = d[n - h:]
+    return out
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Outer surface of the train grid and its levels of detail.
+
+Drawing the grid with a vtkDataSetMapper makes the mapper extract the
+surface of all cells, again whenever anything upstream changes. The surface
+is extracted here once instead and stored as raw NumPy arrays in the cache
+directory of the dataset (<data>.cache/surface/), tagged with the SHA-256
+of the dataset, so later launches only map it. It can also be decimated
+into coarser levels holding about a given number of triangles, which the
+viewer draws while the camera moves.
+
+Command line interface: python surface.py <data> [--levels <n> ...]
+    <data>:     the train dataset (.vtu)
+    <n>:        target triangle counts of the coarser levels (optional)
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from cs530 import files
+
+import trainio
+
+SURFACE_VERSION = 1
+
+# target triangle counts of the coarser levels
+default_levels = [200000, 50000, 10000]
+
+
+def external_surface(grid):
+    """
+    Outer surface of an unstructured grid as triangles, with its point data
+    """
+    surface = vtk.vtkDataSetSurfaceFilter()
+    surface.SetInputData(grid)
+    triangles = vtk.vtkTriangleFilter()
+    triangles.SetInputConnection(surface.GetOutputPort())
+    triangles.PassLinesOff()
+    triangles.PassVertsOff()
+    triangles.Update()
+    return triangles.GetOutput()
+
+
+def surface_dir(filename):
+    return os.path.join(trainio.cache_dir(filename), "surface")
+
+
+def point_arrays(data):
+    """
+    Names and types of the point arrays of a dataset
+    """
+    pd = data.GetPointData()
+    return [[pd.GetArrayName(i), pd.GetArray(i).GetDataTypeAsString()] for i in range(pd.GetNumberOfArrays())]
+
+
+def read_surface_header(filename, grid):
+    """
+    Header of the stored surface of a dataset, or None if there is none or
+    it does not match the dataset and the point arrays of the grid
+    """
+    path = os.path.join(surface_dir(filename), "header.json")
+    try:
+        with open(path) as fd:
+            header = json.load(fd)
+    except (OSError, ValueError):
+        return None
+    if header.get("version") != SURFACE_VERSION or header.get("arrays") != point_arrays(grid):
+        return None
+    if header.get("source") != trainio.source_stamp(filename):
+        # touched or copied, the content decides
+        if header.get("hash") != files.content_hash(filename):
+            return None
+        header["source"] = trainio.source_stamp(filename)
+        trainio.save_json(path, header)
+    return header
+
+
+def store_surface(filename, surface):
+    path = surface_dir(filename)
+    os.makedirs(path, exist_ok=True)
+
+    def save(name, arr, dtype=None):
+        data = numpy_support.vtk_to_numpy(arr)
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        trainio.save_array(os.path.join(path, name + ".npy"), data)
+
+    polys = surface.GetPolys()
+    save("points", surface.GetPoints().GetData())
+    save("offsets", polys.GetOffsetsArray(), np.int64)
+    save("connectivity", polys.GetConnectivityArray(), np.int64)
+    pd = surface.GetPointData()
+    for i in range(pd.GetNumberOfArrays()):
+        save("array%d" % i, pd.GetArray(i))
+
+    # the header is written last so an interrupted store is never used
+    header = {"version": SURFACE_VERSION,
+              "source": trainio.source_stamp(filename),
+              "hash": files.content_hash(filename),
+              "arrays": point_arrays(surface),
+              "attributes": [pd.IsArrayAnAttribute(i) for i in range(pd.GetNumberOfArrays())],
+              "triangles": surface.GetNumberOfPolys()}
+    trainio.save_json(os.path.join(path, "header.json"), header)
+
+
+def load_surface(filename, header):
+    """
+    Polydata on top of the memory-mapped arrays of a stored surface
+    """
+    path = surface_dir(filename)
+
+    def mmap(name):
+        # copy-on-write so VTK can never write through to the cache file
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode='c')
+
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(mmap("points")))
+    polys = vtk.vtkCellArray()
+    polys.SetData(numpy_support.numpy_to_vtkIdTypeArray(mmap("offsets")),
+                  numpy_support.numpy_to_vtkIdTypeArray(mmap("connectivity")))
+
+    surface = vtk.vtkPolyData()
+    surface.SetPoints(points)
+    surface.SetPolys(polys)
+    pd = surface.GetPointData()
+    for (i, ((name, _), attribute)) in enumerate(zip(header["arrays"], header["attributes"])):
+        arr = numpy_support.numpy_to_vtk(mmap("array%d" % i))
+        arr.SetName(name)
+        pd.AddArray(arr)
+        if attribute >= 0:
+            pd.SetActiveAttribute(name, attribute)
+    return surface
+
+
+def cached_surface(filename, grid):
+    """
+    Outer surface of the grid of a dataset, extracted once and then loaded
+    from the dataset's cache directory
+    :param filename: dataset file the grid was read from
+    :return: (surface, whether it came from the cache)
+    """
+    header = read_surface_header(filename, grid)
+    if header is not None:
+        return load_surface(filename, header), True
+    surface = external_surface(grid)
+    try:
+        store_surface(filename, surface)
+    except OSError as e:
+        print("-Cannot write surface cache for " + filename + ": " + str(e))
+    return surface, False
+
+
+def decimate(surface, targets=default_levels):
+    """
+    Decimated copies of a triangle surface
+    :param targets: triangle counts to decimate to, targets not below the
+                    size of the surface are skipped
+    :return: list of polydata, in the order of the targets
+    """
+    n = surface.GetNumberOfPolys()
+    levels = list()
+    for target in targets:
+        if target >= n:
+            continue
+        decimator = vtk.vtkQuadricDecimation()
+        decimator.SetInputData(surface)
+        decimator.SetTargetReduction(1.0 - float(target) / n)
+        decimator.VolumePreservationOn()
+        # interpolate pressure and velocity onto the remaining vertices
+        decimator.MapPointDataOn()
+        decimator.Update()
+        levels.append(decimator.GetOutput())
+    return levels
+
+
+def levels_of_detail(surface, targets=default_levels):
+    """
+    A surface followed by its decimated levels, from finest to coarsest
+    """
+    return [surface] + decimate(surface, sorted(targets, reverse=True))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    parser.add_argument('--levels', type=int, nargs='+', default=default_levels)
+    args = parser.parse_args()
+
+    grid = trainio.read(args.train_file).GetOutput()
+    start = time.perf_counter()
+    (surface, hit) = cached_surface(args.train_file, grid)
+    print("surface:   %8.2f s  %d triangles%s" % (time.perf_counter() - start, surface.GetNumberOfPolys(),
+                                                   " (cached)" if hit else ""))
+    for target in sorted(args.levels, reverse=True):
+        start = time.perf_counter()
+        for level in decimate(surface, [target]):
+            print("%9d: %8.2f s  %d triangles" % (target, time.perf_counter() - start, level.GetNumberOfPolys()))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Tests of the adaptive seeding on a small synthetic grid: a box of
+hexahedra around a cubic body, with a flow along x that is zero on the
+body and in a layer next to it, as on the no-slip train body.
+
+Command line interface: python -m pytest test_seeding.py
+"""
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+import trainio
+import seeding
+
+
+def lattice(n, shift=0.0):
+    # positions of an n^3 lattice, x varying fastest as in vtkImageData
+    (z, y, x) = np.meshgrid(*[np.arange(n) + shift] * 3, indexing='ij')
+    return np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+
+
+def make_source(still=1.5):
+    """
+    Pipeline source of the synthetic grid
+    :param still: the velocity is zero within this distance of the body
+    """
+    image = vtk.vtkImageData()
+    image.SetDimensions(12, 12, 12)
+    body = numpy_support.numpy_to_vtk(((lattice(11, 0.5) > 4) & (lattice(11, 0.5) < 8)).all(axis=1)
+                                      .astype(np.float64), deep=1)
+    body.SetName("body")
+    image.GetCellData().AddArray(body)
+
+    # distance to the body [4, 8]^3
+    points = lattice(12)
+    distance = np.linalg.norm(np.maximum(0, np.maximum(4 - points, points - 8)), axis=1)
+    velocity = np.zeros((len(points), 3))
+    velocity[:, 0] = np.where(distance <= still, 0.0, distance)
+    arr = numpy_support.numpy_to_vtk(velocity, deep=1)
+    arr.SetName("velocity")
+    image.GetPointData().SetVectors(arr)
+
+    threshold = vtk.vtkThreshold()
+    threshold.SetInputData(image)
+    threshold.SetInputArrayToProcess(0, 0, 0, vtk.vtkDataObject.FIELD_ASSOCIATION_CELLS, "body")
+    threshold.SetThresholdFunction(vtk.vtkThreshold.THRESHOLD_UPPER)
+    threshold.SetUpperThreshold(0.5)
+    threshold.InvertOn()
+    threshold.Update()
+
+    source = trainio.GridSource()
+    source.SetOutput(threshold.GetOutput())
+    return source
+
+
+def test_zero_importance_candidates():
+    source = make_source()
+    grid = source.GetOutput()
+    candidates = np.flatnonzero(seeding.near_body(grid, 3))
+    weights = seeding.importance(grid, "velocity_magnitude")[candidates]
+    assert (weights == 0).any() and (weights > 0).any()
+
+    (lines, stats) = seeding.trace_adaptive(source, budget=5, layers=3)
+    assert stats["candidates"] == len(candidates)
+    assert 0 < lines.GetNumberOfLines() <= 5
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Streamline tracing for the train dataset.
+
+Seeds are traced either by a single vtkStreamTracer or, in parallel, by a
+pool of worker processes. Every worker maps the same raw dataset cache
+(see trainio.py) read-only, traces a contiguous block of seeds and sends
+its polylines back as NumPy arrays, which are merged in seed order.
+
+Command line interface: python tracing.py <data> [--workers <n>]
+    <data>:     the train dataset (.vtu)
+    <n>:        number of worker processes to compare against the serial
+                tracer (optional)
+"""
+
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import vtk
+
+from cs530 import streamcache
+from cs530.streamcache import to_arrays, from_arrays
+
+import trainio
+import derived
+
+# maximum length of a streamline
+max_propagation = 250000
+
+
+def seed_positions():
+    """
+    Streamline seeds: a 15x8 grid in the plane y = -10000 in front of the train
+    """
+    return [(x, -10000, z) for x in range(-20000, 10000, 2000) for z in range(0, 8000, 1000)]
+
+
+def makeSeeds(positions):
+    """
+    A list of seed positions as a single point set
+    """
+    points = vtk.vtkPoints()
+    for p in positions:
+        points.InsertNextPoint(p)
+    seeds = vtk.vtkPolyData()
+    seeds.SetPoints(points)
+    return seeds
+
+
+def makeStreamer(reader):
+    integ = vtk.vtkRungeKutta4()
+    streamer = vtk.vtkStreamTracer()
+    streamer.SetInputConnection(reader.GetOutputPort())
+    streamer.SetMaximumPropagation(max_propagation)
+    streamer.SetIntegrationDirectionToForward()
+    streamer.SetIntegrator(integ)
+    streamer.SetComputeVorticity(True)
+    return streamer
+
+
+def trace(reader, positions):
+    """
+    Trace all seeds with a single tracer
+    :return: polydata holding one polyline per seed
+    """
+    streamer = makeStreamer(reader)
+    streamer.SetSourceData(makeSeeds(positions))
+    streamer.Update()
+    return streamer.GetOutput()
+
+
+def trace_cached(reader, filename, positions, tracer=None):
+    """
+    Trace the seeds through the on-disk streamline cache
+    :param filename: dataset file feeding the reader
+    :param tracer: function tracing a list of seed positions, a single
+                   tracer by default
+    :return: polydata holding one polyline per seed
+    """
+    if tracer is None:
+        def tracer(seeds):
+            return trace(reader, seeds)
+    # the traced lines carry every loaded point array
+    pd = reader.GetOutput().GetPointData()
+    arrays = [(pd.GetArrayName(i), pd.GetArray(i).GetDataTypeAsString())
+              for i in range(pd.GetNumberOfArrays())]
+    return streamcache.cached(lambda: tracer(positions), filename, positions,
+                              streamcache.settings(makeStreamer(reader)), arrays)
+
+
+# dataset of a worker process, loaded once by _init_worker
+_reader = None
+
+
+def _init_worker(filename, arrays, float32, fields, cache):
+    global _reader
+    _reader = trainio.read(filename, arrays, float32, cache)
+    derived.attach(_reader.GetOutput(), fields, filename if cache else None, float32)
+
+
+def _trace_block(block):
+    (first, positions) = block
+    part = to_arrays(trace(_reader, positions))
+    # seed ids are local to the block, shift them back to global ids
+    for (name, values) in part["cell_data"]:
+        if name == "SeedIds":
+            values += first
+    return part
+
+
+def trace_parallel(filename, positions, workers, arrays=trainio.session_arrays, float32=False, fields=(),
+                   cache=True):
+    """
+    Trace the seeds in a pool of worker processes. Each worker maps the raw
+    cache of the dataset and traces a contiguous block of seeds, so merging
+    the blocks in order keeps the polylines in seed order.
+    :param workers: number of worker processes
+    :param fields: derived point arrays the lines carry, see derived.py
+    :param cache: use the raw and derived caches of the dataset, otherwise
+                  every worker parses the dataset
+    :return: polydata holding one polyline per seed
+    """
+    if cache:
+        # the caches are built here, so the workers only ever map them
+        reader = trainio.read(filename, arrays, float32)
+        derived.attach(reader.GetOutput(), fields, filename, float32)
+
+    blocks = list()
+    for ids in np.array_split(np.arange(len(positions)), workers):
+        if len(ids):
+            blocks.append((int(ids[0]), [positions[i] for i in ids]))
+
+    # spawn rather than fork: the parent may already hold a GUI and a GL context
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(blocks), mp_context=context,
+                             initializer=_init_worker, initargs=(filename, arrays, float32, fields, cache)) as pool:
+        return from_arrays(list(pool.map(_trace_block, blocks)))
+
+
+def compare(a, b):
+    """
+    Whether two flattened sets of polylines are bit-identical
+    """
+    for key in ("points", "offsets", "connectivity"):
+        if not np.array_equal(a[key], b[key]):
+            return False
+    for key in ("point_data", "cell_data"):
+        if [n for (n, _) in a[key]] != [n for (n, _) in b[key]]:
+            return False
+        for ((_, x), (_, y)) in zip(a[key], b[key]):
+            if not np.array_equal(x, y):
+                return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    seeds = seed_positions()
+    reader = trainio.read(args.train_file)
+
+    start = time.perf_counter()
+    serial = trace(reader, seeds)
+    print("serial:     %8.2f s" % (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    parallel = trace_parallel(args.train_file, seeds, args.workers)
+    print("%2d workers: %8.2f s" % (args.workers, time.perf_counter() - start))
+
+    print("identical:  " + str(compare(to_arrays(serial), to_arrays(parallel))))
@@ -5,289 +5,281 @@
 # Luke Jiang
 # 04/25/2020
 
-# python train.py train-small.vtu
+# python train.py train-small.vtu [--arrays <name> ...] [--float32] [--no-cache] [--separate-streamlines]
+#                       [--workers <n>] [--no-stream-cache]
+#                       [--smooth-kernel box|gaussian|savgol] [--smooth-width <n>]
+#                       [--slice-stack] [--slice-cache-mb <n>] [--slice-spill <dir>] [--frame-stats]
+#                       [--lod [<triangles> ...]] [--derived [velocity_magnitude] [vorticity]]
+#                       [--chunked] [--memory-mb <n>] [--chunk-cells <n>]
+#                       [--seeding grid|adaptive] [--seed-budget <n>] [--seed-field velocity_magnitude|vorticity]
+#                       [--record <session>]
 
 import vtk
 import sys
+import numpy as np
+from vtk.util import numpy_support
 import argparse
-import math
+import time
+import multiprocessing
 from datetime import datetime
 
 from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QSlider, QGridLayout, QLabel, QPushButton, \
-    QLineEdit, QTextEdit, QCheckBox
+    QLineEdit, QTextEdit, QCheckBox, QComboBox
 import PyQt5.QtCore as QtCore
 from PyQt5.QtCore import Qt
 from vtk.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
 
-
-# color map for pressure
-pressure_colormap = [[0.908456, 0.231373, 0.298039, 0.752941],
-                      [0.989821, 0.865003, 0.865003, 0.865003],
-                      [1.07119, 0.705882, 0.015686, 0.14902]]
-
-# color map for velocity
-velocity_colormap = [[0.0, 0, 1, 1],
-                     [0.218395, 0, 0, 1],
-                     [0.241661, 0, 0, 0.502],
-                     [0.266927, 1, 0, 0],
-                     [0.485321, 1, 1, 0]]
-
-# range of the input data set
-datarange = [(-23274., -11937., 0.), (46753., 11875., 13427.)]
-
-# default sampling resolution
-init_resolution = 100
-
-init_plane_position = 11740
-
-# default camera position
-init_cam_pos = [(11739.94921875, -30.8115234375, 151939.9891022906),
-                (11739.94921875, -30.8115234375, 6713.68798828125),
-                (0.0, 1.0, 0.0),
-                (130413.79900618957, 164222.48404136402)]
-
-DATA_PRESSURE = 0
-DATA_VELOCITY = 1
-
-
-def read(filename):
-    reader = vtk.vtkXMLUnstructuredGridReader()
-    reader.SetFileName(filename)
-    reader.Update()
-    # print(reader.GetOutput())
-    # tmp = getValues([reader.GetOutput(), 1], [-22600, -11172, 100, 50, 50, 0, 10])
-    # print(tmp)
-    # graph()
-    return reader
-
-
-def drawLine(p0, p1):
+from probe import ProbeEngine
+from dataset import TrainData
+from slicing import SliceEngine, SliceStack, cut_parallel
+from trainio import read, read_header, memory_report
+from chunks import ChunkStore, ChunkedProbe, ChunkedSlicer
+import chunks
+import tracing
+import seeding
+import regionstats
+import smoothing
+import derived
+import surface
+from lineexport import LineWriter
+from probelines import ProbeLines
+from session import SessionRecorder
+from scene import datarange, init_resolution, max_resolution, init_line_name, init_plane_position, \
+    plane_positions, init_cam_pos, DATA_PRESSURE, DATA_VELOCITY, DATA_VELOCITY_MAGNITUDE, \
+    makePlane, makeTrain, makeStream
+
+
+class ChartWindow(QWidget):
     """
-    Draw a line from point p0 to p1.
-    :param p0: starting point
-    :param p1: ending point
-    :return: an actor
+    Non-blocking window charting pressure and velocity magnitude along the
+    probe lines. Every line has a table, created once, and every plot only
+    swaps the table columns for zero-copy views of the sampled arrays. The
+    plots are rebuilt when lines are added or removed.
     """
-    (x0, y0, z0) = p0
-    (x1, y1, z1) = p1
-    linesrc = vtk.vtkLineSource()
-    linesrc.SetPoint1(x0, y0, z0)
-    linesrc.SetPoint2(x1, y1, z1)
-    linesrc.Update()
-
-    mapper = vtk.vtkPolyDataMapper()
-    mapper.SetInputConnection(linesrc.GetOutputPort())
-
-    actor = vtk.vtkActor()
-    actor.SetMapper(mapper)
-    actor.GetProperty().SetColor(0.2, 0.2, 0.2)
-    actor.GetProperty().SetLineWidth(4)
-
-    return linesrc, actor
-
 
-def sample_along_line(dataset, points):
+    def __init__(self, parent=None):
+        QWidget.__init__(self, parent)
+        self.setWindowTitle("Pressure and Velocity Magnitude")
+        self.resize(1000, 800)
+
+        self.gridlayout = QGridLayout(self)
+        self.vtkWidget = QVTKRenderWindowInteractor(self)
+        self.gridlayout.addWidget(self.vtkWidget, 0, 0)
+
+        self.view = vtk.vtkContextView()
+        self.view.SetRenderWindow(self.vtkWidget.GetRenderWindow())
+        self.view.SetInteractor(self.vtkWidget.GetRenderWindow().GetInteractor())
+
+        self.chart = vtk.vtkChartXY()
+        self.chart.SetShowLegend(True)
+        self.chart.SetTitle("Pressure and Velocity Magnitude vs. Location")
+        self.chart.GetTitleProperties().SetFontSize(25)
+        self.view.GetScene().AddItem(self.chart)
+
+        # per line name: table, x column, buffers and smoothed copies
+        self.names = list()
+        self.tables = dict()
+        self.x = dict()
+        self.buffers = dict()
+        self.smoothed = dict()
+        self.initialized = False
+
+    def setup(self, lines):
+        """
+        One table and a pressure and a velocity plot per line
+        """
+        self.chart.ClearPlots()
+        self.names = [name for (name, _, _) in lines]
+        for (name, color, _) in lines:
+            if name not in self.tables:
+                table = vtk.vtkTable()
+                for column in ["X", "Pressure", "V_mag"]:
+                    arr = vtk.vtkFloatArray()
+                    arr.SetName(column)
+                    table.AddColumn(arr)
+                self.tables[name] = table
+            for (column, label, dashed) in [("Pressure", " pressure", False), ("V_mag", " velocity", True)]:
+                line = self.chart.AddPlot(vtk.vtkChart.LINE)
+                line.SetInputData(self.tables[name], "X", column)
+                line.SetLabel(name + label)
+                line.SetColor(*color)
+                line.SetWidth(2.0)
+                if dashed:
+                    line.GetPen().SetLineType(vtk.vtkPen.DASH_LINE)
+        for name in list(self.tables):
+            if name not in self.names:
+                for d in (self.tables, self.x, self.buffers, self.smoothed):
+                    d.pop(name, None)
+
+    def plot(self, lines, smooth=None):
+        """
+        Replace the plotted samples and show the window
+        :param lines: list of (name, (r, g, b), samples) of the lines to plot
+        :param smooth: (kernel, width) to smooth the plot with, see smoothing.py
+        """
+        if [name for (name, _, _) in lines] != self.names:
+            self.setup(lines)
+
+        for (name, _, data) in lines:
+            [locations, pressures, velocities] = data
+            numPoints = min(len(locations), len(pressures))
+
+            if smooth is not None:
+                # smoothed copies go to buffers reused from plot to plot
+                smoothed = self.smoothed.get(name)
+                if smoothed is None or len(smoothed[0]) != len(pressures):
+                    smoothed = self.smoothed[name] = [np.empty(len(pressures)), np.empty(len(velocities))]
+                (kernel, width) = smooth
+                [pressures, velocities] = smoothing.smooth([pressures, velocities], kernel, width, smoothed)
+
+            if len(self.x.get(name, ())) != numPoints:
+                self.x[name] = np.arange(numPoints, dtype=np.float64)
+
+            # the columns wrap the NumPy buffers directly, replacing a column by
+            # name keeps its position in the table
+            self.buffers[name] = [self.x[name],
+                                  np.ascontiguousarray(pressures[:numPoints]),
+                                  np.ascontiguousarray(velocities[:numPoints])]
+            table = self.tables[name]
+            for (column, values) in zip(["X", "Pressure", "V_mag"], self.buffers[name]):
+                arr = numpy_support.numpy_to_vtk(values)
+                arr.SetName(column)
+                table.GetRowData().AddArray(arr)
+            table.Modified()
+        self.chart.RecalculateBounds()
+
+        self.show()
+        self.raise_()
+        if not self.initialized:
+            self.vtkWidget.Initialize()
+            self.initialized = True
+        self.vtkWidget.GetRenderWindow().Render()
+
+
+class SampleThread(QtCore.QThread):
     """
-    Sample pressure and velocity magnitude along a line
-    :param dataset: the dataset that contains two arrays
-    :param points: [start_x, start_y, start_z, x_step, y_step, z_step, total_points]
-    :return: three arrays storing location, pressure and velocity
-             magnitude data
+    Samples lines on a background thread so the main view stays responsive
     """
-    locator = vtk.vtkPointLocator()
-    locator.SetDataSet(dataset)
-    locator.BuildLocator()
-
-    pressureArr = dataset.GetPointData().GetArray(DATA_PRESSURE)
-    velocityArr = dataset.GetPointData().GetArray(DATA_VELOCITY)
-
-    locations = list()
-    velocities = list()
-    pressures = list()
-
-    [x, y, z, xs, ys, zs, step] = points
-    for i in range(0, step):
-        xi = x + xs * i
-        yi = y + ys * i
-        zi = z + zs * i
-        id = locator.FindClosestPoint(xi, yi, zi)
-
-        (p,) = pressureArr.GetTuple(id)
-        (vx, vy, vz) = velocityArr.GetTuple(id)
-        v = math.sqrt(vx ** 2 + vy ** 2 + vz ** 2)
-        pressures.append(p)
-        velocities.append(v)
-        locations.append((xi, yi, zi))
-
-    return [locations, pressures, velocities]
-
-
-def LPF(data):
+    progress = QtCore.pyqtSignal(float)
+    sampled = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, probe, lines, interpolate):
+        """
+        :param lines: list of (name, settings) of the lines to sample, see
+                      ProbeLine.settings()
+        """
+        QtCore.QThread.__init__(self)
+        self.probe = probe
+        self.lines = lines
+        self.interpolate = interpolate
+
+    def run(self):
+        total = float(sum(settings[2] for (_, settings) in self.lines))
+        done = 0
+        results = list()
+        for (name, settings) in self.lines:
+            (p0, p1, step, interpolate) = settings
+
+            def progress(fraction):
+                self.progress.emit((done + fraction * step) / total)
+            try:
+                results.append((name, settings, self.probe.sample_line(p0, p1, step, interpolate, progress)))
+            except MemoryError as e:
+                # the chunks of a chunked dataset do not fit in its memory budget
+                self.failed.emit(str(e))
+                return
+            done += step
+        self.sampled.emit(results)
+
+
+class StatisticsThread(QtCore.QThread):
     """
-    1-D Low Pass Filter that averages out the data to be plotted
+    Reduces the statistics of a region on a background thread
     """
-    data1 = list.copy(data)
-    num = len(data) - 1
-    for i in range(1, num):
-        data1[i] = (data[i - 1] + data[i] + data[i + 1]) / 3
-    data1[0] = data[0]
-    data1[num] = data[num]
-    return data1
+    computed = QtCore.pyqtSignal(object)
+
+    def __init__(self, compute):
+        """
+        :param compute: function returning a dict of field name -> Summary
+        """
+        QtCore.QThread.__init__(self)
+        self.compute = compute
+
+    def run(self):
+        summaries = self.compute()
+        self.computed.emit(dict((name, s.report()) for (name, s) in summaries.items()))
 
 
-def graph(data, smooth=False):
+class SliceStackThread(QtCore.QThread):
     """
-    Showing the graph the velocity and pressure functions in a new view
+    Cuts the plane slices in worker processes on a background thread
     """
-    table = vtk.vtkTable()
-    arrX = vtk.vtkFloatArray()
-    arrX.SetName("X")
-    table.AddColumn(arrX)
-    arrP = vtk.vtkFloatArray()
-    arrP.SetName("Pressure")
-    table.AddColumn(arrP)
-    arrV = vtk.vtkFloatArray()
-    arrV.SetName("V_mag")
-    table.AddColumn(arrV)
-
-    [locations, pressures, velocities] = data
-    numPoints = min(len(locations), len(pressures))
-
-    if smooth:
-        velocities = LPF(velocities)
-        pressures = LPF(pressures)
-
-    table.SetNumberOfRows(numPoints)
-    for i in range(0, numPoints):
-        table.SetValue(i, 0, i)
-        table.SetValue(i, 1, pressures[i])
-        table.SetValue(i, 2, velocities[i])
-
-    view = vtk.vtkContextView()
-    chart = vtk.vtkChartXY()
-    chart.SetShowLegend(True)
-    chart.SetTitle("Pressure and Velocity Magnitude vs. Location")
-    chart.GetTitleProperties().SetFontSize(25)
-    view.GetScene().AddItem(chart)
-
-    line1 = chart.AddPlot(vtk.vtkChart.LINE)
-    line1.SetInputData(table, "X", "Pressure")
-    line1.SetColor(166, 101, 174)
-    line1.SetWidth(2.0)
-
-    line2 = chart.AddPlot(vtk.vtkChart.LINE)
-    line2.SetInputData(table, "X", "V_mag")
-    line2.SetColor(230, 54, 56)
-    line2.SetWidth(2.0)
-
-    view.GetRenderWindow().SetSize(1000, 800)
-    view.GetInteractor().Initialize()
-    view.GetInteractor().Start()
-
-
-def makePlane(reader):
-    lut = vtk.vtkColorTransferFunction()
-    lut.SetColorSpaceToRGB()
-    for [val, R, G, B] in pressure_colormap:
-        lut.AddRGBPoint(val, R, G, B)
-
-    plane = vtk.vtkPlane()
-    plane.SetOrigin(init_plane_position, -30, 6713)
-    plane.SetNormal(1.0, 0, 0)
-
-    planeCut = vtk.vtkCutter()
-    planeCut.SetInputConnection(reader.GetOutputPort())
-    planeCut.SetCutFunction(plane)
-
-    mapper = vtk.vtkDataSetMapper()
-    mapper.SetInputConnection(planeCut.GetOutputPort())
-    mapper.SetScalarModeToUsePointFieldData()
-    mapper.SelectColorArray(DATA_PRESSURE)
-    mapper.SetLookupTable(lut)
-
-    actor = vtk.vtkActor()
-    actor.SetMapper(mapper)
-    actor.GetProperty().SetOpacity(0)
-
-    return plane, actor
-
-
-def makeTrain(reader):
+    progress = QtCore.pyqtSignal(int, int)
+    computed = QtCore.pyqtSignal(float, object)
+
+    def __init__(self, filename, positions, workers, arrays, float32, cache):
+        QtCore.QThread.__init__(self)
+        self.args = (filename, positions, workers, arrays, float32, cache)
+        self.cancelled = False
+
+    def run(self):
+        (filename, positions, workers, arrays, float32, cache) = self.args
+        cuts = cut_parallel(filename, positions, workers, arrays, float32, cache)
+        for (done, (x, part)) in enumerate(cuts, 1):
+            self.computed.emit(x, part)
+            self.progress.emit(done, len(positions))
+            if self.cancelled:
+                cuts.close()
+                break
+
+
+class RenderScheduler(object):
     """
-    Render the train dataset, colored using pressure value
+    Coalesces render requests: all requests made while handling events are
+    served by a single render once control is back in the event loop
     """
-    lut = vtk.vtkColorTransferFunction()
-    lut.SetColorSpaceToRGB()
-    for [val, R, G, B] in pressure_colormap:
-        lut.AddRGBPoint(val, R, G, B)
 
-    plane = vtk.vtkPlane()
-    plane.SetOrigin(11740, -30, 6713)
-    plane.SetNormal(1.0, 0, 0)
+    def __init__(self, renderWindow):
+        self.renderWindow = renderWindow
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.render)
 
-    mapper = vtk.vtkDataSetMapper()
-    mapper.SetInputConnection(reader.GetOutputPort())
-    mapper.SetScalarModeToUsePointFieldData()
-    mapper.SelectColorArray(DATA_PRESSURE)
-    mapper.SetLookupTable(lut)
+    def request(self):
+        if not self.timer.isActive():
+            self.timer.start()
 
-    actor = vtk.vtkActor()
-    actor.SetMapper(mapper)
-    actor.GetProperty().SetOpacity(0.7)
+    def render(self):
+        self.renderWindow.Render()
 
-    return actor
 
-
-def makeStream(reader):
+def frame_stats(renderer):
     """
-    Create streamlines for the data set, colored by velocity magnitude
+    Triangles and line segments submitted by the visible actors of a renderer
     """
-    arrow = vtk.vtkArrowSource()
-    arrow.SetTipLength(0.1)
-    arrow.SetShaftRadius(0.0001)
-
-    lut = vtk.vtkColorTransferFunction()
-    lut.SetColorSpaceToRGB()
-    for [val, R, G, B] in velocity_colormap:
-        lut.AddRGBPoint(val, R, G, B)
-
-    colorBar = vtk.vtkScalarBarActor()
-    colorBar.SetOrientationToHorizontal()
-    colorBar.SetTitle("Velocity Magnitude")
-    colorBar.SetNumberOfLabels(4)
-    colorBar.SetMaximumHeightInPixels(300)
-    colorBar.SetMaximumWidthInPixels(140)
-    colorBar.SetLookupTable(lut)
-    colorBarWidget = vtk.vtkScalarBarWidget()
-    colorBarWidget.SetScalarBarActor(colorBar)
-
-    streamerActors = list()
-
-    for x in range(-20000, 10000, 2000):
-        for z in range(0, 8000, 1000):
-            y = -10000
-            integ = vtk.vtkRungeKutta4()
-            streamer = vtk.vtkStreamTracer()
-            # streamer.SetInputConnection(reader.GetOutputPort())
-            streamer.SetInputConnection(reader.GetOutputPort())
-            streamer.SetStartPosition(x, y, z)
-            streamer.SetMaximumPropagation(250000)
-            streamer.SetIntegrationDirectionToForward()
-            streamer.SetIntegrator(integ)
-            streamer.SetComputeVorticity(True)
-
-            streamerMapper = vtk.vtkPolyDataMapper()
-            streamerMapper.SetInputConnection(streamer.GetOutputPort())
-            streamerMapper.SetLookupTable(lut)
-            streamerMapper.SetScalarModeToUsePointFieldData()
-            streamerMapper.SelectColorArray(DATA_VELOCITY)
-
-            streamerActor = vtk.vtkActor()
-            streamerActor.SetMapper(streamerMapper)
-
-            streamerActors.append(streamerActor)
-
-    return streamerActors, colorBarWidget
+    triangles = 0
+    lines = 0
+    actors = renderer.GetActors()
+    actors.InitTraversal()
+    for _ in range(actors.GetNumberOfItems()):
+        actor = actors.GetNextActor()
+        if not actor.GetVisibility() or actor.GetMapper() is None:
+            continue
+        mapper = actor.GetMapper()
+        data = mapper.GetInput()
+        if isinstance(mapper, vtk.vtkDataSetMapper) and not isinstance(data, vtk.vtkPolyData):
+            # surface extracted by the mapper, once it has rendered
+            inner = mapper.GetPolyDataMapper()
+            data = inner.GetInput() if inner is not None else None
+        if isinstance(data, vtk.vtkPolyData):
+            polys = data.GetPolys()
+            # every polygon of n points is drawn as n - 2 triangles
+            triangles += polys.GetNumberOfConnectivityIds() - 2 * polys.GetNumberOfCells()
+            conn = data.GetLines()
+            lines += conn.GetNumberOfConnectivityIds() - conn.GetNumberOfCells()
+    return triangles, lines
 
 
 class Ui_MainWindow(object):
@@ -308,8 +300,11 @@ class Ui_MainWindow(object):
         self.plane_mode.setChecked(False)
         self.smooth = QCheckBox()
         self.smooth.setChecked(False)
+        self.interpolate = QCheckBox()
+        self.interpolate.setChecked(False)
 
-        # start and end points of the line
+        # name, start and end points of the current line
+        self.line_name = QLineEdit()
         self.x0_val = QLineEdit()
         self.y0_val = QLineEdit()
         self.z0_val = QLineEdit()
@@ -345,14 +340,22 @@ class Ui_MainWindow(object):
         self.push_saveCamPos.setText("save camera position")
         self.push_resetLine = QPushButton()
         self.push_resetLine.setText("reset line")
+        self.push_removeLine = QPushButton()
+        self.push_removeLine.setText("remove line")
         self.push_resetCamPos = QPushButton()
         self.push_resetCamPos.setText("reset camera position")
+        self.push_statistics = QPushButton()
+        self.push_statistics.setText("statistics")
+
+        # region the statistics are computed over
+        self.stats_region = QComboBox()
+        self.stats_region.addItems(["grid", "line", "plane"])
 
         # log
         self.log = QTextEdit()
         self.log.setReadOnly(True)
 
-        self.gridlayout.addWidget(self.vtkWidget, 0, 0, 19, 11)
+        self.gridlayout.addWidget(self.vtkWidget, 0, 0, 23, 11)
 
         self.gridlayout.addWidget(QLabel("Show Colorbar"), 0, 11, 1, 1)
         self.gridlayout.addWidget(self.show_colorbar, 0, 12, 1, 1)
@@ -363,36 +366,46 @@ class Ui_MainWindow(object):
         self.gridlayout.addWidget(QLabel("Smooth Plot"), 3, 11, 1, 1)
         self.gridlayout.addWidget(self.smooth, 3, 12, 1, 1)
 
-        self.gridlayout.addWidget(QLabel("x0"), 4, 11, 1, 1)
-        self.gridlayout.addWidget(self.x0_val, 4, 12, 1, 1)
-        self.gridlayout.addWidget(QLabel("y0"), 5, 11, 1, 1)
-        self.gridlayout.addWidget(self.y0_val, 5, 12, 1, 1)
-        self.gridlayout.addWidget(QLabel("z0"), 6, 11, 1, 1)
-        self.gridlayout.addWidget(self.z0_val, 6, 12, 1, 1)
-
-        self.gridlayout.addWidget(QLabel("x1"), 7, 11, 1, 1)
-        self.gridlayout.addWidget(self.x1_val, 7, 12, 1, 1)
-        self.gridlayout.addWidget(QLabel("y1"), 8, 11, 1, 1)
-        self.gridlayout.addWidget(self.y1_val, 8, 12, 1, 1)
-        self.gridlayout.addWidget(QLabel("z1"), 9, 11, 1, 1)
-        self.gridlayout.addWidget(self.z1_val, 9, 12, 1, 1)
-
-        self.gridlayout.addWidget(QLabel("Sample Resolution"), 10, 11, 1, 1)
-        self.gridlayout.addWidget(self.res_val, 10, 12, 1, 1)
-        self.gridlayout.addWidget(self.resolution, 11, 11, 1, 2)
-
-        self.gridlayout.addWidget(QLabel("Plane Position"), 12, 11, 1, 1)
-        self.gridlayout.addWidget(self.ppos_val, 12, 12, 1, 1)
-        self.gridlayout.addWidget(self.plane_position, 13, 11, 1, 2)
-
-        self.gridlayout.addWidget(self.push_plot, 14, 11, 1, 1)
-        self.gridlayout.addWidget(self.push_drawLine, 14, 12, 1, 1)
-        self.gridlayout.addWidget(self.push_saveData, 15, 11, 1, 1)
-        self.gridlayout.addWidget(self.push_saveCamPos, 15, 12, 1, 1)
-        self.gridlayout.addWidget(self.push_resetLine, 16, 11, 1, 1)
-        self.gridlayout.addWidget(self.push_resetCamPos, 16, 12, 1, 1)
-
-        self.gridlayout.addWidget(self.log, 17, 11, 2, 2)
+        self.gridlayout.addWidget(QLabel("Interpolate Plot"), 4, 11, 1, 1)
+        self.gridlayout.addWidget(self.interpolate, 4, 12, 1, 1)
+
+        self.gridlayout.addWidget(QLabel("Line"), 5, 11, 1, 1)
+        self.gridlayout.addWidget(self.line_name, 5, 12, 1, 1)
+
+        self.gridlayout.addWidget(QLabel("x0"), 6, 11, 1, 1)
+        self.gridlayout.addWidget(self.x0_val, 6, 12, 1, 1)
+        self.gridlayout.addWidget(QLabel("y0"), 7, 11, 1, 1)
+        self.gridlayout.addWidget(self.y0_val, 7, 12, 1, 1)
+        self.gridlayout.addWidget(QLabel("z0"), 8, 11, 1, 1)
+        self.gridlayout.addWidget(self.z0_val, 8, 12, 1, 1)
+
+        self.gridlayout.addWidget(QLabel("x1"), 9, 11, 1, 1)
+        self.gridlayout.addWidget(self.x1_val, 9, 12, 1, 1)
+        self.gridlayout.addWidget(QLabel("y1"), 10, 11, 1, 1)
+        self.gridlayout.addWidget(self.y1_val, 10, 12, 1, 1)
+        self.gridlayout.addWidget(QLabel("z1"), 11, 11, 1, 1)
+        self.gridlayout.addWidget(self.z1_val, 11, 12, 1, 1)
+
+        self.gridlayout.addWidget(QLabel("Sample Resolution"), 12, 11, 1, 1)
+        self.gridlayout.addWidget(self.res_val, 12, 12, 1, 1)
+        self.gridlayout.addWidget(self.resolution, 13, 11, 1, 2)
+
+        self.gridlayout.addWidget(QLabel("Plane Position"), 14, 11, 1, 1)
+        self.gridlayout.addWidget(self.ppos_val, 14, 12, 1, 1)
+        self.gridlayout.addWidget(self.plane_position, 15, 11, 1, 2)
+
+        self.gridlayout.addWidget(self.push_plot, 16, 11, 1, 1)
+        self.gridlayout.addWidget(self.push_drawLine, 16, 12, 1, 1)
+        self.gridlayout.addWidget(self.push_saveData, 17, 11, 1, 1)
+        self.gridlayout.addWidget(self.push_saveCamPos, 17, 12, 1, 1)
+        self.gridlayout.addWidget(self.push_resetLine, 18, 11, 1, 1)
+        self.gridlayout.addWidget(self.push_resetCamPos, 18, 12, 1, 1)
+        self.gridlayout.addWidget(self.push_removeLine, 19, 11, 1, 1)
+        self.gridlayout.addWidget(self.push_statistics, 19, 12, 1, 1)
+        self.gridlayout.addWidget(QLabel("Statistics Region"), 20, 11, 1, 1)
+        self.gridlayout.addWidget(self.stats_region, 20, 12, 1, 1)
+
+        self.gridlayout.addWidget(self.log, 21, 11, 2, 2)
 
         MainWindow.setCentralWidget(self.centralWidget)
 
@@ -404,25 +417,91 @@ class Demo(QMainWindow):
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
 
-        self.p0 = datarange[0]
-        self.p1 = datarange[1]
-        self.dataCache = None
+        # named probe lines, the endpoint fields edit the current one
+        self.lines = ProbeLines()
+        self.lines.set(init_line_name, datarange[0], datarange[1], init_resolution)
+        self.line = init_line_name
         self.resolution = init_resolution
         self.plane_position = init_plane_position
         self.filename = margs.train_file
         self.camPos = init_cam_pos
         self.LPFen = False
-
-        self.reader = read(self.filename)
-        self.trainActor = makeTrain(self.reader)
-        self.plane, self.planeActor = makePlane(self.reader)
-        self.streamerActors, self.streamline_colorbar = makeStream(self.reader)
-        self.linesrc, self.lineActor = drawLine(self.p0, self.p1)
+        self.smoothing = (margs.smooth_kernel, margs.smooth_width)
+        self.interpolate = False
+        self.sampler = None
+        self.writer = None
+        self.chart = ChartWindow()
+        self.statistics = regionstats.StatisticsCache(None if margs.no_cache else self.filename)
+        self.statsThread = None
+        self.workers = margs.workers
+
+        self.store = None
+        if margs.chunked:
+            self.load_chunked(margs)
+        else:
+            self.load(margs)
+        start = time.perf_counter()
+        if self.store is not None:
+            outer = self.store.surface()
+        elif margs.no_cache:
+            outer = surface.external_surface(self.reader.GetOutput())
+        else:
+            (outer, _) = surface.cached_surface(self.filename, self.reader.GetOutput())
+        self.trainActor, self.trainLevels = makeTrain(outer, margs.lod)
+        self.lodLevel = len(self.trainLevels) - 1
+        self.print_log("-Train surface (%d levels of detail) ready in %.2f s:"
+                       % (len(self.trainLevels), time.perf_counter() - start))
+        for mapper in self.trainLevels:
+            self.print_log("  * %d triangles" % mapper.GetInput().GetNumberOfPolys())
+        start = time.perf_counter()
+        self.planeActor = makePlane(self.slicer)
+        self.print_log("-Plane cut ready in %.2f s" % (time.perf_counter() - start))
+        self.slice_stack = None
+        self.slice_thread = None
+        if margs.slice_stack:
+            self.slice_stack = SliceStack(margs.slice_cache_mb << 20, margs.slice_spill)
+            # slices next to the current plane position first
+            positions = sorted(plane_positions, key=lambda x: abs(x - self.plane_position))
+            workers = multiprocessing.cpu_count()
+            self.slice_thread = SliceStackThread(self.filename, positions, workers, margs.arrays, margs.float32,
+                                                 not margs.no_cache)
+            self.slice_thread.computed.connect(self.slice_computed_callback)
+            self.slice_thread.progress.connect(self.slice_progress_callback)
+            self.slice_start = time.perf_counter()
+            self.slice_thread.start()
+            self.print_log("-Precomputing %d plane slices with %d workers" % (len(positions), workers))
+        start = time.perf_counter()
+        tracer = None
+        if self.store is not None:
+            # pages in the chunks along every streamline, not cached
+            def tracer(seeds):
+                return chunks.trace(self.store, seeds)
+        elif margs.workers > 1:
+            def tracer(seeds):
+                return tracing.trace_parallel(self.filename, seeds, margs.workers, margs.arrays, margs.float32,
+                                              margs.derived, not margs.no_cache)
+        lines = None
+        if margs.seeding == 'adaptive':
+            # a budget of lines seeded by importance around the train body
+            if margs.no_stream_cache:
+                (lines, stats) = seeding.trace_adaptive(self.reader, margs.seed_budget, margs.seed_field)
+                self.print_log("-Adaptive seeding: %(candidates)d candidate seeds, %(traced)d traced, "
+                               "%(skipped)d skipped, %(duplicates)d duplicate lines dropped" % stats)
+            else:
+                lines = seeding.trace_cached(self.reader, self.filename, margs.seed_budget, margs.seed_field)
+        self.streamerActors, self.streamline_colorbar = makeStream(self.reader, not margs.separate_streamlines,
+                                                                   tracer,
+                                                                   None if margs.no_stream_cache or margs.chunked
+                                                                   else self.filename,
+                                                                   lines)
+        self.print_log("-Streamlines traced in %.2f s (%d actors)"
+                       % (time.perf_counter() - start, len(self.streamerActors)))
+        self.print_chunk_stats()
 
         self.ren = vtk.vtkRenderer()
         self.ren.AddActor(self.trainActor)
         self.ren.AddActor(self.planeActor)
-        self.ren.AddActor(self.lineActor)
+        self.ren.AddActor(self.lines.actor)
         for i in self.streamerActors:
             self.ren.AddActor(i)
 
@@ -431,6 +510,21 @@ class Demo(QMainWindow):
 
         self.ui.vtkWidget.GetRenderWindow().AddRenderer(self.ren)
         self.iren = self.ui.vtkWidget.GetRenderWindow().GetInteractor()
+        self.firstFrame = self.ren.AddObserver("EndEvent", self.first_frame_callback)
+        if len(self.trainLevels) > 1:
+            # coarse levels while the camera moves, at the interactor's desired update rate
+            self.iren.SetDesiredUpdateRate(30)
+            self.ren.AddObserver("StartEvent", self.lod_start_callback)
+            self.ren.AddObserver("EndEvent", self.lod_end_callback)
+        self.scheduler = RenderScheduler(self.ui.vtkWidget.GetRenderWindow())
+        self.frameStats = None
+        if margs.frame_stats:
+            self.frameStats = vtk.vtkTextActor()
+            self.frameStats.GetTextProperty().SetFontSize(14)
+            self.frameStats.GetTextProperty().SetColor(0, 0, 0)
+            self.frameStats.SetDisplayPosition(10, 10)
+            self.ren.AddViewProp(self.frameStats)
+            self.ren.AddObserver("EndEvent", self.frame_stats_callback)
 
         self.streamline_colorbar.SetInteractor(self.iren)
         self.streamline_colorbar.On()
@@ -443,7 +537,7 @@ class Demo(QMainWindow):
             slider.setTickPosition(QSlider.TicksAbove)
             slider.setRange(bounds[0], bounds[1])
 
-        slider_setup(self.ui.resolution, init_resolution, [50, 200], 5)
+        slider_setup(self.ui.resolution, init_resolution, [50, max_resolution], 5000)
         slider_setup(self.ui.plane_position, (init_plane_position - datarange[0][0])/1000, [0, 70], 2)
 
         def lineEdit_setup(lineEdit, val):
@@ -451,64 +545,247 @@ class Demo(QMainWindow):
             lineEdit.setFixedWidth(150)
             lineEdit.setAlignment(Qt.AlignLeft)
 
-        lineEdit_setup(self.ui.x0_val, self.p0[0])
-        lineEdit_setup(self.ui.y0_val, self.p0[1])
-        lineEdit_setup(self.ui.z0_val, self.p0[2])
-        lineEdit_setup(self.ui.x1_val, self.p1[0])
-        lineEdit_setup(self.ui.y1_val, self.p1[1])
-        lineEdit_setup(self.ui.z1_val, self.p1[2])
+        lineEdit_setup(self.ui.line_name, self.line)
+        lineEdit_setup(self.ui.x0_val, datarange[0][0])
+        lineEdit_setup(self.ui.y0_val, datarange[0][1])
+        lineEdit_setup(self.ui.z0_val, datarange[0][2])
+        lineEdit_setup(self.ui.x1_val, datarange[1][0])
+        lineEdit_setup(self.ui.y1_val, datarange[1][1])
+        lineEdit_setup(self.ui.z1_val, datarange[1][2])
+
+        # camera keyframes and the events changing the view go to a session file, see session.py
+        self.recorder = None
+        if margs.record:
+            self.recorder = SessionRecorder(margs.record, self.filename)
+            self.record_state()
+            self.ren.AddObserver("EndEvent", self.record_camera_callback)
+            self.print_log("-Recording the session to " + margs.record)
+
+    def load(self, margs):
+        """
+        Load the whole grid and its derived fields
+        """
+        start = time.perf_counter()
+        self.reader = read(self.filename, margs.arrays, margs.float32, not margs.no_cache)
+        self.print_log("-Dataset loaded in %.2f s" % (time.perf_counter() - start))
+        start = time.perf_counter()
+        fields = derived.attach(self.reader.GetOutput(), margs.derived,
+                                None if margs.no_cache else self.filename, margs.float32)
+        self.print_log("-Derived fields ready in %.2f s:" % (time.perf_counter() - start))
+        for (name, hit) in fields:
+            self.print_log("  * " + name + (" (cached)" if hit else ""))
+        self.print_log("-Memory usage:")
+        for line in memory_report(self.reader.GetOutput()):
+            self.print_log(line)
+        self.probe = ProbeEngine(self.reader.GetOutput(), DATA_PRESSURE, DATA_VELOCITY, DATA_VELOCITY_MAGNITUDE)
+        # only the cells straddling the plane are cut, see slicing.py
+        self.slicer = SliceEngine(self.reader.GetOutput(), -30, 6713)
+
+    def load_chunked(self, margs):
+        """
+        Page in the chunks of the dataset on demand instead, see chunks.py.
+        Derived fields are not attached, the probe computes the velocity
+        magnitude itself.
+        """
+        self.reader = None
+        if chunks.read_index(self.filename) is None:
+            start = time.perf_counter()
+            index = chunks.convert(self.filename, margs.chunk_cells, margs.memory_mb << 20)
+            self.print_log("-Chunk layout written in %.2f s (%d chunks)"
+                           % (time.perf_counter() - start, len(index["chunks"])))
+        self.store = ChunkStore(self.filename, margs.memory_mb << 20, margs.arrays)
+        self.print_log("-Chunked dataset: %d chunks, %d MB memory budget" % (len(self.store), margs.memory_mb))
+        self.probe = ChunkedProbe(self.store, DATA_PRESSURE, DATA_VELOCITY)
+        self.slicer = ChunkedSlicer(self.store, -30, 6713)
+
+    def record(self, event, **fields):
+        if self.recorder is not None:
+            self.recorder.record(event, **fields)
+
+    def record_line(self, line):
+        self.record("line", name=line.name, p0=list(line.p0), p1=list(line.p1), resolution=line.resolution)
+
+    def record_state(self):
+        """
+        Record the whole view, so a replay starts from it
+        """
+        self.recorder.record_camera(self.ren.GetActiveCamera())
+        self.record("plane", x=self.plane_position)
+        for line in self.lines:
+            self.record_line(line)
+        for (name, box) in [("colorbar", self.ui.show_colorbar), ("streamlines", self.ui.show_streamlines),
+                            ("plane_mode", self.ui.plane_mode)]:
+            self.record("toggle", name=name, value=box.isChecked())
+
+    def record_camera_callback(self, obj, event):
+        self.recorder.record_camera(self.ren.GetActiveCamera(), self.interacting())
 
     def print_log(self, s):
         self.ui.log.insertPlainText(s + "\n")
 
+    def print_chunk_stats(self):
+        if self.store is not None:
+            self.print_log("  * chunks: " + self.store.stats())
+
+    def slice_computed_callback(self, x, part):
+        self.slice_stack.put(x, part)
+
+    def slice_progress_callback(self, done, total):
+        if done % 10 == 0 or done == total:
+            self.print_log("  * %d/%d plane slices (%.1f MB in memory)"
+                           % (done, total, self.slice_stack.nbytes / float(1 << 20)))
+        if done == total:
+            self.print_log("-Plane slices precomputed in %.2f s" % (time.perf_counter() - self.slice_start))
+
+    def closeEvent(self, event):
+        if self.slice_thread is not None:
+            self.slice_thread.cancelled = True
+            self.slice_thread.wait()
+        if self.slice_stack is not None:
+            self.slice_stack.close()
+        if self.writer is not None:
+            self.writer.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.print_log("-Session recorded to %s (%d events)" % (self.recorder.filename, self.recorder.count))
+        QMainWindow.closeEvent(self, event)
+
+    def first_frame_callback(self, obj, event):
+        self.print_log("-First frame rendered in %.1f ms" % (self.ren.GetLastRenderTimeInSeconds() * 1000))
+        self.ren.RemoveObserver(self.firstFrame)
+
+    def interacting(self):
+        # interactor styles raise the desired update rate while the camera moves
+        return self.ui.vtkWidget.GetRenderWindow().GetDesiredUpdateRate() > self.iren.GetStillUpdateRate()
+
+    def lod_start_callback(self, obj, event):
+        level = self.lodLevel if self.interacting() else 0
+        self.trainActor.SetMapper(self.trainLevels[level])
+
+    def lod_end_callback(self, obj, event):
+        # pick the finest level that keeps up with the desired update rate
+        if not self.interacting():
+            return
+        budget = 1.0 / self.iren.GetDesiredUpdateRate()
+        frame = self.ren.GetLastRenderTimeInSeconds()
+        if frame > budget and self.lodLevel < len(self.trainLevels) - 1:
+            self.lodLevel += 1
+        elif frame < budget / 4 and self.lodLevel > 1:
+            self.lodLevel -= 1
+
+    def frame_stats_callback(self, obj, event):
+        # shown with the next frame
+        (triangles, lines) = frame_stats(self.ren)
+        self.frameStats.SetInput("%.1f ms  %d triangles  %d line segments"
+                                 % (self.ren.GetLastRenderTimeInSeconds() * 1000, triangles, lines))
+
     def show_colorbar_callback(self):
         show = self.ui.show_colorbar.isChecked()
         if show:
             self.streamline_colorbar.On()
         else:
             self.streamline_colorbar.Off()
+        self.record("toggle", name="colorbar", value=show)
         self.print_log("-Show color bar: " + ("ON" if show else "OFF"))
-        self.ui.vtkWidget.GetRenderWindow().Render()
+        self.scheduler.request()
 
     def show_streamlines_callback(self):
         show = self.ui.show_streamlines.isChecked()
         for a in self.streamerActors:
-            a.GetProperty().SetOpacity(1 if show else 0)
+            a.SetVisibility(show)
+        self.record("toggle", name="streamlines", value=show)
         self.print_log("-Show streamlines: " + ("ON" if show else "OFF"))
-        self.ui.vtkWidget.GetRenderWindow().Render()
+        self.scheduler.request()
 
     def plane_mode_callback(self):
         show = self.ui.plane_mode.isChecked()
-        if show:
-            self.planeActor.GetProperty().SetOpacity(1)
-            self.trainActor.GetProperty().SetOpacity(0.1)
-        else:
-            self.planeActor.GetProperty().SetOpacity(0)
-            self.trainActor.GetProperty().SetOpacity(0.7)
+        self.planeActor.SetVisibility(show)
+        self.trainActor.GetProperty().SetOpacity(0.1 if show else 0.7)
+        self.record("toggle", name="plane_mode", value=show)
         self.print_log("-Plane Mode: " + ("ON" if show else "OFF"))
-        self.ui.vtkWidget.GetRenderWindow().Render()
+        self.scheduler.request()
 
     def smooth_callback(self):
         self.LPFen = self.ui.smooth.isChecked()
         self.print_log("-Smooth plot option: " + ("ON" if self.LPFen else "OFF"))
+        self.plot_lines()
 
-    def plot_callback(self):
+    def interpolate_callback(self):
+        self.interpolate = self.ui.interpolate.isChecked()
+        self.print_log("-Interpolate plot option: " + ("ON" if self.interpolate else "OFF"))
 
-        step = self.resolution
-        p0 = self.p0
-        p1 = self.p1
-        x = p1[0] - p0[0]
-        y = p1[1] - p0[1]
-        z = p1[2] - p0[2]
-        points_data = [p0[0], p0[1], p0[2], x / step, y / step, z / step, step]
-        data = sample_along_line(self.reader.GetOutput(), points_data)
-        self.dataCache = data
-        self.print_log("-Plotting pressure and velocity along line")
-        p_avg = sum(data[1]) / step
-        v_avg = sum(data[2]) / step
-        self.print_log("Average pressure: " + str(p_avg))
-        self.print_log("Average velocity: " + str(v_avg))
-        graph(data, self.LPFen)
+    def plot_callback(self):
+        if self.sampler is not None and self.sampler.isRunning():
+            self.print_log("-Still sampling the previous lines"); return
+
+        # lines whose samples are up to date are never probed again
+        stale = self.lines.stale(self.interpolate)
+        if not stale:
+            self.print_log("-All lines are sampled, plotting")
+            self.plot_lines()
+            return
+        self.print_log("-Sampling pressure and velocity along " + ", ".join(line.name for line in stale))
+        self.sampleStart = time.perf_counter()
+        self.sampler = SampleThread(self.probe, [(line.name, line.settings(self.interpolate)) for line in stale],
+                                    self.interpolate)
+        self.sampler.progress.connect(self.sample_progress_callback)
+        self.sampler.sampled.connect(self.sampled_callback)
+        self.sampler.failed.connect(self.sample_failed_callback)
+        self.sampler.start()
+
+    def sample_progress_callback(self, fraction):
+        self.statusBar().showMessage("Sampling lines: %d%%" % (fraction * 100))
+
+    def sampled_callback(self, results):
+        self.statusBar().showMessage("Sampled %d points in %.2f s"
+                                     % (sum(len(data[1]) for (_, _, data) in results),
+                                        time.perf_counter() - self.sampleStart))
+        for (name, settings, data) in results:
+            # drop samples of lines removed or changed while sampling
+            if name not in self.lines or self.lines[name].settings(settings[3]) != settings:
+                continue
+            (self.lines[name].samples, self.lines[name].sampled) = (data, settings)
+            self.print_log("-" + name + ":")
+            self.print_log("  * average pressure: " + str(data[1].mean()))
+            self.print_log("  * average velocity: " + str(data[2].mean()))
+        self.print_chunk_stats()
+        self.plot_lines()
+
+    def sample_failed_callback(self, message):
+        # the lines keep their previous samples
+        self.statusBar().showMessage("Sampling failed: out of memory")
+        self.print_log("-Error: sampling failed: " + message)
+        self.print_chunk_stats()
+
+    def plot_lines(self):
+        """
+        Chart every line with samples for its current settings
+        """
+        lines = [(line.name, line.color, line.samples) for line in self.lines if not line.stale(self.interpolate)]
+        if lines:
+            self.chart.plot(lines, self.smoothing if self.LPFen else None)
+
+    def show_line(self, line):
+        """
+        Fill the endpoint fields and the resolution slider from a line
+        """
+        self.line = line.name
+        self.ui.line_name.setText(line.name)
+        for (edit, value) in zip([self.ui.x0_val, self.ui.y0_val, self.ui.z0_val,
+                                  self.ui.x1_val, self.ui.y1_val, self.ui.z1_val], line.p0 + line.p1):
+            edit.setText(str(value))
+        self.ui.resolution.setValue(line.resolution)
+
+    def line_name_callback(self):
+        name = self.ui.line_name.text().strip()
+        if not name:
+            self.ui.line_name.setText(self.line); return
+        if name in self.lines:
+            self.show_line(self.lines[name])
+            self.print_log("-Current line: " + name)
+        else:
+            self.line = name
+            self.print_log("-New line " + name + ", set its endpoints and draw it")
 
     def check_range(self, s):
         self.ui.log.insertPlainText("-Value " + s + " is out of range\n")
@@ -526,7 +803,7 @@ class Demo(QMainWindow):
 
         x1 = float(self.ui.x1_val.text())
         if x1 < datarange[0][0] or x1 > datarange[1][0]:
-            self.ocheck_range("x1"); return
+            self.check_range("x1"); return
         y1 = float(self.ui.y1_val.text())
         if y1 < datarange[0][1] or y1 > datarange[1][1]:
             self.check_range("y1"); return
@@ -534,36 +811,61 @@ class Demo(QMainWindow):
         if z1 < datarange[0][2] or z1 > datarange[1][2]:
             self.check_range("z1"); return
 
-        self.p0 = (x0, y0, z0)
-        self.p1 = (x1, y1, z1)
-        self.linesrc.SetPoint1(x0, y0, z0)
-        self.linesrc.SetPoint2(x1, y1, z1)
-        self.linesrc.Update()
-        self.print_log("-Line drawn from " + str(self.p0) + " to " + str(self.p1))
-        self.ui.vtkWidget.GetRenderWindow().Render()
+        self.line = self.ui.line_name.text().strip() or self.line
+        self.record_line(self.lines.set(self.line, (x0, y0, z0), (x1, y1, z1), self.resolution))
+        self.print_log("-Line " + self.line + " drawn from " + str((x0, y0, z0)) + " to " + str((x1, y1, z1)))
+        self.scheduler.request()
 
     def resolution_callback(self, val):
         oldval = self.resolution
         self.resolution = val
         self.ui.res_val.setText(str(val))
+        if self.line in self.lines:
+            self.lines[self.line].resolution = val
         self.print_log("-Sample resolution changed from " + str(oldval) + " to " + str(val))
 
     def plane_callback(self, val):
         oldval = self.plane_position
-        self.plane_position = val * 1000 + datarange[0][0]
+        position = val * 1000 + datarange[0][0]
+        mapper = self.planeActor.GetMapper()
+        cut = self.slice_stack.get(position) if self.slice_stack is not None else None
+        if cut is None:
+            try:
+                self.slicer.cut(position)
+            except MemoryError as e:
+                # the chunks of a chunked dataset do not fit in its memory budget, keep the last cut
+                self.statusBar().showMessage("Plane cut failed: out of memory")
+                self.print_log("-Error: cannot cut the plane at x = " + str(position) + ": " + str(e))
+                self.print_chunk_stats()
+                return
+        self.plane_position = position
         self.ui.ppos_val.setText(str(self.plane_position))
-        self.plane.SetOrigin(self.plane_position, -30, 6713)
         self.print_log("-Plane position changed from " + str(oldval) + " to " + str(self.plane_position))
-        self.ui.vtkWidget.GetRenderWindow().Render()
+        self.record("plane", x=self.plane_position)
+        if cut is not None:
+            mapper.SetInputData(cut)
+            self.print_log("  * precomputed slice")
+        else:
+            mapper.SetInputConnection(self.slicer.GetOutputPort())
+            self.print_log("  * visited %d of %d cells in %.1f ms" % (self.slicer.visited, self.slicer.GetNumberOfCells(),
+                                                                  self.slicer.elapsed * 1000))
+            self.print_chunk_stats()
+        self.scheduler.request()
 
     def saveData_callback(self):
-        curr = str(datetime.now())
-        filename = "train_line " + curr
-        if self.dataCache is None:
+        lines = [line for line in self.lines if line.samples is not None]
+        if not lines:
             self.print_log("-Error: no data to save"); return
-        with open(filename, 'w') as fd:
-            fd.write(str(self.dataCache))
-        self.print_log("-Data written to file " + filename)
+        # every saved line of the session is appended to the same file
+        if self.writer is None:
+            filename = "train_lines_" + datetime.now().strftime("%Y%m%d-%H%M%S") + ".bin"
+            self.writer = LineWriter(filename)
+        for line in lines:
+            (p0, p1, step, interpolate) = line.sampled
+            self.writer.write(line.samples, name=line.name, p0=list(p0), p1=list(p1), interpolate=interpolate)
+        self.writer.flush()
+        self.print_log("-Data of %d lines appended to file %s (%d lines)"
+                       % (len(lines), self.writer.filename, self.writer.count))
 
     def saveCamPos_callback(self):
         camera = self.ren.GetActiveCamera()
@@ -583,13 +885,83 @@ class Demo(QMainWindow):
 
 
     def resetLine_callback(self):
-        self.p0 = datarange[0]
-        self.p1 = datarange[1]
-        self.linesrc.SetPoint1(self.p0[0], self.p0[1], self.p0[2])
-        self.linesrc.SetPoint2(self.p1[0], self.p1[1], self.p1[2])
-        self.linesrc.Update()
-        self.print_log("-Sampling line is reset")
-        self.ui.vtkWidget.GetRenderWindow().Render()
+        line = self.lines.set(self.line, datarange[0], datarange[1], self.resolution)
+        self.record_line(line)
+        self.show_line(line)
+        self.print_log("-Sampling line " + self.line + " is reset")
+        self.scheduler.request()
+
+    def removeLine_callback(self):
+        if self.line not in self.lines:
+            self.print_log("-Error: no line named " + self.line); return
+        if len(self.lines) == 1:
+            self.print_log("-Error: cannot remove the last line"); return
+        self.lines.remove(self.line)
+        self.record("remove_line", name=self.line)
+        self.print_log("-Line " + self.line + " removed")
+        self.show_line(next(iter(self.lines)))
+        self.plot_lines()
+        self.scheduler.request()
+
+    def statistics_callback(self):
+        if self.statsThread is not None and self.statsThread.isRunning():
+            self.print_log("-Still computing the previous statistics"); return
+        region = self.ui.stats_region.currentText()
+        if region == "grid":
+            key = ("grid",)
+            label = "the grid"
+            filename = self.filename if self.statistics.filename is not None else None
+            grid = self.reader.GetOutput() if self.reader is not None else None
+            if filename is not None and self.workers > 1 and read_header(filename) is not None:
+                def compute():
+                    return regionstats.summarize_parallel(filename, self.workers, grid)
+            else:
+                # the raw cache is mapped when there is one, e.g. in chunked mode
+                try:
+                    arrays = regionstats.grid_arrays(filename, grid)
+                except ValueError as e:
+                    self.print_log("-Error: " + str(e)); return
+
+                def compute():
+                    return regionstats.summarize(arrays)
+        elif region == "line":
+            line = self.lines[self.line] if self.line in self.lines else None
+            if line is None or line.samples is None:
+                self.print_log("-Error: plot line " + self.line + " first"); return
+            key = ("line", line.name, line.sampled)
+            label = "line " + line.name
+            arrays = {"pressure": line.samples[1], "velocity": line.samples[2]}
+
+            def compute():
+                return regionstats.summarize(arrays)
+        else:
+            cut = self.planeActor.GetMapper().GetInput()
+            key = ("plane", self.plane_position)
+            label = "the plane at x = " + str(self.plane_position)
+            if cut is None or cut.GetNumberOfPoints() == 0:
+                self.print_log("-Error: the plane at x = " + str(self.plane_position) + " cuts no cells"); return
+            data = TrainData(cut)
+            arrays = {"pressure": data.pressure, "velocity": data.velocity}
+
+            def compute():
+                return regionstats.summarize(arrays)
+
+        self.statsStart = time.perf_counter()
+        report = self.statistics.get(key)
+        if report is not None:
+            self.statistics_computed_callback(key, label, report, True)
+            return
+        self.statsThread = StatisticsThread(compute)
+        self.statsThread.computed.connect(lambda report: self.statistics_computed_callback(key, label, report))
+        self.statsThread.start()
+
+    def statistics_computed_callback(self, key, label, report, cached=False):
+        if not cached:
+            self.statistics.put(key, report)
+        self.print_log("-Statistics of %s in %.1f ms%s:" % (label, (time.perf_counter() - self.statsStart) * 1000,
+                                                           " (cached)" if cached else ""))
+        for line in regionstats.format_report(report):
+            self.print_log(line)
 
     def resetCamPos_callback(self):
         camera = self.ren.GetActiveCamera()
@@ -597,6 +969,8 @@ class Demo(QMainWindow):
         camera.SetFocalPoint(self.camPos[1])
         camera.SetViewUp(self.camPos[2])
         camera.SetClippingRange(self.camPos[3])
+        if self.recorder is not None:
+            self.recorder.record_camera(camera)
         self.print_log("-Camera position is reset")
 
 
@@ -605,7 +979,47 @@ if __name__ == "__main__":
     # --define argument parser and parse arguments--
     parser = argparse.ArgumentParser()
     parser.add_argument('train_file')
+    parser.add_argument('--arrays', nargs='+', default=[DATA_PRESSURE, DATA_VELOCITY])
+    parser.add_argument('--float32', action='store_true')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--separate-streamlines', action='store_true')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--no-stream-cache', action='store_true')
+    parser.add_argument('--smooth-kernel', choices=sorted(smoothing.kernels), default='box')
+    parser.add_argument('--smooth-width', type=int, default=3)
+    parser.add_argument('--slice-stack', action='store_true')
+    parser.add_argument('--slice-cache-mb', type=int, default=512)
+    parser.add_argument('--slice-spill')
+    parser.add_argument('--frame-stats', action='store_true')
+    parser.add_argument('--lod', type=int, nargs='*')
+    parser.add_argument('--derived', nargs='*', choices=sorted(derived.fields), default=[DATA_VELOCITY_MAGNITUDE])
+    parser.add_argument('--chunked', action='store_true')
+    parser.add_argument('--memory-mb', type=int, default=1024)
+    parser.add_argument('--chunk-cells', type=int, default=chunks.default_cells)
+    parser.add_argument('--seeding', choices=['grid', 'adaptive'], default='grid')
+    parser.add_argument('--seed-budget', type=int, default=seeding.default_budget)
+    parser.add_argument('--seed-field', choices=seeding.importance_fields, default=DATA_VELOCITY_MAGNITUDE)
+    parser.add_argument('--record')
     args = parser.parse_args()
+    try:
+        smoothing.check(args.smooth_kernel, args.smooth_width)
+    except ValueError as e:
+        parser.error("--smooth-width: " + str(e))
+    for name in (DATA_PRESSURE, DATA_VELOCITY):
+        if name not in args.arrays:
+            parser.error("the viewer needs the '" + name + "' array")
+    if args.seeding == 'adaptive':
+        if args.chunked or args.separate_streamlines:
+            parser.error("--seeding adaptive does not go with --chunked or --separate-streamlines")
+        # the importance field is attached like any derived field
+        if args.seed_field not in args.derived:
+            args.derived.append(args.seed_field)
+    if "vorticity" in args.derived and args.no_cache and "Jacobian" not in args.arrays:
+        parser.error("vorticity needs the 'Jacobian' array, add it to --arrays or use the cache")
+    if args.chunked and (args.no_cache or args.slice_stack or args.separate_streamlines):
+        parser.error("--chunked does not go with --no-cache, --slice-stack or --separate-streamlines")
+    if args.lod == []:
+        args.lod = surface.default_levels
 
     # --main app--
     app = QApplication(sys.argv)
@@ -620,6 +1034,7 @@ if __name__ == "__main__":
     window.ui.show_streamlines.toggled.connect(window.show_streamlines_callback)
     window.ui.plane_mode.toggled.connect(window.plane_mode_callback)
     window.ui.smooth.toggled.connect(window.smooth_callback)
+    window.ui.interpolate.toggled.connect(window.interpolate_callback)
 
     window.ui.push_plot.clicked.connect(window.plot_callback)
     window.ui.push_drawLine.clicked.connect(window.drawLine_callback)
@@ -627,6 +1042,9 @@ if __name__ == "__main__":
     window.ui.push_saveCamPos.clicked.connect(window.saveCamPos_callback)
     window.ui.push_resetCamPos.clicked.connect(window.resetCamPos_callback)
     window.ui.push_resetLine.clicked.connect(window.resetLine_callback)
+    window.ui.push_removeLine.clicked.connect(window.removeLine_callback)
+    window.ui.push_statistics.clicked.connect(window.statistics_callback)
+    window.ui.line_name.editingFinished.connect(window.line_name_callback)
 
     window.ui.resolution.valueChanged.connect(window.resolution_callback)
     window.ui.plane_position.valueChanged.connect(window.plane_callback)
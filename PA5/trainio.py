@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+
+# CS 530
+# Final Project
+
+""" Description:
+Loading of the train dataset.
+
+Parsing the .vtu with vtkXMLUnstructuredGridReader takes seconds for the
+1M point grid, so the first launch converts it into a directory of raw
+NumPy arrays next to the dataset (<data>.cache/). Later launches memory-map
+only the arrays the session needs and wrap them as VTK arrays without
+copying.
+
+Point arrays can be selected by name, so unused arrays such as the 9
+component Jacobian are never materialized, and double arrays can be
+downcast to float32 to halve their footprint.
+
+Command line interface: python trainio.py <data> [--force]
+    <data>:     the train dataset (.vtu) to convert
+    --force:    rebuild the cache even if it is up to date (optional)
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import struct
+import binascii
+import argparse
+import resource
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from cs530.files import save_array, save_json
+
+CACHE_VERSION = 2
+
+# point arrays used by the viewer
+session_arrays = ['pressure', 'velocity']
+
+
+class GridSource(vtk.vtkTrivialProducer):
+    """
+    Pipeline source of an in-memory grid that, like a reader, has GetOutput()
+    """
+
+    def GetOutput(self):
+        return self.GetOutputDataObject(0)
+
+
+def cache_dir(filename):
+    return filename + ".cache"
+
+
+def pieces_dir(filename):
+    return filename + ".pieces"
+
+
+def source_stamp(filename):
+    st = os.stat(filename)
+    return {"size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+def read_header(filename):
+    """
+    Header of the cache of a dataset, or None if there is no cache or it is
+    out of date with respect to the dataset
+    """
+    path = os.path.join(cache_dir(filename), "header.json")
+    try:
+        with open(path) as fd:
+            header = json.load(fd)
+    except (OSError, ValueError):
+        return None
+    if header.get("version") != CACHE_VERSION or header.get("source") != source_stamp(filename):
+        return None
+    return header
+
+
+def parse(filename, arrays=None):
+    """
+    Parse a .vtu file with the XML reader
+    :param arrays: names of the point arrays to read, all of them if None
+    """
+    reader = vtk.vtkXMLUnstructuredGridReader()
+    reader.SetFileName(filename)
+    if arrays is not None:
+        reader.UpdateInformation()
+        for i in range(reader.GetNumberOfPointArrays()):
+            name = reader.GetPointArrayName(i)
+            reader.SetPointArrayStatus(name, 1 if name in arrays else 0)
+    reader.Update()
+    return reader.GetOutput()
+
+
+def save_grid(path, grid):
+    """
+    Write the points, cells and all point arrays of a parsed grid as .npy
+    files to a directory
+    :return: entries of the point arrays for the header
+    """
+    os.makedirs(path, exist_ok=True)
+
+    def save(name, arr, dtype=None):
+        data = numpy_support.vtk_to_numpy(arr)
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        save_array(os.path.join(path, name + ".npy"), data)
+
+    cells = grid.GetCells()
+    save("points", grid.GetPoints().GetData())
+    save("offsets", cells.GetOffsetsArray(), np.int64)
+    save("connectivity", cells.GetConnectivityArray(), np.int64)
+    save("types", grid.GetCellTypesArray())
+
+    arrays = list()
+    pd = grid.GetPointData()
+    for i in range(pd.GetNumberOfArrays()):
+        arr = pd.GetArray(i)
+        save("array%d" % i, arr)
+        arrays.append({"name": arr.GetName(),
+                       "file": "array%d.npy" % i,
+                       "components": arr.GetNumberOfComponents(),
+                       "attribute": pd.IsArrayAnAttribute(i)})
+    return arrays
+
+
+def drop_f32(path):
+    # single precision copies of the previous conversion are out of date
+    for name in os.listdir(path):
+        if name.endswith(".f32.npy"):
+            os.remove(os.path.join(path, name))
+
+
+def write_header(filename, points, cells, arrays):
+    # the header is written last so an interrupted conversion is never used
+    header = {"version": CACHE_VERSION,
+              "source": source_stamp(filename),
+              "points": points,
+              "cells": cells,
+              "arrays": arrays}
+    save_json(os.path.join(cache_dir(filename), "header.json"), header)
+    return header
+
+
+def convert(filename, grid):
+    """
+    Write the points, cells and all point arrays of a parsed grid to the
+    raw cache of the dataset
+    """
+    path = cache_dir(filename)
+    os.makedirs(path, exist_ok=True)
+    drop_f32(path)
+    arrays = save_grid(path, grid)
+    return write_header(filename, grid.GetNumberOfPoints(), grid.GetNumberOfCells(), arrays)
+
+
+# bytes per value of the XML data array types
+xml_types = {"Int8": 1, "UInt8": 1, "Int16": 2, "UInt16": 2, "Int32": 4, "UInt32": 4,
+             "Int64": 8, "UInt64": 8, "Float32": 4, "Float64": 8}
+
+
+def array_bytes(fd, position, header, base64):
+    """
+    Size of the values of a binary data array of a .vtu file, read from the
+    header in front of its data: the byte count, or the block sizes of
+    compressed data
+    :param position: file offset of the data
+    :param header: (struct format of a header word, compressed)
+    :param base64: the data is base64 encoded
+    """
+    (word, compressed) = header
+    size = struct.calcsize(word) * (3 if compressed else 1)
+    fd.seek(position)
+    if base64:
+        # inline data follows its tag after some white space
+        skip = fd.read(256)
+        fd.seek(position + len(skip) - len(skip.lstrip()))
+        raw = binascii.a2b_base64(fd.read(4 * ((size + 2) // 3)))
+    else:
+        raw = fd.read(size)
+    values = struct.unpack(word[0] + word[1] * (size // struct.calcsize(word)), raw[:size])
+    if not compressed:
+        return values[0]
+    (blocks, block, last) = values
+    return blocks * block if last == 0 else (blocks - 1) * block + last
+
+
+def piece_bytes(filename, block=1 << 24):
+    """
+    Estimated memory of every piece of a .vtu file once parsed, from the
+    sizes and types in its XML tags and the size of the connectivity in
+    front of its data; the data itself is not read. The connectivity of
+    ASCII files is counted with 8 points per cell.
+    """
+    tag = re.compile(rb'<(VTKFile|Piece|PointData|CellData|Points|Cells|DataArray|AppendedData)\b([^>]*)>')
+
+    def attr(attrs, name, default=None):
+        m = re.search(name.encode() + rb'="([^"]*)"', attrs)
+        return m.group(1).decode() if m is not None else default
+
+    pieces = list()
+    # connectivity arrays: (piece, offset in the file or in the appended data, appended, base64, size of a value)
+    connectivity = list()
+    (points, cells, section, header, appended) = (0, 0, None, ("<I", False), None)
+    buf = b""
+    start = 0
+    with open(filename, 'rb') as fd:
+        while appended is None:
+            data = fd.read(block)
+            buf += data
+            done = not data
+            # a tag cut by the end of the block is completed by the next one
+            last = buf.rfind(b"<")
+            if done or last < len(buf) - 4096:
+                last = len(buf)
+            for m in tag.finditer(buf, 0, last):
+                (kind, attrs) = (m.group(1).decode(), m.group(2))
+                if kind == "VTKFile":
+                    order = ">" if attr(attrs, "byte_order") == "BigEndian" else "<"
+                    word = "Q" if attr(attrs, "header_type") == "UInt64" else "I"
+                    header = (order + word, attr(attrs, "compressor") is not None)
+                elif kind == "AppendedData":
+                    appended = (start + m.end(), attr(attrs, "encoding") == "base64")
+                    break
+                elif kind == "Piece":
+                    points = int(attr(attrs, "NumberOfPoints", 0))
+                    cells = int(attr(attrs, "NumberOfCells", 0))
+                    pieces.append(0)
+                elif kind != "DataArray":
+                    section = kind
+                elif pieces:
+                    size = xml_types.get(attr(attrs, "type"), 8) * int(attr(attrs, "NumberOfComponents", 1))
+                    if section in ("PointData", "Points"):
+                        pieces[-1] += points * size
+                    elif attr(attrs, "Name") != "connectivity":
+                        pieces[-1] += cells * size
+                    elif attr(attrs, "format") == "appended":
+                        connectivity.append((len(pieces) - 1, int(attr(attrs, "offset")), True, size))
+                    elif attr(attrs, "format") == "binary":
+                        connectivity.append((len(pieces) - 1, start + m.end(), False, size))
+                    else:
+                        pieces[-1] += cells * 8 * size
+            if done:
+                break
+            start += last
+            buf = buf[last:]
+
+        if appended is not None:
+            # the appended data starts after the "_" following the tag
+            fd.seek(appended[0])
+            appended = (appended[0] + fd.read(4096).index(b"_") + 1, appended[1])
+        for (p, position, inAppended, size) in connectivity:
+            if inAppended:
+                nbytes = array_bytes(fd, appended[0] + position, header, appended[1])
+            else:
+                nbytes = array_bytes(fd, position, header, True)
+            # the reader keeps the connectivity as 64 bit ids
+            pieces[p] += nbytes // size * 8
+    return pieces
+
+
+def convert_pieces(filename, max_bytes):
+    """
+    Write the arrays of a dataset one piece of the .vtu at a time, so the
+    whole grid is never parsed at once. Points on the seams between pieces
+    are stored once per piece, so the arrays go to their own directory,
+    pieces_dir(), and never replace the raw cache.
+    :param max_bytes: memory a parsed piece may take
+    :return: a header like the one of the raw cache
+    """
+    largest = max(piece_bytes(filename) or [0])
+    if largest > max_bytes:
+        raise MemoryError("a piece of %s takes about %.0f MB once parsed, more than %.0f MB: write it in more "
+                          "pieces (vtkXMLUnstructuredGridWriter.SetNumberOfPieces)"
+                          % (filename, largest / float(1 << 20), max_bytes / float(1 << 20)))
+    path = pieces_dir(filename)
+    staging = os.path.join(path, "pieces")
+    os.makedirs(path, exist_ok=True)
+
+    reader = vtk.vtkXMLUnstructuredGridReader()
+    reader.SetFileName(filename)
+    reader.UpdateInformation()
+    count = max(1, reader.GetNumberOfPieces())
+    for p in range(count):
+        reader.UpdatePiece(p, count, 0)
+        arrays = save_grid(os.path.join(staging, "piece%d" % p), reader.GetOutput())
+    del reader
+
+    def staged(name):
+        return [np.load(os.path.join(staging, "piece%d" % p, name), mmap_mode='r') for p in range(count)]
+
+    def concat(name, parts, shifts=None):
+        tmp = "%s.%d.tmp" % (os.path.join(path, name), os.getpid())
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype=parts[0].dtype,
+                                        shape=(sum(len(a) for a in parts),) + parts[0].shape[1:])
+        pos = 0
+        for (i, a) in enumerate(parts):
+            out[pos:pos + len(a)] = a if shifts is None else a + shifts[i]
+            pos += len(a)
+        out.flush()
+        del out
+        os.replace(tmp, os.path.join(path, name))
+
+    # ids of the later pieces are shifted past the points and connectivity of the earlier ones
+    points = staged("points.npy")
+    connectivity = staged("connectivity.npy")
+    offsets = staged("offsets.npy")
+    concat("points.npy", points)
+    concat("connectivity.npy", connectivity, np.cumsum([0] + [len(a) for a in points[:-1]]))
+    concat("offsets.npy", [offsets[0]] + [o[1:] for o in offsets[1:]],
+           np.cumsum([0] + [len(c) for c in connectivity[:-1]]))
+    concat("types.npy", staged("types.npy"))
+    for entry in arrays:
+        concat(entry["file"], staged(entry["file"]))
+    header = {"version": CACHE_VERSION,
+              "source": source_stamp(filename),
+              "points": sum(len(a) for a in points),
+              "cells": sum(len(o) - 1 for o in offsets),
+              "arrays": arrays}
+    del points, connectivity, offsets
+    shutil.rmtree(staging, ignore_errors=True)
+    return header
+
+
+def load(filename, header, arrays=None, float32=False):
+    """
+    Build an unstructured grid on top of memory-mapped cache arrays
+    :param arrays: names of the point arrays to map, all of them if None
+    :param float32: map single precision copies of double point arrays
+    """
+    path = cache_dir(filename)
+
+    def mmap(name):
+        # copy-on-write so VTK can never write through to the cache file
+        return np.load(os.path.join(path, name), mmap_mode='c')
+
+    def mmap_f32(name):
+        # single precision copies are written once next to the originals
+        f32 = name[:-len(".npy")] + ".f32.npy"
+        if not os.path.exists(os.path.join(path, f32)):
+            data = mmap(name)
+            if data.dtype != np.float64:
+                return data
+            save_array(os.path.join(path, f32), data.astype(np.float32))
+        return mmap(f32)
+
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(mmap("points.npy")))
+
+    cells = vtk.vtkCellArray()
+    cells.SetData(numpy_support.numpy_to_vtkIdTypeArray(mmap("offsets.npy")),
+                  numpy_support.numpy_to_vtkIdTypeArray(mmap("connectivity.npy")))
+    types = numpy_support.numpy_to_vtk(mmap("types.npy"), array_type=vtk.VTK_UNSIGNED_CHAR)
+
+    grid = vtk.vtkUnstructuredGrid()
+    grid.SetPoints(points)
+    grid.SetCells(types, cells)
+
+    entries = dict((a["name"], a) for a in header["arrays"])
+    for name in (arrays if arrays is not None else [a["name"] for a in header["arrays"]]):
+        if name not in entries:
+            raise ValueError("no point array named '" + name + "' in " + filename)
+        data = (mmap_f32 if float32 else mmap)(entries[name]["file"])
+        arr = numpy_support.numpy_to_vtk(data)
+        arr.SetName(name)
+        grid.GetPointData().AddArray(arr)
+        # restore active scalars/vectors/tensors, e.g. the vectors used by the stream tracer
+        if entries[name]["attribute"] >= 0:
+            grid.GetPointData().SetActiveAttribute(name, entries[name]["attribute"])
+
+    return grid
+
+
+def downcast(grid):
+    """
+    Replace the double point arrays of a grid by float32 copies
+    """
+    pd = grid.GetPointData()
+    for i in range(pd.GetNumberOfArrays()):
+        arr = pd.GetArray(i)
+        if arr.GetDataType() == vtk.VTK_DOUBLE:
+            f32 = vtk.vtkFloatArray()
+            f32.DeepCopy(arr)
+            pd.AddArray(f32)
+
+
+def read(filename, arrays=session_arrays, float32=False, cache=True):
+    """
+    Read the train dataset, going through the raw cache when possible
+    :param arrays: names of the point arrays to materialize, all if None
+    :param float32: downcast double point arrays to float32
+    :param cache: use and create the raw cache next to the dataset
+    :return: a pipeline source whose output is the unstructured grid
+    """
+    header = read_header(filename) if cache else None
+    if header is not None:
+        grid = load(filename, header, arrays, float32)
+    elif not cache:
+        grid = parse(filename, arrays)
+        if float32:
+            downcast(grid)
+    else:
+        grid = parse(filename)
+        try:
+            header = convert(filename, grid)
+        except OSError as e:
+            # dataset directory not writable, keep using the parsed grid
+            print("-Cannot write cache for " + filename + ": " + str(e))
+            pd = grid.GetPointData()
+            for name in [pd.GetArrayName(i) for i in range(pd.GetNumberOfArrays())]:
+                if arrays is not None and name not in arrays:
+                    pd.RemoveArray(name)
+            if float32:
+                downcast(grid)
+        else:
+            grid = load(filename, header, arrays, float32)
+
+    source = GridSource()
+    source.SetOutput(grid)
+    return source
+
+
+def memory_report(grid):
+    """
+    Size of the geometry and of every point array of a grid, and the peak
+    resident set size of the process
+    :return: list of report lines
+    """
+    def mb(nbytes):
+        return "%8.1f MB" % (nbytes / float(1 << 20))
+
+    lines = list()
+    total = 0
+    cells = grid.GetCells()
+    for (name, arr) in [("points", grid.GetPoints().GetData()),
+                        ("cell offsets", cells.GetOffsetsArray()),
+                        ("cell connectivity", cells.GetConnectivityArray()),
+                        ("cell types", grid.GetCellTypesArray())]:
+        nbytes = arr.GetNumberOfValues() * arr.GetDataTypeSize()
+        total += nbytes
+        lines.append("  * %-20s %s" % (name, mb(nbytes)))
+
+    pd = grid.GetPointData()
+    for i in range(pd.GetNumberOfArrays()):
+        arr = pd.GetArray(i)
+        nbytes = arr.GetNumberOfValues() * arr.GetDataTypeSize()
+        total += nbytes
+        lines.append("  * %-20s %s  (%d comp, %s)" % (arr.GetName(), mb(nbytes),
+                                                     arr.GetNumberOfComponents(),
+                                                     arr.GetDataTypeAsString()))
+    lines.append("  * %-20s %s" % ("total", mb(total)))
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    lines.append("  * %-20s %s" % ("peak RSS", mb(rss if sys.platform == "darwin" else rss * 1024)))
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args()
+
+    if args.force or read_header(args.train_file) is None:
+        convert(args.train_file, parse(args.train_file))
+        print("-Cache written to " + cache_dir(args.train_file))
+    else:
+        print("-Cache is up to date: " + cache_dir(args.train_file))
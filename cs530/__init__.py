@@ -0,0 +1,12 @@
+# CS 530
+
+""" Description:
+Code shared by the projects of the course.
+
+    files:          content hashes and atomic writes of cache files
+    streamcache:    on-disk cache of traced streamlines (Project 4 and the
+                    final project)
+
+Install it once from the root of the repository with pip install -e .
+so the project scripts can import it from any directory.
+"""
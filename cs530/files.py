@@ -0,0 +1,75 @@
+# CS 530
+
+""" Description:
+Helpers for the on-disk caches of the projects.
+
+Cache entries are named by the SHA-256 of the input file. Hashing a large
+dataset takes seconds, so hashes can be remembered in an index of the cache
+directory, by path, size and modification time.
+
+Cache files are written to a temporary file first and moved into place, so
+processes reading the cache at the same time see either the previous file
+or the complete new one.
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+
+def content_hash(filename, directory=None):
+    """
+    SHA-256 of the content of a file
+    :param directory: cache directory remembering the hashes in hashes.json,
+        the file is always read if None
+    """
+    if directory is not None:
+        st = os.stat(filename)
+        stamp = [st.st_size, st.st_mtime_ns]
+        path = os.path.abspath(filename)
+        index = os.path.join(directory, "hashes.json")
+        try:
+            with open(index) as fd:
+                hashes = json.load(fd)
+        except (OSError, ValueError):
+            hashes = dict()
+        entry = hashes.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+    h = hashlib.sha256()
+    with open(filename, 'rb') as fd:
+        for block in iter(lambda: fd.read(1 << 24), b''):
+            h.update(block)
+
+    if directory is not None:
+        hashes[path] = [stamp, h.hexdigest()]
+        try:
+            os.makedirs(directory, exist_ok=True)
+            save_json(index, hashes, indent=None)
+        except OSError:
+            # the hash is computed again next time
+            pass
+    return h.hexdigest()
+
+
+def save_array(path, data):
+    """
+    Write a .npy file atomically
+    """
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, 'wb') as fd:
+        np.save(fd, data)
+    os.replace(tmp, path)
+
+
+def save_json(path, value, indent=1):
+    """
+    Write a .json file atomically
+    """
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, 'w') as fd:
+        json.dump(value, fd, indent=indent)
+    os.replace(tmp, path)
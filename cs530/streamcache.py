@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+# CS 530
+
+""" Description:
+On-disk cache of traced streamlines.
+
+Traced polylines are stored as raw NumPy arrays (.npz), keyed by a content
+hash of the input dataset combined with the seed points and the tracer
+settings (integrator, steps, propagation, ...). On a hit the viewer loads
+the lines and skips integration. The cache directory is bounded in size,
+the least recently used entries are evicted first.
+
+The module is shared by the train viewer and the Project 4 flow tools.
+
+The cache lives in ~/.cache/cs530/streamlines unless STREAMLINE_CACHE is
+set, and is limited to STREAMLINE_CACHE_MB megabytes (1024 by default).
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from cs530 import files
+
+default_dir = os.environ.get("STREAMLINE_CACHE",
+                             os.path.join(os.path.expanduser("~"), ".cache", "cs530", "streamlines"))
+default_max_bytes = int(os.environ.get("STREAMLINE_CACHE_MB", 1024)) * (1 << 20)
+
+
+def to_arrays(lines):
+    """
+    Flatten the polylines of a polydata into plain NumPy arrays
+    """
+    def copy(arr):
+        return np.array(numpy_support.vtk_to_numpy(arr))
+
+    if lines.GetPoints() is None:
+        return {"points": np.zeros((0, 3)),
+                "offsets": np.zeros(1, dtype=np.int64),
+                "connectivity": np.zeros(0, dtype=np.int64),
+                "point_data": [], "cell_data": [],
+                "point_attributes": [], "cell_attributes": []}
+
+    cells = lines.GetLines()
+    pd = lines.GetPointData()
+    cd = lines.GetCellData()
+    return {"points": copy(lines.GetPoints().GetData()),
+            "offsets": copy(cells.GetOffsetsArray()),
+            "connectivity": copy(cells.GetConnectivityArray()),
+            "point_data": [(pd.GetArrayName(i), copy(pd.GetArray(i)))
+                           for i in range(pd.GetNumberOfArrays())],
+            "cell_data": [(cd.GetArrayName(i), copy(cd.GetArray(i)))
+                          for i in range(cd.GetNumberOfArrays())],
+            # active scalars/vectors/normals, e.g. the vectors used by vtkTubeFilter
+            "point_attributes": [pd.IsArrayAnAttribute(i) for i in range(pd.GetNumberOfArrays())],
+            "cell_attributes": [cd.IsArrayAnAttribute(i) for i in range(cd.GetNumberOfArrays())]}
+
+
+def from_arrays(parts):
+    """
+    Merge flattened polylines, in order, into a single polydata
+    """
+    parts = [p for p in parts if len(p["points"])]
+    if not parts:
+        return vtk.vtkPolyData()
+
+    connectivity = list()
+    offsets = [np.zeros(1, dtype=np.int64)]
+    nPoints = 0
+    nConn = 0
+    for p in parts:
+        connectivity.append(p["connectivity"].astype(np.int64) + nPoints)
+        offsets.append(p["offsets"][1:].astype(np.int64) + nConn)
+        nPoints += len(p["points"])
+        nConn += len(p["connectivity"])
+
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(np.concatenate([p["points"] for p in parts]), deep=1))
+    cells = vtk.vtkCellArray()
+    cells.SetData(numpy_support.numpy_to_vtkIdTypeArray(np.concatenate(offsets), deep=1),
+                  numpy_support.numpy_to_vtkIdTypeArray(np.concatenate(connectivity), deep=1))
+
+    lines = vtk.vtkPolyData()
+    lines.SetPoints(points)
+    lines.SetLines(cells)
+
+    for (key, fd) in [("point", lines.GetPointData()), ("cell", lines.GetCellData())]:
+        for (i, (name, _)) in enumerate(parts[0][key + "_data"]):
+            arr = numpy_support.numpy_to_vtk(np.concatenate([p[key + "_data"][i][1] for p in parts]), deep=1)
+            arr.SetName(name)
+            fd.AddArray(arr)
+            attribute = int(parts[0][key + "_attributes"][i])
+            if attribute >= 0:
+                fd.SetActiveAttribute(name, attribute)
+    return lines
+
+
+def settings(streamer):
+    """
+    The tracer settings that change the traced lines
+    """
+    return {"integrator": streamer.GetIntegrator().GetClassName(),
+            "direction": streamer.GetIntegrationDirection(),
+            "step_unit": streamer.GetIntegrationStepUnit(),
+            "initial_step": streamer.GetInitialIntegrationStep(),
+            "min_step": streamer.GetMinimumIntegrationStep(),
+            "max_step": streamer.GetMaximumIntegrationStep(),
+            "max_steps": streamer.GetMaximumNumberOfSteps(),
+            "max_error": streamer.GetMaximumError(),
+            "max_propagation": streamer.GetMaximumPropagation(),
+            "terminal_speed": streamer.GetTerminalSpeed(),
+            "vorticity": streamer.GetComputeVorticity()}
+
+
+class StreamlineCache(object):
+
+    def __init__(self, directory=default_dir, max_bytes=default_max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, filename, seeds, config, extra=None):
+        """
+        Cache key of a set of streamlines
+        :param filename: dataset the lines are traced in
+        :param seeds: list of seed positions
+        :param config: tracer settings, see settings()
+        :param extra: anything else the lines depend on (optional)
+        """
+        h = hashlib.sha256()
+        h.update(files.content_hash(filename, self.directory).encode())
+        h.update(np.asarray(seeds, dtype=np.float64).tobytes())
+        h.update(json.dumps([config, extra], sort_keys=True).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def load(self, key):
+        """
+        Cached polylines for a key, or None on a miss
+        """
+        try:
+            with np.load(self.path(key)) as f:
+                part = {"points": f["points"],
+                        "offsets": f["offsets"],
+                        "connectivity": f["connectivity"],
+                        "point_data": [(str(n), f["pd%d" % i]) for (i, n) in enumerate(f["pd_names"])],
+                        "cell_data": [(str(n), f["cd%d" % i]) for (i, n) in enumerate(f["cd_names"])],
+                        "point_attributes": list(f["pd_attributes"]),
+                        "cell_attributes": list(f["cd_attributes"])}
+        except (OSError, KeyError, ValueError):
+            return None
+        # mark the entry as recently used
+        os.utime(self.path(key))
+        return from_arrays([part])
+
+    def store(self, key, lines):
+        part = to_arrays(lines)
+        arrays = {"points": part["points"],
+                  "offsets": part["offsets"],
+                  "connectivity": part["connectivity"],
+                  "pd_names": np.array([n for (n, _) in part["point_data"]], dtype=str),
+                  "cd_names": np.array([n for (n, _) in part["cell_data"]], dtype=str),
+                  "pd_attributes": np.array(part["point_attributes"], dtype=np.int32),
+                  "cd_attributes": np.array(part["cell_attributes"], dtype=np.int32)}
+        for (i, (_, values)) in enumerate(part["point_data"]):
+            arrays["pd%d" % i] = values
+        for (i, (_, values)) in enumerate(part["cell_data"]):
+            arrays["cd%d" % i] = values
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self.path(key) + ".tmp"
+        with open(tmp, 'wb') as fd:
+            np.savez(fd, **arrays)
+        os.replace(tmp, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits its budget
+        """
+        entries = list()
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, name) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+
+_cache = None
+
+
+def trace(streamer, filename, seeds, extra=None):
+    """
+    Output of a configured stream tracer, loaded from the cache when the
+    same dataset, seeds and settings were traced before
+    :param streamer: the vtkStreamTracer, with its input and seeds set
+    :param filename: dataset file feeding the tracer
+    :param seeds: list of seed positions of the tracer
+    :return: polydata holding the streamlines
+    """
+    return cached(lambda: update(streamer), filename, seeds, settings(streamer), extra)
+
+
+def update(streamer):
+    streamer.Update()
+    return streamer.GetOutput()
+
+
+def cached(compute, filename, seeds, config, extra=None):
+    """
+    Look the lines up in the cache, calling compute() and storing its
+    result on a miss
+    """
+    global _cache
+    if _cache is None:
+        _cache = StreamlineCache()
+    try:
+        key = _cache.key(filename, seeds, config, extra)
+    except OSError:
+        return compute()
+    lines = _cache.load(key)
+    if lines is None:
+        lines = compute()
+        try:
+            _cache.store(key, lines)
+        except OSError as e:
+            print("-Cannot write streamline cache: " + str(e))
+    return lines
@@ -0,0 +1,7 @@
+from setuptools import setup
+
+setup(name="cs530",
+      version="1.0",
+      description="Code shared by the CS 530 projects",
+      packages=["cs530"],
+      install_requires=["numpy", "vtk"])